@@ -0,0 +1,157 @@
+"""
+Persistent Ray actors for chunk work
+
+Stateless Ray tasks start from a bare worker process, so each one repeats
+its setup: the lexicon, compiled regexes and expression caches are rebuilt
+for every chunk of every job. Instead, each job type gets a pool of
+RAY_ACTOR_POOL_SIZE long-lived ChunkWorker actors. Each actor does that
+setup once (warm_up) and then runs chunk after chunk.
+
+Each chunk goes to an idle actor (least-loaded dispatch; an actor runs one
+chunk at a time). Before a job uses the pool, it is health-checked: actors
+that are dead or don't answer a ping within RAY_ACTOR_PING_TIMEOUT are
+replaced. If an actor dies mid-job, it is replaced at once and the chunk it
+was running is run again. Dispatch is done here rather than with
+ray.util.ActorPool, whose handling of dead actors differs between Ray
+versions (older ones keep handing chunks to them).
+"""
+import time
+from collections import Counter, deque
+from . import logger
+from .config import RAY_ACTOR_POOL_SIZE, RAY_ACTOR_PING_TIMEOUT
+
+MAX_CHUNK_ATTEMPTS = 3  # runs of a chunk before a job gives up on dying actors
+
+def warm_up(task_type):
+    """Per-process setup that chunk tasks of task_type would otherwise repeat"""
+    if task_type == "text_processing":
+        from .sentiment import load_lexicon
+        from .tokenizer import tokenize
+        load_lexicon()
+        tokenize("Warm up, don't skip.")
+    elif task_type == "data_processing":
+        from .operations import compile_expression
+        compile_expression("value > 0")
+
+class ChunkWorker:
+    """Ray actor running chunk functions after a one-time warm-up"""
+
+    def __init__(self, task_type):
+        self.task_type = task_type
+        warm_up(task_type)
+
+    def ping(self):
+        return True
+
+    def run(self, index, fn, *args):
+        """
+        Returns:
+            (index, seconds, fn(*args)), timed like ray_cluster.timed_chunk
+        """
+        start = time.perf_counter()
+        result = fn(*args)
+        return index, time.perf_counter() - start, result
+
+class ChunkActorPool:
+    """
+    A fixed-size pool of ChunkWorker actors for one job type
+
+    Requires Ray to be initialized.
+    """
+
+    def __init__(self, task_type, size=RAY_ACTOR_POOL_SIZE):
+        import ray
+        self.task_type = task_type
+        self.size = max(1, size)
+        # Actors reserve no CPUs, so the pools of both job types fit on the
+        # cluster at once; the pool size is what bounds concurrency
+        self._actor_class = ray.remote(num_cpus=0)(ChunkWorker)
+        self.actors = [self._start_actor() for _ in range(self.size)]
+        self.restarts = 0
+
+    def _start_actor(self):
+        return self._actor_class.remote(self.task_type)
+
+    def _replace(self, index):
+        """Kill (if still running) and replace the actor in slot index"""
+        import ray
+        try:
+            ray.kill(self.actors[index], no_restart=True)
+        except Exception:
+            pass
+        self.actors[index] = self._start_actor()
+        self.restarts += 1
+
+    def check_health(self, timeout=RAY_ACTOR_PING_TIMEOUT):
+        """
+        Ping every actor, replacing the ones that are dead or don't answer
+        within timeout seconds (a ping also waits for the warm-up to finish)
+
+        Returns:
+            Number of actors replaced
+        """
+        import ray
+        pings = {actor.ping.remote(): index for index, actor in enumerate(self.actors)}
+        ready, _ = ray.wait(list(pings), num_returns=len(pings), timeout=timeout)
+        healthy = set()
+        for ref in ready:
+            try:
+                ray.get(ref)
+                healthy.add(pings[ref])
+            except ray.exceptions.RayActorError:
+                pass
+        replaced = 0
+        for index in range(len(self.actors)):
+            if index in healthy:
+                continue
+            logger.warning(f"Replacing unresponsive {self.task_type} actor {index}")
+            self._replace(index)
+            replaced += 1
+        return replaced
+
+    def run_chunks(self, call, chunks, merge, progress=None):
+        """
+        Run one chunk per idle actor at a time, merging results as they arrive
+
+        Args:
+            call: Function chunk -> (fn, *args) to run on an actor
+            chunks: Chunk descriptions
+            merge: Function (index, result) called once per chunk, in completion order
+            progress: Optional function (chunks_done, chunks_total)
+
+        Returns:
+            Total compute seconds across chunks
+        """
+        import ray
+        pending = deque(range(len(chunks)))
+        attempts = Counter()
+        idle = list(range(len(self.actors)))  # actor slots without a chunk
+        in_flight = {}  # result ref -> (actor slot, chunk index)
+        compute_seconds = 0.0
+        done = 0
+        while pending or in_flight:
+            while pending and idle:
+                slot, index = idle.pop(), pending.popleft()
+                attempts[index] += 1
+                in_flight[self.actors[slot].run.remote(index, *call(chunks[index]))] = (slot, index)
+            ready, _ = ray.wait(list(in_flight), num_returns=1)
+            for ref in ready:
+                slot, index = in_flight.pop(ref)
+                try:
+                    _, seconds, result = ray.get(ref)
+                except ray.exceptions.RayActorError as e:
+                    # the actor is gone: replace it, and rerun its chunk
+                    logger.warning(f"A {self.task_type} actor died running chunk {index}: {str(e)}")
+                    self._replace(slot)
+                    idle.append(slot)
+                    if attempts[index] >= MAX_CHUNK_ATTEMPTS:
+                        raise RuntimeError(f"Chunk {index} failed after {MAX_CHUNK_ATTEMPTS} attempts on dying actors")
+                    pending.appendleft(index)
+                    continue
+                idle.append(slot)
+                merge(index, result)
+                compute_seconds += seconds
+                done += 1
+                if progress:
+                    progress(done, len(chunks))
+        return compute_seconds
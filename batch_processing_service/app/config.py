@@ -15,10 +15,68 @@ REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 # RQ configuration
 RQ_QUEUE_NAME = os.getenv('RQ_QUEUE_NAME', 'batch_processing')
 
+# Priority queues and weighted fair scheduling (see app/scheduling.py)
+PRIORITY_WEIGHTS = os.getenv('PRIORITY_WEIGHTS', 'high:6,normal:3,low:1')  # relative share of jobs under load
+PRIORITY_SMALL_ITEMS = int(os.getenv('PRIORITY_SMALL_ITEMS', 10000))  # jobs up to this size default to high
+PRIORITY_LARGE_ITEMS = int(os.getenv('PRIORITY_LARGE_ITEMS', 1000000))  # jobs this size or bigger default to low
+QUEUE_WAIT_SLO = os.getenv('QUEUE_WAIT_SLO', 'high:5,normal:60,low:600')  # seconds from enqueue to start
+QUEUE_WAIT_SAMPLES = int(os.getenv('QUEUE_WAIT_SAMPLES', 1000))  # recent waits per queue kept for percentiles
+
+# Job completion notifications (Redis pub/sub, SSE, webhooks)
+JOB_EVENTS_CHANNEL = os.getenv('JOB_EVENTS_CHANNEL', f'rq:job-events:{RQ_QUEUE_NAME}')
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', 5))  # seconds; the worker waits for the webhook
+WEBHOOK_QUEUE_NAME = os.getenv('WEBHOOK_QUEUE_NAME', f'{RQ_QUEUE_NAME}:webhooks')  # webhooks are sent from here, at low priority
+# Comma-separated hosts (and their subdomains) webhooks may go to; empty allows
+# any host that resolves only to public addresses
+WEBHOOK_ALLOWED_HOSTS = [host.strip().lower() for host in os.getenv('WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()]
+SSE_HEARTBEAT = int(os.getenv('SSE_HEARTBEAT', 15))  # seconds between keep-alives on idle streams
+
+# Batch enqueue limits
+BATCH_ENQUEUE_MAX_JOBS = int(os.getenv('BATCH_ENQUEUE_MAX_JOBS', 50000))
+ENQUEUE_PIPELINE_CHUNK = int(os.getenv('ENQUEUE_PIPELINE_CHUNK', 1000))  # jobs per Redis pipeline
+
+# Result cache (see app/result_cache.py); a TTL of 0 disables it
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 3600))  # seconds
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 10000))  # least recently used are evicted
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 1024 * 1024))  # larger results aren't cached
+
+# Chunk memoization for options.incremental (see app/incremental.py)
+CHUNK_MEMO_TTL = int(os.getenv('CHUNK_MEMO_TTL', 3600))  # seconds
+CHUNK_MEMO_MAX_ENTRIES = int(os.getenv('CHUNK_MEMO_MAX_ENTRIES', 100000))  # least recently used are evicted
+CHUNK_MEMO_MAX_BYTES = int(os.getenv('CHUNK_MEMO_MAX_BYTES', 8 * 1024 * 1024))  # larger chunk results aren't memoized
+
+# GET /v2/jobs page size
+JOBS_PAGE_SIZE = int(os.getenv('JOBS_PAGE_SIZE', 100))
+JOBS_PAGE_SIZE_MAX = int(os.getenv('JOBS_PAGE_SIZE_MAX', 1000))
+JOB_STATUS_MAX_IDS = int(os.getenv('JOB_STATUS_MAX_IDS', 5000))  # POST /jobs/status
+
 # Ray configuration
 RAY_ADDRESS = os.getenv('RAY_ADDRESS', None)  # None means start a local Ray instance
 RAY_NUM_CPUS = int(os.getenv('RAY_NUM_CPUS', 2))
 
+# Persistent Ray actors (see app/actor_pool.py); a pool size of 0 uses stateless tasks
+RAY_ACTOR_POOL_SIZE = int(os.getenv('RAY_ACTOR_POOL_SIZE', RAY_NUM_CPUS))  # actors per job type
+RAY_ACTOR_PING_TIMEOUT = float(os.getenv('RAY_ACTOR_PING_TIMEOUT', 30))  # seconds before an unresponsive actor is replaced
+RAY_WARM_ACTORS = os.getenv('RAY_WARM_ACTORS', 'True').lower() == 'true'  # start the backend's workers (Ray actor pools, worker processes) with the worker
+
+# Execution backends (see app/executors.py)
+EXECUTOR_BACKEND = os.getenv('EXECUTOR_BACKEND', 'ray')  # ray, process or local; options.backend overrides
+EXECUTOR_PROCESSES = int(os.getenv('EXECUTOR_PROCESSES', os.cpu_count() or 1))  # workers of the process backend
+
+# Adaptive partitioning (see app/partitioning.py)
+RAY_MIN_ITEMS = int(os.getenv('RAY_MIN_ITEMS', 1000))  # smaller jobs always run in-process
+RAY_MIN_SECONDS = float(os.getenv('RAY_MIN_SECONDS', 1.0))  # estimated in-process time below which Ray isn't used
+RAY_TARGET_TASK_SECONDS = float(os.getenv('RAY_TARGET_TASK_SECONDS', 0.25))  # minimum work per Ray task
+RAY_CHUNKS_PER_CPU = int(os.getenv('RAY_CHUNKS_PER_CPU', 2))
+RAY_MAX_CHUNK_BYTES = int(os.getenv('RAY_MAX_CHUNK_BYTES', 64 * 1024 * 1024))
+RAY_MAX_IN_FLIGHT = int(os.getenv('RAY_MAX_IN_FLIGHT', RAY_NUM_CPUS * RAY_CHUNKS_PER_CPU))  # chunks submitted but not yet collected
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 0.5))  # seconds between job progress updates
+
+# Text statistics (see app/text_stats.py)
+TEXT_TOP_K = int(os.getenv('TEXT_TOP_K', 10))  # most frequent tokens reported by default
+TEXT_SKETCH_SIZE = int(os.getenv('TEXT_SKETCH_SIZE', 10000))  # tokens kept per chunk in approximate mode
+SENTIMENT_LEXICON_PATH = os.getenv('SENTIMENT_LEXICON_PATH', None)  # JSON lexicon; None uses the built-in one
+
 # Application settings
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 TIMEOUT = int(os.getenv('TIMEOUT', 3600))  # Default timeout for jobs in seconds
@@ -0,0 +1,317 @@
+"""
+Execution backends for chunked jobs
+
+run_distributed_task cuts a job into chunks and merges their results the
+same way whichever backend runs them. A backend is an Executor:
+
+    share(payload)    - make a NumPy array, or a {name: array or None} dict
+                        of them, readable by chunk functions; returns a
+                        handle that is passed to them in its place
+    run_chunks(call, chunks, merge, progress)
+                      - run fn(*args), where (fn, *args) = call(chunk), for
+                        every chunk, calling merge(index, result) as results
+                        arrive
+    reduce_chunks(call, chunks, merge, progress)
+                      - the same, combining results with an associative merge(a, b)
+    release(handle)   - free a shared payload
+    cpus()            - parallelism available, for partition planning
+
+Backends, chosen by options['backend'] or EXECUTOR_BACKEND:
+
+    ray      - Ray actors or tasks, payloads in the object store (registered
+               by app/ray_cluster.py)
+    process  - a ProcessPoolExecutor of EXECUTOR_PROCESSES workers; payloads
+               go to POSIX shared memory once and workers map them instead of
+               unpickling a copy per chunk
+    local    - this process, one chunk at a time
+
+A backend that isn't available (e.g. Ray failed to start) falls back to
+process, then local. More backends are added with register_executor.
+"""
+import time
+import atexit
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+import numpy as np
+from . import logger
+from .config import EXECUTOR_BACKEND, EXECUTOR_PROCESSES
+
+EXECUTORS = {}
+FALLBACK_BACKENDS = ["process", "local"]
+
+# String columns up to this many characters per value are packed into
+# fixed-width arrays for sharing; longer ones would waste too much padding
+# and are shipped per chunk instead
+MAX_SHARED_STRING_CHARS = 64
+
+def register_executor(name, factory):
+    """Make factory(task_type) -> Executor available as options['backend'] = name"""
+    EXECUTORS[name] = factory
+
+def backend_names():
+    return sorted(EXECUTORS)
+
+def _packed_strings(arr):
+    """Fixed-width unicode copy of an object column of short strings, else None"""
+    if not all(isinstance(v, str) for v in arr):
+        return None
+    packed = arr.astype(str) if len(arr) else np.array([], dtype='<U1')
+    return packed if packed.dtype.itemsize // 4 <= MAX_SHARED_STRING_CHARS else None
+
+def shareable_columns(columns):
+    """
+    Split columns into what can be shared whole and what can't
+
+    Numeric columns, and string columns packed to fixed width, can be shared
+    as flat buffers. Other object-dtype columns would be unpickled in full by
+    every chunk, so they are left out (None) and sliced per chunk instead.
+
+    Returns:
+        ({name: array or None}, {name: object-dtype array})
+    """
+    shared, local = {}, {}
+    for name, arr in columns.items():
+        if arr.dtype == object:
+            arr = _packed_strings(arr)
+            if arr is None:
+                local[name] = columns[name]
+        shared[name] = arr
+    return shared, local
+
+def _merge_pairs(merge):
+    """Adapt an associative merge(a, b) to run_chunks' merge(index, result)"""
+    state = [None]
+
+    def merge_result(index, result):
+        state[0] = result if state[0] is None else merge(state[0], result)
+    return state, merge_result
+
+class Executor:
+    """Base class: runs chunks in this process, one at a time"""
+
+    name = "local"
+    # True when the backend keeps workers (Ray actors, worker processes)
+    # between jobs; they only outlive a job run in the RQ worker's own process
+    persistent = False
+
+    def __init__(self, task_type):
+        self.task_type = task_type
+
+    def available(self):
+        return True
+
+    def warm(self):
+        """Start the backend's workers ahead of the first job"""
+        return self.available()
+
+    def cpus(self):
+        return 1
+
+    def share(self, payload):
+        return payload
+
+    def release(self, handle):
+        pass
+
+    def run_chunks(self, call, chunks, merge, progress=None):
+        """
+        Args:
+            call: Function chunk -> (fn, *args)
+            chunks: Chunk descriptions
+            merge: Function (index, result) called once per chunk, in completion order
+            progress: Optional function (chunks_done, chunks_total)
+
+        Returns:
+            Total compute seconds across chunks
+        """
+        compute_seconds = 0.0
+        for index, chunk in enumerate(chunks):
+            fn, *args = call(chunk)
+            start = time.perf_counter()
+            result = fn(*args)
+            compute_seconds += time.perf_counter() - start
+            merge(index, result)
+            if progress:
+                progress(index + 1, len(chunks))
+        return compute_seconds
+
+    def reduce_chunks(self, call, chunks, merge, progress=None):
+        """
+        Run chunks and combine their results with an associative merge(a, b)
+
+        Returns:
+            (combined result or None when there are no chunks, total compute seconds)
+        """
+        state, merge_result = _merge_pairs(merge)
+        compute_seconds = self.run_chunks(call, chunks, merge_result, progress)
+        return state[0], compute_seconds
+
+# -- process backend ---------------------------------------------------------
+
+# A payload in shared memory: the segment name and, per key (None for a
+# single array), (dtype, shape, byte offset), or None for a column that
+# isn't shared
+SharedPayload = namedtuple("SharedPayload", ["name", "layout"])
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_attached = {}  # in pool workers: segment name -> (SharedMemory, payload)
+MAX_ATTACHED_SEGMENTS = 4
+
+def _process_pool_executor():
+    """This process's worker pool, started on first use"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn rather than fork: the parent may be running Ray's threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=EXECUTOR_PROCESSES, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_process
+            )
+            atexit.register(shutdown_process_pool)
+            logger.info(f"Started {EXECUTOR_PROCESSES} worker processes")
+        return _process_pool
+
+def shutdown_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(cancel_futures=True)
+            _process_pool = None
+
+def _warm_process():
+    from .actor_pool import warm_up
+    warm_up("data_processing")
+    warm_up("text_processing")
+
+def _attach(handle):
+    """The payload of a SharedPayload, mapped (zero-copy) into this process"""
+    entry = _attached.get(handle.name)
+    if entry is None:
+        while len(_attached) >= MAX_ATTACHED_SEGMENTS:
+            # segments of earlier jobs; their results have long been sent back
+            name = next(iter(_attached))
+            segment, _ = _attached.pop(name)
+            try:
+                segment.close()
+            except BufferError:
+                pass  # still referenced; unmapped when the views go away
+        segment = shared_memory.SharedMemory(name=handle.name)
+        arrays = {}
+        for key, spec in handle.layout.items():
+            if spec is None:
+                arrays[key] = None
+            else:
+                dtype, shape, offset = spec
+                arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf, offset=offset)
+                arrays[key].flags.writeable = False
+        payload = arrays[None] if list(arrays) == [None] else arrays
+        entry = _attached[handle.name] = (segment, payload)
+    return entry[1]
+
+def _run_shared(fn, *args):
+    """Pool worker side of ProcessExecutor: resolve shared payloads, run and time fn"""
+    args = [_attach(arg) if isinstance(arg, SharedPayload) else arg for arg in args]
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+class ProcessExecutor(Executor):
+    """Runs chunks on a pool of worker processes, sharing payloads through shared memory"""
+
+    name = "process"
+    persistent = True
+
+    def __init__(self, task_type):
+        super().__init__(task_type)
+        self._segments = {}
+
+    def available(self):
+        try:
+            _process_pool_executor()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to start worker processes: {str(e)}")
+            return False
+
+    def cpus(self):
+        return EXECUTOR_PROCESSES
+
+    def share(self, payload):
+        arrays = {None: payload} if isinstance(payload, np.ndarray) else payload
+        layout, offset = {}, 0
+        for key, arr in arrays.items():
+            if arr is None:
+                layout[key] = None
+                continue
+            offset = -(-offset // 64) * 64  # keep every array aligned
+            layout[key] = (arr.dtype.str, arr.shape, offset)
+            offset += arr.nbytes
+        segment = shared_memory.SharedMemory(create=True, size=max(1, offset))
+        for key, arr in arrays.items():
+            if arr is not None:
+                dtype, shape, start = layout[key]
+                np.ndarray(shape, dtype=arr.dtype, buffer=segment.buf, offset=start)[...] = arr
+        self._segments[segment.name] = segment
+        return SharedPayload(segment.name, layout)
+
+    def release(self, handle):
+        segment = self._segments.pop(handle.name, None)
+        if segment is not None:
+            segment.close()
+            segment.unlink()
+
+    def run_chunks(self, call, chunks, merge, progress=None):
+        pool = _process_pool_executor()
+        max_in_flight = 2 * EXECUTOR_PROCESSES
+        pending = {}
+        next_chunk = done = 0
+        compute_seconds = 0.0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < max_in_flight:
+                pending[pool.submit(_run_shared, *call(chunks[next_chunk]))] = next_chunk
+                next_chunk += 1
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in finished:
+                seconds, result = future.result()
+                merge(pending.pop(future), result)
+                compute_seconds += seconds
+                done += 1
+            if progress:
+                progress(done, len(chunks))
+        return compute_seconds
+
+register_executor("local", Executor)
+register_executor("process", ProcessExecutor)
+
+def executor_class(name=None):
+    """
+    The factory registered for backend name (EXECUTOR_BACKEND when None)
+
+    Raises:
+        ValueError for an unknown backend
+    """
+    name = name or EXECUTOR_BACKEND
+    if name not in EXECUTORS:
+        raise ValueError(f"Unknown backend {name!r}; expected one of {backend_names()}")
+    return EXECUTORS[name]
+
+def get_executor(name, task_type):
+    """
+    The executor for backend name (EXECUTOR_BACKEND when None), or the first
+    available fallback
+
+    Raises:
+        ValueError for an unknown backend
+    """
+    name = name or EXECUTOR_BACKEND
+    executor_class(name)
+    for candidate in dict.fromkeys([name] + FALLBACK_BACKENDS):
+        executor = EXECUTORS[candidate](task_type)
+        if executor.available():
+            return executor
+        logger.warning(f"The {candidate} backend is unavailable; falling back")
+    return Executor(task_type)
@@ -0,0 +1,187 @@
+"""
+Incremental reprocessing: content-defined chunks with memoized results
+
+With options['incremental'], distributed jobs cut their input where the
+content says so rather than every N rows or bytes:
+
+    data  - before each row whose key (the `key` column of key -> value data,
+            else the first column) hashes to 0 modulo ~chunk_size
+    text  - at whitespace where a rolling hash of the preceding bytes is 0
+            modulo ~chunk_size
+
+so editing, inserting or removing a few rows or words only changes the chunks
+around them. Each chunk's result is memoized in Redis (pickled, with a TTL
+and least-recently-used eviction, like app/result_cache.py) under a digest of
+the chunk's content and the operation, and only chunks without a memoized
+result are sent to Ray.
+"""
+import json
+import pickle
+import hashlib
+import zlib
+import numpy as np
+from . import logger
+from .config import CHUNK_MEMO_TTL, CHUNK_MEMO_MAX_ENTRIES, CHUNK_MEMO_MAX_BYTES
+from .result_cache import lru_get_many, lru_put_many
+
+CHUNK_MEMO_PREFIX = 'batch:chunk:'
+CHUNK_MEMO_LRU_KEY = 'batch:chunk:lru'
+
+# chunks are between a quarter and four times the requested size
+MIN_CHUNK_FRACTION = 4
+MAX_CHUNK_FACTOR = 4
+ROLLING_WINDOW = 16  # bytes hashed to place a text boundary
+WORD_BYTES = 6  # typical bytes per whitespace in text; only whitespace can be a cut
+_TEXT_BLOCK = 16 * 1024 * 1024  # bytes hashed per NumPy pass
+
+_WHITESPACE = np.array([ord(c) for c in ' \n\t\r\x0b\x0c'], dtype=np.uint8)
+
+def _mask(target):
+    """Bit mask with about one hit per target values"""
+    return np.uint64((1 << max(0, int(target).bit_length() - 1)) - 1)
+
+def _mix(x):
+    """Spread the bits of uint64 values (splitmix64 finalizer)"""
+    with np.errstate(over='ignore'):
+        x = x ^ (x >> np.uint64(30))
+        x = x * np.uint64(0xBF58476D1CE4E5B9)
+        x = x ^ (x >> np.uint64(27))
+        x = x * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+def row_fingerprints(column, block_rows=65536):
+    """Stable uint64 hash of each value of a column (same in every process)"""
+    if column.dtype.kind in "biu":
+        return _mix(column.astype(np.int64).view(np.uint64))
+    if column.dtype.kind == "f":
+        return _mix(column.astype(np.float64).view(np.uint64))
+    if len(column) and all(isinstance(v, str) for v in column):
+        # hash the code points of fixed-width copies, a block of rows at a time
+        fingerprints = np.empty(len(column), dtype=np.uint64)
+        for start in range(0, len(column), block_rows):
+            codes = column[start:start + block_rows].astype(str)
+            width = codes.dtype.itemsize // 4
+            codes = codes.view(np.uint32).reshape(len(codes), width).astype(np.uint64)
+            weights = _mix(np.arange(1, width + 1, dtype=np.uint64))
+            with np.errstate(over='ignore'):
+                fingerprints[start:start + len(codes)] = _mix((codes * weights).sum(axis=1, dtype=np.uint64))
+        return fingerprints
+    return _mix(np.array([zlib.crc32(repr(v).encode('utf-8')) for v in column], dtype=np.uint64))
+
+def _greedy_bounds(candidates, size, target, fallback):
+    """
+    Chunk (start, stop) ranges ending at candidate cut points
+
+    Cuts closer than target / MIN_CHUNK_FRACTION to the previous one are
+    skipped; if there is none within target * MAX_CHUNK_FACTOR, fallback(start,
+    limit) picks one.
+    """
+    min_size = max(1, target // MIN_CHUNK_FRACTION)
+    max_size = max(min_size, target * MAX_CHUNK_FACTOR)
+    bounds = []
+    start = 0
+    while start < size:
+        limit = min(size, start + max_size)
+        i = np.searchsorted(candidates, start + min_size)
+        if i < len(candidates) and candidates[i] < limit:
+            end = int(candidates[i])
+        elif limit == size:
+            end = size
+        else:
+            end = fallback(start, limit)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+def row_bounds(columns, keyed, target):
+    """Content-defined (start, stop) row ranges of about target rows"""
+    column = columns["key"] if keyed else next(iter(columns.values()))
+    size = len(column)
+    candidates = np.flatnonzero((row_fingerprints(column) & _mask(target)) == 0)
+    return _greedy_bounds(candidates, size, max(1, int(target)), lambda start, limit: limit)
+
+def text_bounds(raw, target):
+    """
+    Content-defined (start, stop) byte ranges of UTF-8 text, cut at whitespace
+
+    Like ray_cluster.text_chunk_bounds, every cut is at a whitespace byte, so
+    no word or character is split (except for runs without whitespace longer
+    than target * MAX_CHUNK_FACTOR).
+    """
+    target = max(1, int(target))
+    data = np.frombuffer(raw, dtype=np.uint8)
+    mask = np.uint32(_mask(max(1, target // WORD_BYTES)))
+    candidates = []
+    for block_start in range(0, len(data), _TEXT_BLOCK):
+        lo = max(0, block_start - ROLLING_WINDOW)
+        block = data[lo:block_start + _TEXT_BLOCK].astype(np.uint32)
+        # polynomial hash of the ROLLING_WINDOW bytes ending at each position
+        rolling = np.zeros(len(block), dtype=np.uint32)
+        with np.errstate(over='ignore'):
+            for j in range(ROLLING_WINDOW):
+                rolling[j:] += block[:len(block) - j] * np.uint32(pow(31, j, 1 << 32))
+            rolling = (rolling * np.uint32(0x9E3779B1)) >> np.uint32(8)
+        # cut at whitespace following a window whose hash hits the mask
+        hits = np.flatnonzero(((rolling[:-1] & mask) == 0) & np.isin(block[1:], _WHITESPACE)) + 1 + lo
+        candidates.append(hits[hits >= max(block_start, 1)])
+    candidates = np.unique(np.concatenate(candidates)) if candidates else np.array([], dtype=np.int64)
+
+    def fallback(start, limit):
+        # no content-defined cut in range: last whitespace, else a character boundary
+        cut = max(raw.rfind(bytes([byte]), start + 1, limit + 1) for byte in _WHITESPACE.tolist())
+        if cut <= start:
+            cut = limit
+            while start + 1 < cut < len(raw) and raw[cut] & 0xC0 == 0x80:
+                cut -= 1
+        return cut
+    return _greedy_bounds(candidates, len(raw), target, fallback)
+
+def chunk_digest(context, *parts):
+    """
+    Digest of a chunk's content
+
+    Args:
+        context: JSON-serializable description of the operation
+        parts: NumPy arrays, bytes or str making up the chunk
+    """
+    digest = hashlib.blake2b(json.dumps(context, sort_keys=True, default=str).encode('utf-8'), digest_size=20)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(part.dtype.str.encode('ascii'))
+            if part.dtype == object:
+                digest.update(json.dumps(part.tolist(), default=repr).encode('utf-8'))
+            else:
+                digest.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, str):
+            digest.update(part.encode('utf-8'))
+        else:
+            digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def load_chunk_results(connection, digests):
+    """
+    Memoized chunk results
+
+    Returns:
+        {digest: result} for the digests found
+    """
+    try:
+        values = lru_get_many(connection, CHUNK_MEMO_PREFIX, CHUNK_MEMO_LRU_KEY, digests)
+    except Exception as e:
+        logger.warning(f"Could not read memoized chunk results: {str(e)}")
+        return {}
+    return {digest: pickle.loads(value) for digest, value in zip(digests, values) if value is not None}
+
+def store_chunk_results(connection, results):
+    """Memoize {digest: result}, skipping results over CHUNK_MEMO_MAX_BYTES"""
+    items = {}
+    for digest, result in results.items():
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) <= CHUNK_MEMO_MAX_BYTES:
+            items[digest] = payload
+    try:
+        lru_put_many(connection, CHUNK_MEMO_PREFIX, CHUNK_MEMO_LRU_KEY, items,
+                     CHUNK_MEMO_TTL, CHUNK_MEMO_MAX_ENTRIES)
+    except Exception as e:
+        logger.warning(f"Could not memoize chunk results: {str(e)}")
@@ -1,11 +1,199 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import json
-from . import task_queue, logger
+import time
+from . import task_queue, logger, redis_conn
+from .config import (
+    BATCH_ENQUEUE_MAX_JOBS, ENQUEUE_PIPELINE_CHUNK, JOBS_PAGE_SIZE, JOBS_PAGE_SIZE_MAX, JOB_STATUS_MAX_IDS,
+    SSE_HEARTBEAT
+)
+from .executors import EXECUTORS, backend_names
+from .notifications import check_webhook_url, stream_job_events
+from .operations import parse_operation
+from .result_cache import cache_enabled, cache_key, cache_lookup_enabled, cache_stats, get_cached, get_cached_many
+from .scheduling import job_priority, job_queues, queue_name, queue_stats
 from .tasks import process_data, process_text
+from .text_stats import text_settings
 import uuid
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
 
 bp = Blueprint('main', __name__)
 
+JOB_FUNCTIONS = {
+    "data_processing": process_data,
+    "text_processing": process_text,
+}
+
+RESULT_TTL = 24*3600  # Store results for 24 hours
+
+# Every priority / job type queue, plus the original RQ_QUEUE_NAME queue
+QUEUES = {queue.name: queue for queue in job_queues(redis_conn)}
+
+# status -> RQ registry attribute holding its job IDs ('queued' is the queue list itself)
+JOB_LISTS = {
+    "queued": None,
+    "started": "started_job_registry",
+    "finished": "finished_job_registry",
+    "failed": "failed_job_registry",
+    "deferred": "deferred_job_registry",
+    "scheduled": "scheduled_job_registry",
+}
+
+def job_list_key(status, queue):
+    """Redis key of a queue's list (queued) or sorted set (registries) for a status"""
+    registry = JOB_LISTS[status]
+    return queue.key if registry is None else getattr(queue, registry).key
+
+def job_counts_by_queue():
+    """
+    Number of jobs per status in each queue, read with one pipelined
+    LLEN/ZCARD round trip
+    
+    Registry.count is avoided on purpose: it runs a cleanup pass first.
+    
+    Returns:
+        {status: [count per queue, in QUEUES order]}
+    """
+    pipe = task_queue.connection.pipeline(transaction=False)
+    for status in JOB_LISTS:
+        for queue in QUEUES.values():
+            if status == "queued":
+                pipe.llen(job_list_key(status, queue))
+            else:
+                pipe.zcard(job_list_key(status, queue))
+    counts = pipe.execute()
+    return {status: counts[i * len(QUEUES):(i + 1) * len(QUEUES)] for i, status in enumerate(JOB_LISTS)}
+
+def job_counts():
+    """Number of jobs per status across all queues"""
+    return {status: sum(counts) for status, counts in job_counts_by_queue().items()}
+
+def queued_count():
+    """Jobs waiting across all queues"""
+    pipe = task_queue.connection.pipeline(transaction=False)
+    for queue in QUEUES.values():
+        pipe.llen(queue.key)
+    return sum(pipe.execute())
+
+def job_statuses(job_ids):
+    """
+    Status of each job ID in one pipelined round trip
+    
+    Returns:
+        List of status strings, None for jobs that no longer exist
+    """
+    if not job_ids:
+        return []
+    pipe = task_queue.connection.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hget(task_queue.job_class.key_for(job_id), 'status')
+    return [status.decode() if status else None for status in pipe.execute()]
+
+def job_ids_after(status, queue, after, count):
+    """
+    Up to count (job_id, position) pairs from a queue's list for a status,
+    following the job `after` refers to; position is the list index for queued
+    jobs and the registry score otherwise
+    
+    `after` is None to start at the beginning, else (position, job_id) of the
+    last job already returned. A queued job is looked up at its index and only
+    searched for (LPOS) when it has moved; registry members resume by score.
+    Either way jobs finishing or being enqueued between pages do not shift the
+    next page.
+    """
+    conn = task_queue.connection
+    key = job_list_key(status, queue)
+    if status == "queued":
+        start = 0
+        if after is not None:
+            index, last_id = int(after[0]), after[1]
+            raw_ids = conn.lrange(key, index, index + count)
+            if raw_ids and raw_ids[0].decode() == last_id:
+                return [(job_id.decode(), index + 1 + i) for i, job_id in enumerate(raw_ids[1:])]
+            position = conn.lpos(key, last_id)
+            # Gone from the list means dequeued, along with everything queued ahead of it
+            start = position + 1 if position is not None else 0
+        return [(job_id.decode(), start + i)
+                for i, job_id in enumerate(conn.lrange(key, start, start + count - 1))]
+    
+    if after is None:
+        items = conn.zrange(key, 0, count - 1, withscores=True)
+    else:
+        score, last_id = after
+        # Members sharing a score are ordered by their bytes
+        items = [(member, member_score)
+                 for member, member_score in conn.zrangebyscore(key, score, score, withscores=True)
+                 if member > last_id.encode()][:count]
+        if len(items) < count:
+            items += conn.zrangebyscore(key, f"({score!r}", "+inf", start=0, num=count - len(items),
+                                        withscores=True)
+    return [(job_id.decode(), member_score) for job_id, member_score in items]
+
+def encode_jobs_cursor(queue_index, position, job_id):
+    """
+    Cursor for the page following job_id: '<queue index>:<position>:<job id>',
+    position being the list index (int) or registry score (float)
+    """
+    return f"{queue_index}:{position!r}:{job_id}"
+
+def decode_jobs_cursor(cursor):
+    """
+    Returns:
+        (queue index, (position, job_id))
+    
+    Raises:
+        ValueError for a malformed cursor
+    """
+    index, position, job_id = cursor.split(":", 2)
+    index = int(index)
+    if not 0 <= index < len(QUEUES) or not job_id:
+        raise ValueError(cursor)
+    return index, (float(position), job_id)
+
+def validate_job_spec(spec, webhook_hosts=None):
+    """
+    Validate one job spec from a request
+    
+    Args:
+        spec: The job spec
+        webhook_hosts: Optional dict shared across a batch's specs, so each
+            webhook host is resolved once (see check_webhook_url)
+    
+    Returns:
+        (job_type, data, options) tuple
+        
+    Raises:
+        ValueError with a client-facing message
+    """
+    if not isinstance(spec, dict) or not spec:
+        raise ValueError("No JSON data provided")
+    job_type = spec.get('job_type')
+    if not job_type:
+        raise ValueError("job_type is required")
+    job_data = spec.get('data')
+    if job_data is None:
+        raise ValueError("data is required")
+    if job_type not in JOB_FUNCTIONS:
+        raise ValueError(f"Unsupported job_type: {job_type}")
+    options = spec.get('options') or {}
+    if not isinstance(options, dict):
+        raise ValueError("options must be an object")
+    if options.get('webhook_url') is not None:
+        check_webhook_url(options['webhook_url'], webhook_hosts)
+    if not isinstance(options.get('cache', True), bool):
+        raise ValueError("options.cache must be true or false")
+    if not isinstance(options.get('incremental', False), bool):
+        raise ValueError("options.incremental must be true or false")
+    backend = options.get('backend')
+    if backend is not None and backend not in EXECUTORS:
+        raise ValueError(f"options.backend must be one of {backend_names()}")
+    if job_type == "data_processing":
+        parse_operation(options.get('operation'))
+    if job_type == "text_processing":
+        text_settings(options)
+    job_priority(job_type, job_data, options)
+    return job_type, job_data, options
+
 @bp.route('/enqueue', methods=['POST'])
 def enqueue_job():
     """
@@ -16,94 +204,352 @@ def enqueue_job():
         "data": {...} or "text content",
         "options": {...} (optional)
     }
+    A payload whose result is in the result cache is answered immediately
+    (200, "cached": true, no job is created) unless it has a webhook_url; pass
+    "cache": false in options to force a new run.
     """
     try:
         data = request.get_json()
         
-        if not data:
-            return jsonify({"error": "No JSON data provided"}), 400
-            
-        job_type = data.get('job_type')
-        if not job_type:
-            return jsonify({"error": "job_type is required"}), 400
-            
-        job_data = data.get('data')
-        if job_data is None:
-            return jsonify({"error": "data is required"}), 400
-            
-        options = data.get('options', {})
+        try:
+            job_type, job_data, options = validate_job_spec(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        meta = {}
+        if cache_enabled(options):
+            meta['cache_key'] = cache_key(job_type, job_data, options)
+        if cache_lookup_enabled(options):
+            cached = get_cached(redis_conn, meta['cache_key'])
+            if cached is not None:
+                logger.info(f"Result cache hit for {job_type} job")
+                return jsonify({
+                    "job_id": None,
+                    "status": "finished",
+                    "cached": True,
+                    "result": cached
+                }), 200
         
         # Generate a unique job ID
         job_id = str(uuid.uuid4())
         
-        # Enqueue the appropriate task based on job_type
-        if job_type == "data_processing":
-            job = task_queue.enqueue(
-                process_data,
-                args=(job_data, options),
-                job_id=job_id,
-                result_ttl=24*3600  # Store the result for 24 hours
-            )
-        elif job_type == "text_processing":
-            job = task_queue.enqueue(
-                process_text,
-                args=(job_data, options),
-                job_id=job_id,
-                result_ttl=24*3600
-            )
-        else:
-            return jsonify({"error": f"Unsupported job_type: {job_type}"}), 400
+        # Enqueue the appropriate task on its priority / job type queue
+        queue = QUEUES[queue_name(job_priority(job_type, job_data, options), job_type)]
+        job = queue.enqueue(
+            JOB_FUNCTIONS[job_type],
+            args=(job_data, options),
+            job_id=job_id,
+            result_ttl=RESULT_TTL,
+            meta=meta
+        )
         
-        logger.info(f"Job enqueued with ID: {job_id}")
+        logger.info(f"Job enqueued with ID: {job_id} on {queue.name}")
         return jsonify({
             "job_id": job_id,
             "status": "queued",
-            "position": len(task_queue)
+            "queue": queue.name,
+            "position": len(queue)
         }), 202
         
     except Exception as e:
         logger.error(f"Error enqueueing job: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@bp.route('/job/<job_id>', methods=['GET'])
-def get_job_status(job_id):
-    """Get the status and result of a job"""
-    job = task_queue.fetch_job(job_id)
-    
-    if not job:
-        return jsonify({"error": "Job not found"}), 404
+@bp.route('/enqueue/batch', methods=['POST'])
+def enqueue_batch():
+    """
+    Endpoint to enqueue many jobs in one request
+    Expected JSON payload:
+    {
+        "jobs": [{"job_type": ..., "data": ..., "options": {...}}, ...]
+    }
+    All specs are validated before anything is enqueued; jobs are then written
+    with RQ's enqueue_many in pipelines of ENQUEUE_PIPELINE_CHUNK jobs.
+    Jobs whose results are cached aren't enqueued (unless they have a
+    webhook_url): their job_ids entry is null and the result is returned under
+    "cached" by index.
+    """
+    try:
+        data = request.get_json()
+        specs = data.get('jobs') if isinstance(data, dict) else data
+        if not isinstance(specs, list) or not specs:
+            return jsonify({"error": "jobs must be a non-empty list"}), 400
+        if len(specs) > BATCH_ENQUEUE_MAX_JOBS:
+            return jsonify({"error": f"At most {BATCH_ENQUEUE_MAX_JOBS} jobs per batch"}), 400
+        
+        validated = []
+        webhook_hosts = {}
+        for index, spec in enumerate(specs):
+            try:
+                validated.append(validate_job_spec(spec, webhook_hosts))
+            except ValueError as e:
+                return jsonify({"error": str(e), "index": index}), 400
+        
+        # Look up every cacheable job in one pipeline
+        keys = [cache_key(job_type, job_data, options) if cache_enabled(options) else None
+                for job_type, job_data, options in validated]
+        lookups = [i for i, key in enumerate(keys) if key and cache_lookup_enabled(validated[i][2])]
+        cached = dict(zip(lookups, get_cached_many(redis_conn, [keys[i] for i in lookups])))
+        
+        # job_ids lines up with the request's jobs; cached ones have no job
+        job_ids = [None] * len(validated)
+        job_datas = {}  # queue name -> prepared jobs
+        for index, (job_type, job_data, options) in enumerate(validated):
+            if cached.get(index) is not None:
+                continue
+            name = queue_name(job_priority(job_type, job_data, options), job_type)
+            prepared = QUEUES[name].prepare_data(
+                JOB_FUNCTIONS[job_type],
+                args=(job_data, options),
+                job_id=str(uuid.uuid4()),
+                result_ttl=RESULT_TTL,
+                meta={'cache_key': keys[index]} if keys[index] else {}
+            )
+            job_ids[index] = prepared.job_id
+            job_datas.setdefault(name, []).append(prepared)
+        
+        enqueued = 0
+        for name, queue_jobs in job_datas.items():
+            queue = QUEUES[name]
+            for start in range(0, len(queue_jobs), ENQUEUE_PIPELINE_CHUNK):
+                chunk = queue_jobs[start:start + ENQUEUE_PIPELINE_CHUNK]
+                with queue.connection.pipeline() as pipe:
+                    enqueued += len(queue.enqueue_many(chunk, pipeline=pipe))
+                    pipe.execute()
         
-    status = {
-        "job_id": job_id,
-        "status": job.get_status(),
-        "queue_position": job.get_position() if job.get_position() is not None else 0,
+        cached = {index: result for index, result in cached.items() if result is not None}
+        logger.info(f"Batch of {enqueued} jobs enqueued, {len(cached)} answered from cache")
+        return jsonify({
+            "job_ids": job_ids,
+            "count": enqueued,
+            "cached": {str(index): result for index, result in cached.items()},
+            "status": "queued",
+            "queue_length": queued_count()
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error enqueueing batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def describe_job(job, queue_position=None):
+    """
+    Build the status payload for a job without extra Redis calls
+    
+    Args:
+        job: Job restored by Job.fetch/Job.fetch_many
+        queue_position: Position in the queue when the job is queued
+    """
+    status = job.get_status(refresh=False)
+    info = {
+        "job_id": job.id,
+        "status": status,
+        "queue_position": queue_position if queue_position is not None else 0,
         "created_at": job.created_at.isoformat() if job.created_at else None,
         "ended_at": job.ended_at.isoformat() if job.ended_at else None,
+        # Set by distributed jobs as their chunks complete (see tasks.progress_reporter)
+        "progress": job.meta.get("progress"),
     }
     
     # Add the result if the job is finished
-    if job.is_finished:
-        status["result"] = job.result
+    if status == JobStatus.FINISHED:
+        info["result"] = job.result
     
     # Add error information if the job failed
-    if job.is_failed:
-        status["error"] = job.exc_info
+    if status == JobStatus.FAILED:
+        info["error"] = job.exc_info
+    
+    return info
+
+@bp.route('/job/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Get the status and result of a job"""
+    # jobs live on several queues, and Queue.fetch_job only finds its own
+    try:
+        job = Job.fetch(job_id, connection=task_queue.connection, serializer=task_queue.serializer)
+    except NoSuchJobError:
+        return jsonify({"error": "Job not found"}), 404
     
-    return jsonify(status)
+    position = None
+    if job.get_status(refresh=False) == JobStatus.QUEUED:
+        position = job.get_position()
+    return jsonify(describe_job(job, position))
+
+@bp.route('/jobs/status', methods=['POST'])
+def get_job_statuses():
+    """
+    Bulk version of GET /job/<job_id>
+    Expected JSON payload:
+    {
+        "job_ids": ["...", "..."]
+    }
+    All jobs are read with one pipelined Job.fetch_many call, and queue
+    positions come from a single read of the queue, only when some of the
+    jobs are still queued.
+    """
+    data = request.get_json(silent=True) or {}
+    job_ids = data.get('job_ids')
+    if not isinstance(job_ids, list) or not all(isinstance(job_id, str) for job_id in job_ids):
+        return jsonify({"error": "job_ids must be a list of strings"}), 400
+    if len(job_ids) > JOB_STATUS_MAX_IDS:
+        return jsonify({"error": f"At most {JOB_STATUS_MAX_IDS} job_ids per request"}), 400
+    
+    try:
+        jobs = Job.fetch_many(job_ids, connection=task_queue.connection,
+                              serializer=task_queue.serializer)
+        
+        # one read of each queue that holds some of the queued jobs
+        positions = {}
+        origins = {job.origin for job in jobs if job and job.get_status(refresh=False) == JobStatus.QUEUED}
+        for origin in origins:
+            queue = QUEUES.get(origin)
+            if queue is not None:
+                positions.update((job_id, index) for index, job_id in enumerate(queue.get_job_ids()))
+        
+        return jsonify({
+            "jobs": [describe_job(job, positions.get(job.id)) for job in jobs if job],
+            "not_found": [job_id for job_id, job in zip(job_ids, jobs) if job is None],
+        })
+    except Exception as e:
+        logger.error(f"Error looking up job statuses: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/jobs/events', methods=['GET', 'POST'])
+def job_events():
+    """
+    Server-sent events stream of job completions
+    Watch specific jobs with ?job_ids=a,b,c or, for long lists, a POST body
+    {"job_ids": [...]}; the stream then ends once all of them are done.
+    Without job_ids every completion on the queue is streamed.
+    Each event is {"job_id", "status", "result_status", "ended_at"}.
+    """
+    if request.method == 'POST':
+        job_ids = (request.get_json(silent=True) or {}).get('job_ids')
+        if not isinstance(job_ids, list) or not all(isinstance(job_id, str) for job_id in job_ids):
+            return jsonify({"error": "job_ids must be a list of strings"}), 400
+    else:
+        job_ids = request.args.get('job_ids')
+        job_ids = [job_id for job_id in job_ids.split(',') if job_id] if job_ids else None
+    if job_ids is not None and len(job_ids) > JOB_STATUS_MAX_IDS:
+        return jsonify({"error": f"At most {JOB_STATUS_MAX_IDS} job_ids per stream"}), 400
+    
+    events = stream_job_events(task_queue.connection, job_ids,
+                               current_statuses=job_statuses, heartbeat=SSE_HEARTBEAT)
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @bp.route('/jobs', methods=['GET'])
 def list_jobs():
-    """List all jobs in the queue"""
-    # Get jobs with different statuses
-    queued_jobs = task_queue.get_jobs()
-    failed_jobs = task_queue.failed_job_registry.get_job_ids()
-    completed_jobs = task_queue.finished_job_registry.get_job_ids()
+    """
+    Every queued, failed and completed job (the original, unpaginated response)
+    
+    Kept for existing clients; its cost grows with the number of jobs, so new
+    clients should page through /v2/jobs.
+    """
+    now = time.time()
+    pipe = task_queue.connection.pipeline(transaction=False)
+    for status in ("queued", "failed", "finished"):
+        for queue in QUEUES.values():
+            if status == "queued":
+                pipe.lrange(job_list_key(status, queue), 0, -1)
+            else:
+                # Expired entries are what Registry.get_job_ids would clean up first
+                pipe.zrangebyscore(job_list_key(status, queue), now, "+inf")
+    results = pipe.execute()
+    queued, failed, finished = (
+        [job_id.decode() for ids in results[i * len(QUEUES):(i + 1) * len(QUEUES)] for job_id in ids]
+        for i in range(3)
+    )
     
+    response = jsonify({
+        "queued_count": len(queued),
+        "failed_count": len(failed),
+        "completed_count": len(finished),
+        "queued_jobs": [
+            {"job_id": job_id, "status": job_status}
+            for job_id, job_status in zip(queued, job_statuses(queued))
+        ],
+        "failed_jobs": [{"job_id": job_id} for job_id in failed],
+        "completed_jobs": [{"job_id": job_id} for job_id in finished],
+    })
+    response.headers["Link"] = '</v2/jobs>; rel="successor-version"'
+    return response
+
+@bp.route('/v2/jobs', methods=['GET'])
+def list_jobs_v2():
+    """
+    Job counts per status plus one page of job IDs
+    Query parameters:
+        status: queued (default), started, finished, failed, deferred or scheduled
+        cursor: next_cursor from the previous page
+        limit:  page size (default JOBS_PAGE_SIZE, max JOBS_PAGE_SIZE_MAX)
+    Counts come from LLEN/ZCARD and the page from LRANGE/ZRANGEBYSCORE, so the
+    cost does not depend on how many jobs are queued. The cursor names the
+    last job returned rather than an offset, so pages stay stable while jobs
+    move between lists.
+    """
+    status = request.args.get('status', 'queued')
+    if status not in JOB_LISTS:
+        return jsonify({"error": f"Unsupported status: {status}"}), 400
+    try:
+        limit = int(request.args.get('limit', JOBS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be >= 1"}), 400
+    limit = min(limit, JOBS_PAGE_SIZE_MAX)
+    start_index, after = 0, None
+    if request.args.get('cursor'):
+        try:
+            start_index, after = decode_jobs_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+    
+    counts = job_counts()
+    
+    # Queues are walked in QUEUES order; one extra job tells whether there is a next page
+    queues = list(QUEUES.values())
+    page = []
+    for index in range(start_index, len(queues)):
+        ids = job_ids_after(status, queues[index], after if index == start_index else None,
+                            limit + 1 - len(page))
+        page.extend((index, position, job_id) for job_id, position in ids)
+        if len(page) > limit:
+            break
+    
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_jobs_cursor(*page[-1])
+    job_ids = [job_id for _, _, job_id in page]
     return jsonify({
-        "queued_count": len(queued_jobs),
-        "failed_count": len(failed_jobs),
-        "completed_count": len(completed_jobs),
-        "queued_jobs": [{"job_id": job.id, "status": job.get_status()} for job in queued_jobs],
-        "failed_jobs": [{"job_id": job_id} for job_id in failed_jobs],
-        "completed_jobs": [{"job_id": job_id} for job_id in completed_jobs],
+        "queued_count": counts["queued"],
+        "started_count": counts["started"],
+        "completed_count": counts["finished"],
+        "failed_count": counts["failed"],
+        "deferred_count": counts["deferred"],
+        "scheduled_count": counts["scheduled"],
+        "status": status,
+        "jobs": [
+            {"job_id": job_id, "status": job_status}
+            for job_id, job_status in zip(job_ids, job_statuses(job_ids))
+        ],
+        "next_cursor": next_cursor,
     })
+
+@bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Result cache hit rate (hits / lookups at enqueue), size and limits"""
+    try:
+        return jsonify(cache_stats(redis_conn))
+    except Exception as e:
+        logger.error(f"Error reading cache stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/queues/stats', methods=['GET'])
+def get_queue_stats():
+    """Per-queue backlog, scheduling weight and queue-wait percentiles against the SLO"""
+    try:
+        return jsonify({"queues": queue_stats(redis_conn)})
+    except Exception as e:
+        logger.error(f"Error reading queue stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,231 @@
+import json
+import time
+import socket
+import ipaddress
+from urllib.parse import urlsplit, urlunsplit
+import requests
+from requests.adapters import HTTPAdapter
+from rq import Queue
+from . import logger
+from .config import JOB_EVENTS_CHANNEL, WEBHOOK_TIMEOUT, WEBHOOK_QUEUE_NAME, WEBHOOK_ALLOWED_HOSTS
+
+TERMINAL_STATUSES = ("finished", "failed", "stopped", "canceled")
+
+def job_event(job, status):
+    """
+    Build the notification payload for a job that just finished or failed
+
+    Only the outcome is sent; clients fetch results with POST /jobs/status.
+
+    Args:
+        job: RQ job that has just been handled by a worker
+        status: Final RQ status ("finished", "failed" or "stopped")
+
+    Returns:
+        Dictionary with the event fields
+    """
+    result = job.result if status == "finished" else None
+    return {
+        "job_id": job.id,
+        "status": status,
+        # process_data/process_text report their own errors in the result
+        "result_status": result.get("status") if isinstance(result, dict) else None,
+        "ended_at": job.ended_at.isoformat() if job.ended_at else None,
+    }
+
+def webhook_url(job):
+    """Return the webhook_url from the job's options, if any"""
+    if len(job.args) < 2 or not isinstance(job.args[1], dict):
+        return None
+    return job.args[1].get("webhook_url")
+
+def _host_allowed(host):
+    return any(host == allowed or host.endswith('.' + allowed) for allowed in WEBHOOK_ALLOWED_HOSTS)
+
+def check_webhook_url(url, resolved=None):
+    """
+    Make sure a client-supplied webhook URL can't reach internal services
+
+    With WEBHOOK_ALLOWED_HOSTS set, the host must be one of them (or a
+    subdomain). Otherwise every address the host resolves to must be public:
+    loopback, private, link-local (cloud metadata) and reserved addresses are
+    refused.
+
+    Args:
+        url: The webhook URL
+        resolved: Optional dict caching host -> addresses (or the ValueError
+            raised for it), so a batch of jobs resolves each host once
+
+    Returns:
+        The checked addresses to connect to, or None for an allowed host
+
+    Raises:
+        ValueError if the URL may not be called
+    """
+    if not isinstance(url, str) or not url.startswith(('http://', 'https://')):
+        raise ValueError("options.webhook_url must be an http(s) URL")
+    try:
+        parts = urlsplit(url)
+        host, port = (parts.hostname or '').lower(), parts.port
+    except ValueError:
+        raise ValueError("options.webhook_url is not a valid URL")
+    if not host:
+        raise ValueError("options.webhook_url has no host")
+    if WEBHOOK_ALLOWED_HOSTS:
+        if not _host_allowed(host):
+            raise ValueError(f"options.webhook_url host {host!r} is not allowed")
+        return None
+    if resolved is None:
+        return _public_addresses(host)
+    if host not in resolved:
+        try:
+            resolved[host] = _public_addresses(host)
+        except ValueError as e:
+            resolved[host] = e
+    if isinstance(resolved[host], ValueError):
+        raise resolved[host]
+    return resolved[host]
+
+def _public_addresses(host):
+    try:
+        infos = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+    except socket.gaierror:
+        raise ValueError(f"options.webhook_url host {host!r} could not be resolved")
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ValueError(f"options.webhook_url host {host!r} is not a public address")
+    return addresses
+
+class PinnedHostAdapter(HTTPAdapter):
+    """
+    Connect HTTPS requests to an already checked IP address while sending the
+    original host name for SNI and certificate verification
+    """
+
+    def __init__(self, host, **kwargs):
+        self.host = host
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['server_hostname'] = self.host
+        kwargs['assert_hostname'] = self.host
+        super().init_poolmanager(*args, **kwargs)
+
+def pinned_request(url, address):
+    """
+    Rewrite url to connect to address
+
+    Returns:
+        (url with the address as its host, Host header value)
+    """
+    parts = urlsplit(url)
+    netloc, host_header = (f"[{name}]" if ':' in name else name for name in (address, parts.hostname))
+    if parts.port:
+        netloc, host_header = f"{netloc}:{parts.port}", f"{host_header}:{parts.port}"
+    return urlunsplit(parts._replace(netloc=netloc)), host_header
+
+def post_webhook(url, event):
+    """
+    POST an event to a client's webhook, logging (not raising) on failure
+
+    The URL is checked again right before sending, as DNS may have changed
+    since enqueue, and the request goes to the address that was checked, so
+    a host that re-resolves to an internal address (DNS rebinding) can't
+    redirect it. Redirects are not followed.
+
+    Returns:
+        True if the webhook answered with a 2xx status
+    """
+    try:
+        addresses = check_webhook_url(url)
+        with requests.Session() as session:
+            headers = {}
+            if addresses is not None:
+                target, headers['Host'] = pinned_request(url, addresses[0])
+                session.mount('https://', PinnedHostAdapter(urlsplit(url).hostname))
+            else:
+                target = url
+            response = session.post(target, json=event, headers=headers, timeout=WEBHOOK_TIMEOUT,
+                                    allow_redirects=False)
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        logger.warning(f"Webhook for job {event['job_id']} to {url} failed: {str(e)}")
+        return False
+
+def notify_job_done(connection, job, status):
+    """
+    Publish a job's outcome on JOB_EVENTS_CHANNEL and queue its webhook
+
+    Called by the worker after RQ has recorded the job's final status, so a
+    subscriber that sees the event can immediately read the result. The
+    webhook itself is sent by a post_webhook job on WEBHOOK_QUEUE_NAME, so a
+    slow endpoint doesn't hold up the worker's next job.
+    """
+    event = job_event(job, status)
+    try:
+        connection.publish(JOB_EVENTS_CHANNEL, json.dumps(event))
+    except Exception as e:
+        logger.warning(f"Could not publish event for job {job.id}: {str(e)}")
+
+    url = webhook_url(job)
+    if url:
+        try:
+            Queue(WEBHOOK_QUEUE_NAME, connection=connection).enqueue(
+                post_webhook, url, event, result_ttl=0, job_timeout=int(WEBHOOK_TIMEOUT) + 30
+            )
+        except Exception as e:
+            logger.warning(f"Could not queue webhook for job {job.id}: {str(e)}")
+    return event
+
+def format_sse(data, event=None):
+    """Format one server-sent event"""
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+def stream_job_events(connection, job_ids=None, current_statuses=None, heartbeat=15):
+    """
+    Generate server-sent events for job completions
+
+    Subscribes before reading current statuses so no completion is missed.
+
+    Args:
+        connection: Redis connection
+        job_ids: Jobs to watch; None streams every job on the channel forever
+        current_statuses: Function mapping job IDs to their stored statuses,
+            used to report jobs that were already done before subscribing
+        heartbeat: Seconds between keep-alive comments when idle
+
+    Yields:
+        SSE-formatted strings; stops once every watched job is done
+    """
+    pubsub = connection.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(JOB_EVENTS_CHANNEL)
+    try:
+        pending = None
+        if job_ids is not None:
+            pending = set(job_ids)
+            for job_id, status in zip(job_ids, current_statuses(job_ids)):
+                if status is None or status in TERMINAL_STATUSES:
+                    pending.discard(job_id)
+                    yield format_sse({"job_id": job_id, "status": status or "not_found"}, event="job")
+
+        last_sent = time.monotonic()
+        while pending is None or pending:
+            message = pubsub.get_message(timeout=heartbeat)
+            if message is not None and message["type"] == "message":
+                event = json.loads(message["data"])
+                if pending is not None:
+                    if event["job_id"] not in pending:
+                        continue
+                    pending.discard(event["job_id"])
+                last_sent = time.monotonic()
+                yield format_sse(event, event="job")
+            elif time.monotonic() - last_sent >= heartbeat:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+        yield format_sse({"status": "complete"}, event="end")
+    finally:
+        pubsub.close()
@@ -0,0 +1,559 @@
+"""
+Vectorized operations for data_processing jobs
+
+Job data is turned into NumPy columns: a mapping of key -> value becomes the
+two columns `key` and `value`, and a mapping of equal-length lists is used as
+columns directly. options['operation'] is an operation name, one step or a
+list of steps, for example:
+
+    {"type": "filter", "where": "value > 10 and key != 'x'"}
+    {"type": "map", "columns": {"total": "price * qty"}}
+    {"type": "coerce", "columns": {"value": "float"}, "errors": "null"}
+    {"type": "aggregate", "columns": {"value": ["sum", "mean"]}}
+    {"type": "group_by", "by": ["category"], "columns": {"amount": ["sum", "count"]}}
+
+Row-wise steps (filter, map, coerce) run chunk by chunk. A reduction
+(aggregate, group_by) may only be the last step; each chunk produces a
+mergeable partial state, so the Ray path reduces per chunk and combines the
+partials on the driver.
+"""
+import ast
+import functools
+import math
+import operator
+from collections import namedtuple
+import numpy as np
+
+AGGREGATES = ("count", "sum", "mean", "min", "max", "std")
+COERCE_TYPES = ("int", "float", "str", "bool")
+_TRUE_STRINGS = ["true", "t", "yes", "y", "1"]
+
+# count, sum, sum of squared deviations (M2), min, max
+_EMPTY_STATS = np.array([0.0, 0.0, 0.0, np.inf, -np.inf])
+
+Operation = namedtuple("Operation", ["validate", "apply", "merge", "finalize"])
+OPERATIONS = {}
+
+def register_operation(name, validate, apply, merge=None, finalize=None):
+    """
+    Add an operation to the registry
+
+    Args:
+        name: Value of a step's "type"
+        validate: Function(step) raising ValueError for a malformed step
+        apply: Function(columns, step) returning new columns, or a partial
+            state for reductions
+        merge: For reductions, function(state, state) combining two partials
+        finalize: For reductions, function(state, step) returning the result
+    """
+    OPERATIONS[name] = Operation(validate, apply, merge, finalize)
+
+def is_reduction(step):
+    return OPERATIONS[step["type"]].merge is not None
+
+# ---------------------------------------------------------------- columns
+
+def column_array(values):
+    """
+    1-D array for a list of JSON values: numeric when all values are numbers,
+    float with NaN for numbers mixed with nulls, object otherwise
+    """
+    try:
+        arr = np.asarray(values)
+    except ValueError:  # ragged nested lists
+        arr = None
+    if arr is not None and arr.ndim == 1 and arr.dtype.kind in "biuf":
+        return arr
+    if arr is not None and arr.dtype.kind == "O" and all(
+            v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+        return np.array([math.nan if v is None else v for v in values], dtype=np.float64)
+    return np.fromiter(values, dtype=object, count=len(values))
+
+def is_columnar(data):
+    """True if data is a mapping of equal-length lists (one list per column)"""
+    lengths = set()
+    for values in data.values():
+        if not isinstance(values, list):
+            return False
+        lengths.add(len(values))
+    return len(lengths) == 1
+
+def row_count(data):
+    if is_columnar(data):
+        return len(next(iter(data.values())))
+    return len(data)
+
+def to_columns(data):
+    """
+    Convert job data to columns
+
+    Returns:
+        (columns, keyed) where keyed is True for key -> value mappings
+    """
+    if is_columnar(data):
+        return {name: column_array(values) for name, values in data.items()}, False
+    return {
+        "key": np.fromiter(data.keys(), dtype=object, count=len(data)),
+        "value": column_array(list(data.values())),
+    }, True
+
+def _num_rows(columns):
+    return len(next(iter(columns.values()))) if columns else 0
+
+def _to_list(arr):
+    """JSON-friendly list; NaN becomes None"""
+    if arr.dtype.kind == "f" and np.isnan(arr).any():
+        return [None if math.isnan(v) else v for v in arr.tolist()]
+    return arr.tolist()
+
+def from_columns(columns, keyed):
+    """Convert columns back to the job's data shape"""
+    if keyed and set(columns) == {"key", "value"}:
+        return dict(zip(columns["key"].tolist(), _to_list(columns["value"])))
+    return {name: _to_list(arr) for name, arr in columns.items()}
+
+def row_ranges(n, rows_per_chunk):
+    """(start, stop) ranges of at most rows_per_chunk rows covering n rows (at least one)"""
+    rows_per_chunk = max(1, int(rows_per_chunk))
+    return [(start, min(start + rows_per_chunk, n)) for start in range(0, n, rows_per_chunk)] or [(0, 0)]
+
+def split_columns(columns, rows_per_chunk):
+    """Split columns into row ranges (NumPy views, no copies)"""
+    return [
+        {name: arr[start:stop] for name, arr in columns.items()}
+        for start, stop in row_ranges(_num_rows(columns), rows_per_chunk)
+    ]
+
+def _column(columns, name):
+    try:
+        return columns[name]
+    except KeyError:
+        raise ValueError(f"Unknown column {name!r}")
+
+def _numeric(values, name):
+    if values.dtype.kind in "biuf":
+        return values.astype(np.float64, copy=False)
+    try:
+        return values.astype(np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f"Column {name!r} is not numeric; add a coerce step first")
+
+_is_null = np.frompyfunc(lambda v: v is None or v != v, 1, 1)
+
+def _null_mask(values):
+    if values.dtype.kind == "f":
+        return np.isnan(values)
+    if values.dtype.kind == "O":
+        return _is_null(values).astype(bool)
+    return np.zeros(len(values), dtype=bool)
+
+# ------------------------------------------------------------ expressions
+
+def _as_str(value):
+    return np.asarray(value).astype(str)
+
+def _is_text(value):
+    return isinstance(value, str) or (isinstance(value, np.ndarray) and value.dtype.kind in "US")
+
+_BINARY = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.Pow: operator.pow, ast.BitAnd: np.logical_and, ast.BitOr: np.logical_or,
+}
+_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+_UNARY = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Not: np.logical_not}
+_FUNCTIONS = {
+    "abs": np.abs, "sqrt": np.sqrt, "log": np.log, "exp": np.exp,
+    "round": np.round, "floor": np.floor, "ceil": np.ceil,
+    "where": np.where,
+    "isnull": lambda v: _null_mask(np.asarray(v)),
+    "str": _as_str,
+    "upper": lambda v: np.char.upper(_as_str(v)),
+    "lower": lambda v: np.char.lower(_as_str(v)),
+    "strip": lambda v: np.char.strip(_as_str(v)),
+    "len": lambda v: np.char.str_len(_as_str(v)),
+}
+
+_INT64 = np.iinfo(np.int64)
+
+def _literal(value):
+    """
+    A literal as a NumPy scalar, so arithmetic on constants alone (9 ** 9 ** 9)
+    overflows like column arithmetic instead of growing without bound
+    """
+    if type(value) is int:
+        return np.int64(value)
+    if type(value) is float:
+        return np.float64(value)
+    return value
+
+def _check(node, source):
+    if isinstance(node, ast.BoolOp) or isinstance(node, ast.Name):
+        pass
+    elif isinstance(node, ast.BinOp):
+        if type(node.op) not in _BINARY:
+            raise ValueError(f"Unsupported operator in expression {source!r}")
+        if isinstance(node.op, ast.Mult) and any(
+                isinstance(side, ast.Constant) and isinstance(side.value, str) for side in (node.left, node.right)):
+            raise ValueError(f"String repetition is not supported in expression {source!r}")
+    elif isinstance(node, ast.UnaryOp):
+        if type(node.op) not in _UNARY:
+            raise ValueError(f"Unsupported operator in expression {source!r}")
+    elif isinstance(node, ast.Compare):
+        if any(type(op) not in _COMPARE for op in node.ops):
+            raise ValueError(f"Unsupported comparison in expression {source!r}")
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+            raise ValueError(f"Unsupported function call in expression {source!r}; "
+                             f"available: {sorted(_FUNCTIONS)}")
+        for arg in node.args:
+            _check(arg, source)
+        return
+    elif isinstance(node, ast.Constant):
+        if not isinstance(node.value, (int, float, str, bool, type(None))):
+            raise ValueError(f"Unsupported literal in expression {source!r}")
+        if type(node.value) is int and not _INT64.min <= node.value <= _INT64.max:
+            raise ValueError(f"Integer literal out of range in expression {source!r}")
+    else:
+        raise ValueError(f"Unsupported syntax in expression {source!r}: {type(node).__name__}")
+    for child in ast.iter_child_nodes(node):
+        if not isinstance(child, (ast.operator, ast.cmpop, ast.unaryop, ast.boolop, ast.expr_context)):
+            _check(child, source)
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(source):
+    """
+    Parse and check a column expression such as "price * qty" or
+    "value > 10 and key != 'x'"
+
+    Supported: column names, literals, arithmetic, comparisons, and/or/not,
+    & and |, and the functions in _FUNCTIONS.
+
+    Raises:
+        ValueError for anything else
+    """
+    if not isinstance(source, str):
+        raise ValueError("Expressions must be strings")
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression {source!r}: {e.msg}")
+    _check(tree.body, source)
+    return tree.body
+
+def evaluate(source, columns):
+    """Evaluate an expression against columns (vectorized over rows)"""
+    return _evaluate(compile_expression(source), columns)
+
+def _evaluate(node, columns):
+    if isinstance(node, ast.Constant):
+        return _literal(node.value)
+    if isinstance(node, ast.Name):
+        return _column(columns, node.id)
+    if isinstance(node, ast.BinOp):
+        left, right = _evaluate(node.left, columns), _evaluate(node.right, columns)
+        if isinstance(node.op, ast.Add) and (_is_text(left) or _is_text(right)):
+            return np.char.add(_as_str(left), _as_str(right))
+        if isinstance(node.op, ast.Mult) and (_is_text(left) or _is_text(right)):
+            raise ValueError("String repetition is not supported in expressions")
+        return _BINARY[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp):
+        return _UNARY[type(node.op)](_evaluate(node.operand, columns))
+    if isinstance(node, ast.BoolOp):
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return functools.reduce(combine, [_evaluate(v, columns) for v in node.values])
+    if isinstance(node, ast.Compare):
+        result = None
+        left = _evaluate(node.left, columns)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate(comparator, columns)
+            outcome = _COMPARE[type(op)](left, right)
+            result = outcome if result is None else np.logical_and(result, outcome)
+            left = right
+        return result
+    if isinstance(node, ast.Call):
+        return _FUNCTIONS[node.func.id](*[_evaluate(arg, columns) for arg in node.args])
+    raise ValueError(f"Unsupported expression node: {type(node).__name__}")
+
+def _broadcast(value, n):
+    value = np.asarray(value)
+    return np.full(n, value[()]) if value.ndim == 0 else value
+
+# ------------------------------------------------------------- row steps
+
+def _require_mapping(step, key):
+    value = step.get(key)
+    if not isinstance(value, dict) or not value:
+        raise ValueError(f"{step['type']} needs a non-empty {key!r} object")
+    return value
+
+def _validate_filter(step):
+    compile_expression(step.get("where"))
+
+def _apply_filter(columns, step):
+    mask = _broadcast(evaluate(step["where"], columns), _num_rows(columns)).astype(bool)
+    return {name: arr[mask] for name, arr in columns.items()}
+
+def _validate_map(step):
+    for expression in _require_mapping(step, "columns").values():
+        compile_expression(expression)
+
+def _apply_map(columns, step):
+    n = _num_rows(columns)
+    out = dict(columns)
+    for name, expression in step["columns"].items():
+        out[name] = _broadcast(evaluate(expression, columns), n)
+    return out
+
+def _validate_coerce(step):
+    for name, to in _require_mapping(step, "columns").items():
+        if to not in COERCE_TYPES:
+            raise ValueError(f"Cannot coerce {name!r} to {to!r}; expected one of {list(COERCE_TYPES)}")
+    if step.get("errors", "null") not in ("null", "raise"):
+        raise ValueError("coerce errors must be 'null' or 'raise'")
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+def _coerce(values, to, errors, name):
+    nulls = _null_mask(values)
+    if to == "str":
+        out = values.astype(str).astype(object)
+        out[nulls] = None
+        return out
+    if to == "bool":
+        if values.dtype.kind in "biuf":
+            return values.astype(bool)
+        return np.isin(np.char.lower(np.char.strip(_as_str(values))), _TRUE_STRINGS)
+    try:
+        out = values.astype(np.float64)
+    except (TypeError, ValueError):
+        if errors == "raise":
+            raise ValueError(f"Column {name!r} has values that are not {to}")
+        out = np.fromiter((_to_float(v) for v in values), dtype=np.float64, count=len(values))
+    if to == "int":
+        out = np.trunc(out)
+        if not np.isnan(out).any():
+            return out.astype(np.int64)
+    return out
+
+def _apply_coerce(columns, step):
+    out = dict(columns)
+    for name, to in step["columns"].items():
+        out[name] = _coerce(_column(columns, name), to, step.get("errors", "null"), name)
+    return out
+
+# ------------------------------------------------------------- reductions
+
+def _aggregate_spec(step):
+    """Normalize {"col": "sum" | ["sum", ...]} and check function names"""
+    spec = {}
+    for name, funcs in _require_mapping(step, "columns").items():
+        funcs = [funcs] if isinstance(funcs, str) else funcs
+        if not isinstance(funcs, list) or not funcs or any(f not in AGGREGATES for f in funcs):
+            raise ValueError(f"Aggregations for {name!r} must be from {list(AGGREGATES)}")
+        spec[name] = funcs
+    return spec
+
+def _stats(values):
+    x = values[~np.isnan(values)]
+    if not x.size:
+        return _EMPTY_STATS.copy()
+    total = x.sum()
+    return np.array([x.size, total, ((x - total / x.size) ** 2).sum(), x.min(), x.max()])
+
+def _merge_stats(a, b):
+    """Combine [count, sum, M2, min, max] stats (rows of 2-D arrays work too)"""
+    na, nb = a[..., 0], b[..., 0]
+    n = na + nb
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = np.where((na > 0) & (nb > 0), b[..., 1] / nb - a[..., 1] / na, 0.0)
+        m2 = a[..., 2] + b[..., 2] + np.where(n > 0, delta ** 2 * na * nb / n, 0.0)
+    return np.stack([
+        n, a[..., 1] + b[..., 1], m2,
+        np.minimum(a[..., 3], b[..., 3]), np.maximum(a[..., 4], b[..., 4]),
+    ], axis=-1)
+
+def _finalize_stats(stats, func):
+    """Vectorized over groups; stats has shape (groups, 5). Empty groups give NaN (0 for count/sum)."""
+    n = stats[:, 0]
+    if func == "count":
+        return n.astype(np.int64)
+    if func == "sum":
+        return stats[:, 1]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        value = {
+            "mean": stats[:, 1] / n,
+            "min": stats[:, 3],
+            "max": stats[:, 4],
+            "std": np.sqrt(stats[:, 2] / n),  # population standard deviation
+        }[func]
+    return np.where(n > 0, value, np.nan)
+
+def _validate_aggregate(step):
+    _aggregate_spec(step)
+
+def _apply_aggregate(columns, step):
+    return {name: _stats(_numeric(_column(columns, name), name)) for name in _aggregate_spec(step)}
+
+def _merge_aggregate(a, b):
+    return {name: _merge_stats(a[name], b[name]) for name in a}
+
+def _finalize_aggregate(state, step):
+    return {
+        name: {func: _to_list(_finalize_stats(state[name][None, :], func))[0] for func in funcs}
+        for name, funcs in _aggregate_spec(step).items()
+    }
+
+def _group_keys(step):
+    by = step.get("by")
+    by = [by] if isinstance(by, str) else by
+    if not isinstance(by, list) or not by or not all(isinstance(name, str) for name in by):
+        raise ValueError("group_by needs 'by': a column name or a list of column names")
+    return by
+
+def _validate_group_by(step):
+    _group_keys(step)
+    _aggregate_spec(step)
+
+def _apply_group_by(columns, step):
+    by = _group_keys(step)
+    combined = np.zeros(_num_rows(columns), dtype=np.int64)
+    for name in by:
+        try:
+            uniques, codes = np.unique(_column(columns, name), return_inverse=True)
+        except TypeError:
+            raise ValueError(f"Group key {name!r} mixes incomparable types; coerce it first")
+        combined = combined * len(uniques) + codes.reshape(-1)
+    _, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    groups = len(first)
+    keys = list(zip(*[_column(columns, name)[first].tolist() for name in by]))
+
+    stats = {}
+    for name in _aggregate_spec(step):
+        x = _numeric(_column(columns, name), name)
+        valid = ~np.isnan(x)
+        idx, x = inverse[valid], x[valid]
+        count = np.bincount(idx, minlength=groups).astype(np.float64)
+        total = np.bincount(idx, weights=x, minlength=groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, 0.0)
+        m2 = np.bincount(idx, weights=(x - mean[idx]) ** 2, minlength=groups)
+        low = np.full(groups, np.inf)
+        high = np.full(groups, -np.inf)
+        np.minimum.at(low, idx, x)
+        np.maximum.at(high, idx, x)
+        stats[name] = np.stack([count, total, m2, low, high], axis=-1)
+    return {"keys": keys, "stats": stats}
+
+def _merge_group_by(a, b):
+    index = {key: i for i, key in enumerate(a["keys"])}
+    keys = list(a["keys"])
+    positions = np.empty(len(b["keys"]), dtype=np.int64)
+    for j, key in enumerate(b["keys"]):
+        if key not in index:
+            index[key] = len(keys)
+            keys.append(key)
+        positions[j] = index[key]
+    stats = {}
+    for name, merged in a["stats"].items():
+        merged = np.vstack([merged, np.tile(_EMPTY_STATS, (len(keys) - len(merged), 1))])
+        merged[positions] = _merge_stats(merged[positions], b["stats"][name])
+        stats[name] = merged
+    return {"keys": keys, "stats": stats}
+
+def _finalize_group_by(state, step):
+    keys = state["keys"]
+    try:
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+    except TypeError:
+        order = list(range(len(keys)))
+    result = {name: [keys[i][pos] for i in order] for pos, name in enumerate(_group_keys(step))}
+    for name, funcs in _aggregate_spec(step).items():
+        stats = state["stats"][name][order] if order else state["stats"][name]
+        for func in funcs:
+            result[f"{name}_{func}"] = _to_list(_finalize_stats(stats, func))
+    return result
+
+register_operation("filter", _validate_filter, _apply_filter)
+register_operation("map", _validate_map, _apply_map)
+register_operation("coerce", _validate_coerce, _apply_coerce)
+register_operation("aggregate", _validate_aggregate, _apply_aggregate,
+                   _merge_aggregate, _finalize_aggregate)
+register_operation("group_by", _validate_group_by, _apply_group_by,
+                   _merge_group_by, _finalize_group_by)
+
+# -------------------------------------------------------------- pipeline
+
+def parse_operation(spec):
+    """
+    Validate options['operation'] and normalize it to a list of steps
+
+    Args:
+        spec: None (no-op), an operation name, one step object or a list of them
+
+    Returns:
+        List of step dictionaries
+
+    Raises:
+        ValueError with a client-facing message
+    """
+    if spec is None:
+        return []
+    if isinstance(spec, (str, dict)):
+        spec = [spec]
+    if not isinstance(spec, list):
+        raise ValueError("operation must be a name, an object or a list of objects")
+    steps = []
+    for i, step in enumerate(spec):
+        if isinstance(step, str):
+            step = {"type": step}
+        step_type = step.get("type") if isinstance(step, dict) else None
+        if step_type not in OPERATIONS:
+            raise ValueError(f"Unsupported operation {step_type!r} at step {i}; "
+                             f"expected one of {sorted(OPERATIONS)}")
+        OPERATIONS[step_type].validate(step)
+        if is_reduction(step) and i != len(spec) - 1:
+            raise ValueError(f"{step_type} must be the last step")
+        steps.append(step)
+    return steps
+
+def run_chunk(columns, steps):
+    """
+    Apply steps to one chunk of columns
+
+    Returns:
+        The transformed columns, or a partial state when the last step is a reduction
+    """
+    for step in steps:
+        columns = OPERATIONS[step["type"]].apply(columns, step)
+    return columns
+
+def combine_chunks(outputs, steps, keyed):
+    """
+    Merge run_chunk outputs (in chunk order) into the job result
+
+    Args:
+        outputs: run_chunk results for each chunk
+        steps: Parsed steps
+        keyed: Whether the input was a key -> value mapping
+    """
+    if steps and is_reduction(steps[-1]):
+        op = OPERATIONS[steps[-1]["type"]]
+        return op.finalize(functools.reduce(op.merge, outputs), steps[-1])
+    if len(outputs) == 1:
+        return from_columns(outputs[0], keyed)
+    return from_columns({name: np.concatenate([out[name] for out in outputs]) for name in outputs[0]}, keyed)
+
+def run_operation(data, spec):
+    """Run an operation over job data in this process"""
+    steps = parse_operation(spec)
+    columns, keyed = to_columns(data)
+    return combine_chunks([run_chunk(columns, steps)], steps, keyed)
@@ -0,0 +1,100 @@
+"""
+Adaptive partitioning for distributed tasks
+
+Decides whether a job is worth sending to Ray at all and, if so, how many
+chunks to cut it into, from:
+    - the estimated in-process run time (item count x measured per-item cost)
+    - the CPUs Ray currently has free (ray.available_resources())
+    - the payload size, so no single chunk gets too large to ship
+
+Per-item costs are measured on every run and kept in Redis as an
+exponentially weighted moving average, because RQ runs each job in a fresh
+work horse process that can't remember anything between jobs.
+"""
+import math
+from collections import namedtuple
+from . import logger, redis_conn
+from .config import (
+    RAY_NUM_CPUS, RAY_MIN_ITEMS, RAY_MIN_SECONDS, RAY_TARGET_TASK_SECONDS,
+    RAY_CHUNKS_PER_CPU, RAY_MAX_CHUNK_BYTES
+)
+
+# Seconds per item (row, or character of text) until a run has been measured
+DEFAULT_ITEM_COST = {
+    "data_processing": 1e-7,
+    "text_processing": 5e-8,
+}
+ITEM_COST_KEY = 'batch:item_cost'
+ITEM_COST_ALPHA = 0.2  # weight of the newest measurement
+ITEM_COST_MAX_STEP = 10  # samples are clamped to within 10x of the current estimate
+
+PartitionPlan = namedtuple("PartitionPlan", ["distributed", "num_chunks", "chunk_size", "estimated_seconds"])
+
+def item_cost(task_type):
+    """Measured seconds per item for task_type, or the default before any run"""
+    try:
+        cost = redis_conn.hget(ITEM_COST_KEY, task_type)
+    except Exception as e:
+        logger.warning(f"Could not read item cost for {task_type}: {str(e)}")
+        cost = None
+    return float(cost) if cost else DEFAULT_ITEM_COST.get(task_type, 1e-6)
+
+def record_item_cost(task_type, items, seconds):
+    """
+    Fold one run's per-item cost into the moving average
+
+    Args:
+        task_type: 'data_processing' or 'text_processing'
+        items: Items processed
+        seconds: Compute seconds spent (summed over chunks for Ray runs)
+    """
+    if items <= 0 or seconds <= 0:
+        return
+    previous = item_cost(task_type)
+    # a cold Ray worker's first chunk includes its imports; don't let one
+    # outlier swing the estimate
+    sample = min(max(seconds / items, previous / ITEM_COST_MAX_STEP), previous * ITEM_COST_MAX_STEP)
+    cost = previous + ITEM_COST_ALPHA * (sample - previous)
+    try:
+        redis_conn.hset(ITEM_COST_KEY, task_type, cost)
+    except Exception as e:
+        logger.warning(f"Could not record item cost for {task_type}: {str(e)}")
+
+def worth_distributing(task_type, items):
+    """True if the job is big enough for Ray's scheduling and transfer overhead to pay off"""
+    return items >= RAY_MIN_ITEMS and items * item_cost(task_type) >= RAY_MIN_SECONDS
+
+def available_cpus():
+    """CPUs Ray can use right now (the whole cluster if everything is busy)"""
+    import ray
+    cpus = ray.available_resources().get("CPU", 0)
+    if cpus < 1:
+        cpus = ray.cluster_resources().get("CPU", RAY_NUM_CPUS)
+    return max(1, int(cpus))
+
+def plan_partitions(task_type, items, payload_bytes=0, cpus=None):
+    """
+    Pick the chunk count for a distributed run
+
+    Tasks are made long enough (RAY_TARGET_TASK_SECONDS) to amortize
+    scheduling, with no more than RAY_CHUNKS_PER_CPU chunks per free CPU, but
+    never bigger than RAY_MAX_CHUNK_BYTES.
+
+    Args:
+        task_type: 'data_processing' or 'text_processing'
+        items: Number of rows (or characters of text)
+        payload_bytes: Approximate size of the input
+        cpus: Free CPUs; read from Ray when omitted (Ray must be initialized)
+
+    Returns:
+        PartitionPlan
+    """
+    estimated = items * item_cost(task_type)
+    if not worth_distributing(task_type, items):
+        return PartitionPlan(False, 1, items, estimated)
+
+    cpus = available_cpus() if cpus is None else cpus
+    chunks = min(estimated / RAY_TARGET_TASK_SECONDS, cpus * RAY_CHUNKS_PER_CPU)
+    chunks = max(chunks, payload_bytes / RAY_MAX_CHUNK_BYTES, 1)
+    chunks = min(int(math.ceil(chunks)), items)
+    return PartitionPlan(True, chunks, int(math.ceil(items / chunks)), estimated)
@@ -2,9 +2,14 @@ import os
 import sys
 import time
 import redis
-from rq import Worker, Queue, Connection
+from rq import Worker, Connection
+from rq.worker import SimpleWorker
 import logging
-from .config import REDIS_URL, RQ_QUEUE_NAME, LOG_LEVEL
+from .config import REDIS_URL, LOG_LEVEL, RAY_WARM_ACTORS, WEBHOOK_QUEUE_NAME
+from .executors import executor_class
+from .notifications import notify_job_done
+from .result_cache import cache_job_result
+from .scheduling import StrideScheduler, record_queue_wait, worker_queues
 
 # Configure logging
 logging.basicConfig(
@@ -13,6 +18,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class NotifyingWorker(Worker):
+    """
+    RQ worker that publishes every job's outcome once RQ has stored it, and
+    caches successful results (see result_cache)
+
+    Hooking the worker (rather than per-job on_success callbacks) covers jobs
+    enqueued through enqueue_many, which cannot carry callbacks.
+    """
+    
+    def handle_job_success(self, job, queue, started_job_registry):
+        super().handle_job_success(job, queue, started_job_registry)
+        if queue.name == WEBHOOK_QUEUE_NAME:
+            return  # a webhook delivery, not a client's job
+        cache_job_result(self.connection, job)
+        notify_job_done(self.connection, job, "finished")
+    
+    def handle_job_failure(self, job, queue, started_job_registry=None, exc_string=''):
+        super().handle_job_failure(job, queue, started_job_registry=started_job_registry,
+                                   exc_string=exc_string)
+        # jobs with retries left are requeued rather than failed
+        status = job.get_status(refresh=False)
+        if status in ("failed", "stopped") and queue.name != WEBHOOK_QUEUE_NAME:
+            notify_job_done(self.connection, job, status)
+
+class FairWorker(NotifyingWorker):
+    """
+    NotifyingWorker that serves its queues in weighted fair order (see
+    scheduling.StrideScheduler) instead of strictly in list order, and
+    records every job's queue wait
+    """
+    
+    def __init__(self, queues, *args, **kwargs):
+        super().__init__(queues, *args, **kwargs)
+        self.stride = StrideScheduler(self.queues)
+        self._ordered_queues = self.stride.order()
+    
+    def reorder_queues(self, reference_queue):
+        self._ordered_queues = self.stride.served(reference_queue)
+    
+    def execute_job(self, job, queue):
+        try:
+            record_queue_wait(self.connection, queue.name, job)
+        except Exception as e:
+            logger.warning(f"Could not record queue wait of job {job.id}: {str(e)}")
+        return super().execute_job(job, queue)
+
+class InProcessWorker(FairWorker, SimpleWorker):
+    """
+    FairWorker that runs jobs in its own process instead of a forked
+    work horse, so a persistent backend's workers (Ray actor pools, the
+    process pool) outlive each job
+    """
+
 def run_worker():
     """
     Start an RQ worker to process jobs from the queue
@@ -28,12 +86,24 @@ def run_worker():
         # Get worker ID or generate one
         worker_id = os.getenv('WORKER_ID', f'worker-{os.getpid()}')
         
-        # Start worker
-        logger.info(f"Starting worker {worker_id} for queue {RQ_QUEUE_NAME}")
+        # Start worker on every priority / job type queue and the webhook queue
+        queues = worker_queues(redis_conn)
+        logger.info(f"Starting worker {worker_id} for queues {', '.join(queue.name for queue in queues)}")
+        
+        # importing ray_cluster registers the ray backend; Ray itself is
+        # only started by the ray backend
+        from . import ray_cluster
+        backend = executor_class()
         
         with Connection(redis_conn):
-            queue = Queue(RQ_QUEUE_NAME)
-            worker = Worker([queue], name=worker_id)
+            if getattr(backend, 'persistent', False):
+                worker = InProcessWorker(queues, name=worker_id)
+                if RAY_WARM_ACTORS:
+                    # Ray must be initialized from the main thread, so this
+                    # happens before the first job is taken
+                    backend("data_processing").warm()
+            else:
+                worker = FairWorker(queues, name=worker_id)
             worker.work(with_scheduler=True)
     
     except Exception as e:
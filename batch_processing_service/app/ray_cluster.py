@@ -1,194 +1,569 @@
+import sys
 import time
+import atexit
 import logging
-import ray
-from . import logger
-from .config import RAY_ADDRESS, RAY_NUM_CPUS
+import threading
+import numpy as np
+from . import logger, redis_conn
+from .actor_pool import ChunkActorPool
+from .config import (
+    RAY_ADDRESS, RAY_NUM_CPUS, RAY_ACTOR_POOL_SIZE, RAY_MAX_IN_FLIGHT, TEXT_SKETCH_SIZE, TEXT_TOP_K
+)
+from .executors import Executor, get_executor, register_executor, shareable_columns
+from .incremental import chunk_digest, load_chunk_results, row_bounds, store_chunk_results, text_bounds
+from .operations import (
+    OPERATIONS, combine_chunks, is_reduction, parse_operation, row_count, row_ranges,
+    run_chunk, run_operation, to_columns
+)
+from .partitioning import available_cpus, plan_partitions, record_item_cost, worth_distributing
+from .sentiment import context_size, lexicon_fingerprint, load_lexicon
+from .text_stats import analyze_text, finalize_text_stats, merge_text_stats, text_chunk_stats
+from .tokenizer import tokenize
 
-# Initialize Ray when this module is imported
-try:
-    ray.init(address=RAY_ADDRESS, num_cpus=RAY_NUM_CPUS, ignore_reinit_error=True)
-    logger.info(f"Ray initialized with {RAY_NUM_CPUS} CPUs")
-except Exception as e:
-    logger.warning(f"Failed to initialize Ray: {str(e)}. Will use local execution.")
+# Ray is imported and initialized lazily, on the first distributed task, so
+# the API process, RQ worker startup and unit tests don't pay for a runtime
+# they may never use.
+_lifecycle_lock = threading.Lock()
+_remote_functions = {}
+_actor_pools = {}
 
-@ray.remote
-def process_data_chunk(chunk, operation=None):
+def _ray():
+    import ray
+    return ray
+
+def is_ray_initialized():
+    """True if this process has a live Ray runtime (never imports Ray itself)."""
+    return 'ray' in sys.modules and sys.modules['ray'].is_initialized()
+
+def init_ray(address=RAY_ADDRESS, num_cpus=RAY_NUM_CPUS):
+    """
+    Start (or connect to) Ray if it isn't running yet
+    
+    Args:
+        address: Ray cluster address, None to start a local instance
+        num_cpus: CPUs for a local instance (ignored when connecting)
+        
+    Returns:
+        True if Ray is available, False if initialization failed
+    """
+    with _lifecycle_lock:
+        if is_ray_initialized():
+            return True
+        try:
+            ray = _ray()
+            if address:
+                ray.init(address=address, ignore_reinit_error=True)
+            else:
+                ray.init(num_cpus=num_cpus, ignore_reinit_error=True)
+            atexit.register(shutdown_ray)
+            logger.info(f"Ray initialized with {RAY_NUM_CPUS} CPUs")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to initialize Ray: {str(e)}. Falling back to local execution.")
+            return False
+
+def shutdown_ray():
+    """Shut down this process's Ray runtime if one was started"""
+    with _lifecycle_lock:
+        if is_ray_initialized():
+            sys.modules['ray'].shutdown()
+            logger.info("Ray shut down")
+        _remote_functions.clear()
+        _actor_pools.clear()
+
+def _remote(fn):
+    """Ray remote handle for fn, created on first use (requires Ray to be initialized)"""
+    handle = _remote_functions.get(fn)
+    if handle is None:
+        handle = _remote_functions[fn] = _ray().remote(fn)
+    return handle
+
+def actor_pool(task_type):
+    """
+    The health-checked actor pool for task_type, started on first use
+    (requires Ray to be initialized)
+    
+    Returns:
+        ChunkActorPool, or None when RAY_ACTOR_POOL_SIZE is 0
+    """
+    if RAY_ACTOR_POOL_SIZE <= 0:
+        return None
+    with _lifecycle_lock:
+        pool = _actor_pools.get(task_type)
+        if pool is None:
+            pool = _actor_pools[task_type] = ChunkActorPool(task_type)
+            logger.info(f"Started {pool.size} {task_type} actors")
+    pool.check_health()
+    return pool
+
+def warm_actor_pools():
+    """Start Ray and the actor pools of both job types ahead of the first job"""
+    if RAY_ACTOR_POOL_SIZE <= 0 or not init_ray():
+        return False
+    start = time.perf_counter()
+    for task_type in ("data_processing", "text_processing"):
+        actor_pool(task_type)
+    logger.info(f"Actor pools warmed in {time.perf_counter() - start:.2f} seconds")
+    return True
+
+def timed_chunk(fn, *args):
     """
-    Ray task for processing a chunk of data
+    Ray task wrapper returning (seconds, fn(*args)), so the driver can learn
+    the per-item compute cost without scheduling or transfer overhead
+    """
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def stream_chunks(submit, chunks, merge, progress=None, max_in_flight=RAY_MAX_IN_FLIGHT):
+    """
+    Run one timed_chunk task per chunk and merge results as they arrive
+    
+    At most max_in_flight tasks are outstanding at a time, so the driver
+    holds only a few unmerged results and a slow chunk doesn't hold up merging
+    of the others.
     
     Args:
-        chunk: A subset of data to process
-        operation: Optional operation name to perform
+        submit: Function chunk -> timed_chunk object ref
+        chunks: Chunk descriptions (e.g. row ranges)
+        merge: Function (index, result) called once per chunk, in completion order
+        progress: Optional function (chunks_done, chunks_total)
+        max_in_flight: Backpressure bound on outstanding tasks
         
     Returns:
-        Processed chunk results
+        Total compute seconds across chunks
     """
-    # Simulate processing work with a small delay
-    time.sleep(0.1 * len(chunk))
+    ray = _ray()
+    max_in_flight = max(1, max_in_flight)
+    pending = {}
+    next_chunk = done = 0
+    compute_seconds = 0.0
+    while next_chunk < len(chunks) or pending:
+        while next_chunk < len(chunks) and len(pending) < max_in_flight:
+            pending[submit(chunks[next_chunk])] = next_chunk
+            next_chunk += 1
+        ready, _ = ray.wait(list(pending), num_returns=1)
+        for ref in ready:
+            seconds, result = ray.get(ref)
+            merge(pending.pop(ref), result)
+            compute_seconds += seconds
+            done += 1
+        if progress:
+            progress(done, len(chunks))
+    return compute_seconds
+
+def merge_timed(merge, a, b):
+    """Ray task merging two timed_chunk results with merge(a, b)"""
+    return a[0] + b[0], merge(a[1], b[1])
+
+def tree_reduce_chunks(submit, chunks, merge, progress=None, max_in_flight=RAY_MAX_IN_FLIGHT):
+    """
+    Run one timed_chunk task per chunk and reduce the results pairwise on Ray
+    
+    Finished results are merged by merge_timed tasks as soon as two are
+    available, so merges run in parallel and the driver only fetches the
+    final state.
     
-    result = {}
-    # Process each item in the chunk
-    for key, value in chunk.items():
-        # This is a simplified simulation - in a real application
-        # we'd have more complex data transformation logic here
-        result[key] = f"Processed {operation if operation else 'standard'}: {value}"
+    Args:
+        submit: Function chunk -> timed_chunk object ref
+        chunks: Chunk descriptions (e.g. byte ranges)
+        merge: Associative, commutative function combining two chunk results
+        progress: Optional function (chunks_done, chunks_total)
+        max_in_flight: Backpressure bound on outstanding chunk tasks
         
-    return result
+    Returns:
+        (reduced result or None when there are no chunks, total compute seconds)
+    """
+    ray = _ray()
+    max_in_flight = max(1, max_in_flight)
+    leaves, pending, ready = set(), set(), []
+    next_chunk = done = 0
+    while next_chunk < len(chunks) or pending or len(ready) > 1:
+        while len(ready) > 1:
+            pending.add(_remote(merge_timed).remote(merge, ready.pop(), ready.pop()))
+        while next_chunk < len(chunks) and len(leaves) < max_in_flight:
+            ref = submit(chunks[next_chunk])
+            leaves.add(ref)
+            pending.add(ref)
+            next_chunk += 1
+        if not pending:
+            continue
+        finished, _ = ray.wait(list(pending), num_returns=1)
+        for ref in finished:
+            pending.discard(ref)
+            ready.append(ref)
+            if ref in leaves:
+                leaves.discard(ref)
+                done += 1
+                if progress:
+                    progress(done, len(chunks))
+    if not ready:
+        return None, 0.0
+    seconds, result = ray.get(ready[0])
+    return result, seconds
 
-@ray.remote
-def process_text_chunk(chunk, operations=None):
+def run_memoized(chunks, digests, run, merge, progress=None):
     """
-    Ray task for processing a chunk of text
+    Merge memoized results for chunks whose digest is in the chunk memo and
+    run only the others, memoizing their results as they arrive
     
     Args:
-        chunk: A substring of text to process
-        operations: List of operations to perform
+        chunks: Chunk descriptions
+        digests: Content digest of each chunk (see incremental.chunk_digest)
+        run: Function (chunks, merge, progress) -> compute seconds, e.g. stream_chunks
+        merge: Function (index, result) called once per chunk
+        progress: Optional function (chunks_done, chunks_total)
         
     Returns:
-        Dictionary with processing results for this chunk
+        (compute seconds, indices of the chunks that were run)
+    """
+    memo = load_chunk_results(redis_conn, digests)
+    todo = [index for index, digest in enumerate(digests) if digest not in memo]
+    for index, digest in enumerate(digests):
+        if digest in memo:
+            merge(index, memo[digest])
+    hits = len(chunks) - len(todo)
+    logger.info(f"{hits} of {len(chunks)} chunks memoized; running {len(todo)}")
+    
+    def merge_new(position, result):
+        index = todo[position]
+        store_chunk_results(redis_conn, {digests[index]: result})
+        merge(index, result)
+    
+    report = None
+    if progress:
+        report = lambda done, total: progress(hits + done, hits + total)
+        report(0, len(todo))
+    compute_seconds = run([chunks[index] for index in todo], merge_new, report) if todo else 0.0
+    return compute_seconds, todo
+
+class RayExecutor(Executor):
+    """
+    Runs chunks on the task type's actor pool, or as stateless Ray tasks when
+    RAY_ACTOR_POOL_SIZE is 0 (see executors.Executor)
     """
-    operations = operations or ['count']
-    results = {}
     
-    # Simulate processing with a small delay
-    time.sleep(0.05)
+    name = "ray"
+    # stateless tasks keep nothing between jobs worth a long-lived process
+    persistent = RAY_ACTOR_POOL_SIZE > 0
+    
+    def __init__(self, task_type):
+        super().__init__(task_type)
+        self._pool = None
+    
+    def available(self):
+        if not init_ray():
+            return False
+        self._pool = actor_pool(self.task_type)
+        return True
+    
+    def warm(self):
+        return warm_actor_pools()
+    
+    def cpus(self):
+        return available_cpus()
+    
+    def share(self, payload):
+        return _ray().put(payload)
     
-    # Count words and characters
-    if 'count' in operations:
-        words = chunk.split()
-        results['word_count'] = len(words)
-        results['char_count'] = len(chunk)
+    def run_chunks(self, call, chunks, merge, progress=None):
+        if self._pool:
+            return self._pool.run_chunks(call, chunks, merge, progress)
+        return stream_chunks(lambda chunk: _remote(timed_chunk).remote(*call(chunk)), chunks, merge, progress)
     
-    # Simple tokenization
-    if 'tokenize' in operations:
-        results['tokens'] = chunk.split()
+    def reduce_chunks(self, call, chunks, merge, progress=None):
+        if self._pool:
+            # results come back from the actors, so they're merged here
+            return super().reduce_chunks(call, chunks, merge, progress)
+        # otherwise reduce pairwise on the cluster
+        return tree_reduce_chunks(lambda chunk: _remote(timed_chunk).remote(*call(chunk)), chunks, merge, progress)
+
+register_executor("ray", RayExecutor)
+
+def process_data_chunk(shared, start, stop, local=None, steps=None):
+    """
+    Chunk task for processing a chunk of data
+    
+    Args:
+        shared: Shareable columns (see executors.shareable_columns), resolved
+            from the executor's shared payload
+        start, stop: Row range of this chunk
+        local: This chunk's slice of the object-dtype columns
+        steps: Parsed operation steps (see operations.parse_operation)
+        
+    Returns:
+        Transformed columns, or a partial state when the last step is a reduction
+    """
+    local = local or {}
+    chunk = {}
+    for name, arr in shared.items():
+        if arr is None:
+            chunk[name] = local[name]
+        elif arr.dtype.kind == "U":
+            # operations see strings as object columns, as in-process
+            chunk[name] = arr[start:stop].astype(object)
+        else:
+            chunk[name] = arr[start:stop]
+    return run_chunk(chunk, steps or [])
+
+# ASCII whitespace never occurs inside a multi-byte UTF-8 sequence, so cutting
+# an encoded text there always leaves valid UTF-8 on both sides
+_WHITESPACE_BYTES = b' \n\t\r\x0b\x0c'
+
+def text_chunk_bounds(raw, chunk_size):
+    """
+    Byte ranges of about chunk_size bytes, cut at whitespace
+    
+    Args:
+        raw: UTF-8 encoded text (bytes)
+        chunk_size: Target chunk size in bytes
         
-    return results
+    Returns:
+        List of (start, stop) byte offsets covering raw
+    """
+    chunk_size = max(1, int(chunk_size))
+    bounds = []
+    start = 0
+    while start < len(raw):
+        end = min(start + chunk_size, len(raw))
+        if end < len(raw):
+            # Back up to the last whitespace in the chunk, if there is one
+            cut = max(raw.rfind(byte, start + 1, end + 1) for byte in _WHITESPACE_BYTES)
+            if cut <= start:
+                # a word longer than the chunk: extend to the whitespace after it
+                limit = min(len(raw), start + 2 * chunk_size)
+                cut = min((i for i in (raw.find(byte, end, limit) for byte in _WHITESPACE_BYTES) if i >= 0),
+                          default=-1)
+            if cut > start:
+                end = cut
+            else:
+                # No whitespace nearby: cut mid-word, but not inside a character
+                # (moving forward if the chunk is smaller than one character)
+                cut = end
+                while cut > start and raw[cut] & 0xC0 == 0x80:
+                    cut -= 1
+                if cut == start:
+                    cut = end
+                    while cut < len(raw) and raw[cut] & 0xC0 == 0x80:
+                        cut += 1
+                end = cut
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+def _context_text(buffer, start, stop, tokens):
+    """
+    Whole words just before start and just after stop in a UTF-8 buffer,
+    at least tokens tokens' worth on each side (less at the ends of the text)
+    """
+    size = len(buffer)
+    window = 64 * max(1, tokens)
+    while True:
+        lo = max(0, start - window)
+        before = buffer[lo:start].tobytes().decode('utf-8', errors='ignore')
+        if lo > 0:
+            # drop the (possibly partial) first word
+            parts = before.split(None, 1)
+            before = parts[1] if len(parts) > 1 else ""
+        if lo == 0 or len(tokenize(before)) >= tokens:
+            break
+        window *= 2
+    window = 64 * max(1, tokens)
+    while True:
+        hi = min(size, stop + window)
+        after = buffer[stop:hi].tobytes().decode('utf-8', errors='ignore')
+        if hi < size:
+            # drop the (possibly partial) last word
+            parts = after.rsplit(None, 1)
+            after = parts[0] if len(parts) > 1 else ""
+        if hi == size or len(tokenize(after)) >= tokens:
+            break
+        window *= 2
+    return before, after
+
+def process_text_range(buffer, start, stop, index, operations, approximate=False):
+    """
+    Chunk task: text statistics for a byte range of a shared text
+    
+    Args:
+        buffer: UTF-8 text as a NumPy uint8 array (zero-copy from the executor's shared payload)
+        start, stop: Byte range of this chunk
+        index: Chunk number, for ordering the token sample
+        operations: List of operations to perform
+        approximate: Use sketches instead of exact counts
+        
+    Returns:
+        Mergeable state (see text_stats.merge_text_stats)
+    """
+    text = buffer[start:stop].tobytes().decode('utf-8')
+    before = after = ""
+    if 'sentiment' in operations:
+        # neighbouring words decide negation and phrases at the chunk edges
+        before, after = _context_text(buffer, start, stop, context_size(load_lexicon()))
+    return text_chunk_stats(text, operations, index, approximate, before=before, after=after)
+
+def _sentiment_context(raw, start, stop, operations):
+    """
+    The context tokens a chunk's sentiment counts depend on, as two strings
+    (empty unless sentiment is requested), for digesting the chunk
+    """
+    if 'sentiment' not in operations:
+        return "", ""
+    context = context_size(load_lexicon())
+    before, after = _context_text(np.frombuffer(raw, dtype=np.uint8), start, stop, context)
+    return " ".join(tokenize(before)[-context:]), " ".join(tokenize(after)[:context])
 
 def run_distributed_task(task_type, data, **kwargs):
     """
-    Run a task distributed across Ray workers
+    Run a task in chunks on an execution backend (see app/executors.py)
     
     Args:
         task_type: Type of task ('data_processing' or 'text_processing')
         data: The data to process
-        **kwargs: Additional task-specific parameters
+        **kwargs: Additional task-specific parameters; backend picks the
+            executor (default EXECUTOR_BACKEND)
         
     Returns:
         Dictionary with combined results from all workers
+    
+    Raises:
+        Whatever a chunk or the backend raised, so the job reports status
+        "error" like the in-process path (and its result isn't cached)
     """
-    if not ray.is_initialized():
-        try:
-            ray.init(address=RAY_ADDRESS, num_cpus=RAY_NUM_CPUS, ignore_reinit_error=True)
-            logger.info(f"Ray initialized with {RAY_NUM_CPUS} CPUs")
-        except Exception as e:
-            logger.error(f"Failed to initialize Ray: {str(e)}. Falling back to local execution.")
-            # Provide a minimal fallback implementation based on task type
-            if task_type == "data_processing":
-                result = {}
-                for key, value in data.items():
-                    result[key] = f"Locally processed: {value}"
-                return result
-            elif task_type == "text_processing":
-                operations = kwargs.get('operations', ['count'])
-                result = {}
-                if 'count' in operations:
-                    words = data.split()
-                    result['word_count'] = len(words)
-                    result['char_count'] = len(data)
-                if 'tokenize' in operations:
-                    result['tokens'] = data.split()[:100]
-                return result
+    if task_type == "data_processing":
+        items, chunk_size = row_count(data), kwargs.get('batch_size')
+    else:
+        items, chunk_size = len(data), kwargs.get('chunk_size')
+    run_local = not chunk_size and not worth_distributing(task_type, items)
+    if run_local:
+        logger.info(f"{items} items are below the distribution threshold; running in-process")
+        if task_type == "data_processing":
+            return run_operation(data, kwargs.get('operation'))
+        elif task_type == "text_processing":
+            return analyze_text(data, kwargs.get('operations', ['count']),
+                                kwargs.get('top_k', TEXT_TOP_K), kwargs.get('approximate', False))
     
+    handle = None
     try:
         start_time = time.time()
+        executor = get_executor(kwargs.get('backend'), task_type)
+        incremental = kwargs.get('incremental', False)
         
         if task_type == "data_processing":
-            # For data processing, we partition the dictionary
-            batch_size = kwargs.get('batch_size', 10)
+            # For data processing, we split the columns into row ranges
+            steps = parse_operation(kwargs.get('operation'))
+            columns, keyed = to_columns(data)
+            if not chunk_size:
+                plan = plan_partitions(task_type, items, sum(arr.nbytes for arr in columns.values()),
+                                       cpus=executor.cpus())
+                chunk_size = plan.chunk_size
+            if incremental:
+                # cut where the keys say so, so an edit only changes nearby chunks
+                chunks = row_bounds(columns, keyed, chunk_size)
+            else:
+                chunks = row_ranges(items, chunk_size)
+            
+            # Columns are shared once; tasks read their row range
+            shared, local = shareable_columns(columns)
+            handle = executor.share(shared)
             
-            # Divide data into chunks
-            chunks = []
-            current_chunk = {}
-            for i, (key, value) in enumerate(data.items()):
-                current_chunk[key] = value
-                if (i + 1) % batch_size == 0:
-                    chunks.append(current_chunk)
-                    current_chunk = {}
+            # Process chunks in parallel; reductions come back as partial
+            # states and are folded in as they arrive
+            logger.info(f"Submitting {len(chunks)} data chunks to the {executor.name} backend")
+            reduction = bool(steps) and is_reduction(steps[-1])
+            outputs = [None] * (1 if reduction else len(chunks))
             
-            # Add any remaining items
-            if current_chunk:
-                chunks.append(current_chunk)
+            def merge_data(index, output):
+                if not reduction:
+                    outputs[index] = output
+                elif outputs[0] is None:
+                    outputs[0] = output
+                else:
+                    outputs[0] = OPERATIONS[steps[-1]["type"]].merge(outputs[0], output)
             
-            # Process chunks in parallel
-            operation = kwargs.get('operation')
-            logger.info(f"Submitting {len(chunks)} data chunks to Ray cluster")
-            futures = [process_data_chunk.remote(chunk, operation) for chunk in chunks]
-            chunk_results = ray.get(futures)
+            def call(bounds):
+                return (process_data_chunk, handle, bounds[0], bounds[1],
+                        {name: arr[bounds[0]:bounds[1]] for name, arr in local.items()}, steps)
             
-            # Combine results from all chunks
-            result = {}
-            for chunk_result in chunk_results:
-                result.update(chunk_result)
+            if incremental:
+                context = {"steps": steps, "keyed": keyed, "columns": list(columns)}
+                digests = [chunk_digest(context, *(arr[start:stop] for arr in columns.values()))
+                           for start, stop in chunks]
+                compute_seconds, ran = run_memoized(
+                    chunks, digests, lambda chunks, merge, progress: executor.run_chunks(call, chunks, merge, progress),
+                    merge_data, kwargs.get('progress')
+                )
+                processed = sum(chunks[index][1] - chunks[index][0] for index in ran)
+            else:
+                compute_seconds = executor.run_chunks(call, chunks, merge_data, kwargs.get('progress'))
+                processed = items
+            result = combine_chunks(outputs, steps, keyed)
             
         elif task_type == "text_processing":
             # For text processing, we split the text into chunks
             text = data
-            chunk_size = kwargs.get('chunk_size', 1000)  # Default 1000 characters per chunk
+            if not chunk_size:
+                # chunk_size is in bytes of UTF-8 text
+                chunk_size = plan_partitions(task_type, items, len(text), cpus=executor.cpus()).chunk_size
             operations = kwargs.get('operations', ['count'])
             
-            # Split text into chunks of approximately chunk_size
-            if len(text) <= chunk_size:
-                text_chunks = [text]
-            else:
-                # Split at whitespace boundaries around the chunk_size
-                text_chunks = []
-                start = 0
-                while start < len(text):
-                    end = min(start + chunk_size, len(text))
-                    # If we're not at the end and not at a whitespace, back up to find whitespace
-                    if end < len(text) and not text[end].isspace():
-                        # Find previous whitespace
-                        while end > start and not text[end].isspace():
-                            end -= 1
-                        # If we backed up all the way to start, just use the original end
-                        if end == start:
-                            end = min(start + chunk_size, len(text))
-                    
-                    text_chunks.append(text[start:end])
-                    start = end
+            # The encoded text is shared once; tasks decode only their own
+            # byte range
+            raw = text.encode('utf-8')
+            bounds = text_bounds(raw, chunk_size) if incremental else text_chunk_bounds(raw, chunk_size)
+            chunks = [(index, start, stop) for index, (start, stop) in enumerate(bounds)]
+            handle = executor.share(np.frombuffer(raw, dtype=np.uint8))
             
-            # Process chunks in parallel
-            logger.info(f"Submitting {len(text_chunks)} text chunks to Ray cluster")
-            futures = [process_text_chunk.remote(chunk, operations) for chunk in text_chunks]
-            chunk_results = ray.get(futures)
+            # Map each chunk to a small statistics state and reduce the states
+            logger.info(f"Submitting {len(chunks)} text chunks to the {executor.name} backend")
+            approximate = kwargs.get('approximate', False)
             
-            # Combine results from all chunks
-            if 'count' in operations:
-                word_count = sum(cr.get('word_count', 0) for cr in chunk_results)
-                char_count = sum(cr.get('char_count', 0) for cr in chunk_results)
-                result = {
-                    'word_count': word_count,
-                    'char_count': char_count,
-                }
+            def call(chunk):
+                return process_text_range, handle, chunk[1], chunk[2], chunk[0], operations, approximate
             
-            if 'tokenize' in operations:
-                all_tokens = []
-                for cr in chunk_results:
-                    if 'tokens' in cr:
-                        all_tokens.extend(cr['tokens'])
-                # Limit the number of tokens returned to avoid huge responses
-                result['tokens'] = all_tokens[:100]
-                result['unique_tokens'] = list(set(all_tokens))[:100]
+            if incremental:
+                # chunk states are memoized, so they come back and are merged here
+                merged = [None]
+                
+                def merge_state(index, chunk_state):
+                    # a memoized state may come from another position in another text
+                    chunk_state = dict(chunk_state, sample=[(index, tokens) for _, tokens in chunk_state["sample"]])
+                    merged[0] = chunk_state if merged[0] is None else merge_text_stats(merged[0], chunk_state)
+                
+                context = {"operations": sorted(operations), "approximate": approximate, "sketch_size": TEXT_SKETCH_SIZE}
+                if 'sentiment' in operations:
+                    context["lexicon"] = lexicon_fingerprint()
+                digests = [chunk_digest(
+                    context,
+                    *_sentiment_context(raw, start, stop, operations), raw[start:stop]
+                ) for _, start, stop in chunks]
+                compute_seconds, ran = run_memoized(
+                    chunks, digests, lambda chunks, merge, progress: executor.run_chunks(call, chunks, merge, progress),
+                    merge_state, kwargs.get('progress')
+                )
+                state = merged[0]
+                processed = round(items * sum(chunks[index][2] - chunks[index][1] for index in ran) / max(1, len(raw)))
+            else:
+                state, compute_seconds = executor.reduce_chunks(call, chunks, merge_text_stats, kwargs.get('progress'))
+                processed = items
+            del raw
+            if state is None:
+                state = text_chunk_stats("", operations, approximate=approximate)
+            result = finalize_text_stats(state, operations, kwargs.get('top_k', TEXT_TOP_K))
             
         else:
             raise ValueError(f"Unsupported task type: {task_type}")
         
         processing_time = time.time() - start_time
-        logger.info(f"Ray distributed processing completed in {processing_time:.2f} seconds")
+        logger.info(f"{executor.name} processing of {len(chunks)} chunks completed in {processing_time:.2f} seconds")
+        if processed:
+            record_item_cost(task_type, processed, compute_seconds)
         
         return result
     
     except Exception as e:
-        logger.error(f"Error in Ray distributed task: {str(e)}")
-        return {"error": str(e)}
+        logger.error(f"Error in distributed task: {str(e)}")
+        raise
+    finally:
+        if handle is not None:
+            executor.release(handle)
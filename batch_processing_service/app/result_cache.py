@@ -0,0 +1,194 @@
+"""
+Content-addressed cache of job results
+
+A job's cache key is the SHA-256 of its job_type, data and the options that
+affect the result, serialized as canonical JSON (sorted keys, defaults
+filled in), so a resubmitted payload maps to the same key however it is
+formatted. Sentiment results also depend on the lexicon, so its fingerprint
+is part of the key. Results are stored in Redis:
+
+    batch:result:<key>     - JSON result, expiring after RESULT_CACHE_TTL
+    batch:result:lru       - sorted set of keys by last use, used to evict the
+                             least recently used entries past RESULT_CACHE_MAX_ENTRIES
+    batch:result:stats     - hits, misses, stores and evictions counters
+
+/enqueue answers cache hits directly; the worker stores the results of
+successful jobs under the key their enqueue put in job.meta['cache_key'].
+"""
+import json
+import time
+import hashlib
+from . import logger
+from .config import (
+    RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, TEXT_TOP_K
+)
+from .sentiment import lexicon_fingerprint
+
+RESULT_KEY_PREFIX = 'batch:result:'
+LRU_KEY = 'batch:result:lru'
+STATS_KEY = 'batch:result:stats'
+
+# Options that change how a job runs but not what it returns
+NON_RESULT_OPTIONS = frozenset(["use_ray", "batch_size", "chunk_size", "webhook_url", "cache", "incremental",
+                                "backend", "priority"])
+
+# Defaults filled in before hashing, so omitting an option and passing its
+# default value hit the same entry
+RESULT_OPTION_DEFAULTS = {
+    "data_processing": {"operation": None},
+    "text_processing": {"operations": ["count", "tokenize"], "top_k": TEXT_TOP_K, "approximate": False},
+}
+
+# Approximate text statistics keep only the top TEXT_SKETCH_SIZE tokens per
+# chunk, so with approximate set the chunking options change the result too
+CHUNKING_OPTION_DEFAULTS = {"use_ray": True, "chunk_size": None, "backend": None, "incremental": False}
+
+def cache_enabled(options):
+    """True unless caching is disabled globally or by options['cache'] = false"""
+    return RESULT_CACHE_TTL > 0 and RESULT_CACHE_MAX_ENTRIES > 0 and options.get('cache', True)
+
+def cache_lookup_enabled(options):
+    """
+    True if a submission may be answered from the cache. A job with a
+    webhook_url always runs, so it gets a job ID and its callback; its result
+    is still cached for others.
+    """
+    return cache_enabled(options) and not options.get('webhook_url')
+
+def cache_key(job_type, data, options):
+    """Stable hash of everything that determines a job's result"""
+    result_options = dict(RESULT_OPTION_DEFAULTS.get(job_type, {}))
+    result_options.update((k, v) for k, v in options.items() if k not in NON_RESULT_OPTIONS)
+    if job_type == "text_processing":
+        if result_options["approximate"]:
+            result_options.update(CHUNKING_OPTION_DEFAULTS)
+            result_options.update((k, v) for k, v in options.items() if k in CHUNKING_OPTION_DEFAULTS)
+        operations = result_options["operations"]
+        if isinstance(operations, list) and "sentiment" in operations:
+            result_options["lexicon"] = lexicon_fingerprint()
+    payload = json.dumps([job_type, data, result_options], sort_keys=True,
+                         separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def lru_get_many(connection, prefix, lru_key, keys):
+    """
+    Read prefix+key values in one pipeline, marking the found keys as
+    recently used in the lru_key sorted set
+
+    Returns:
+        List of raw values (None when missing), in the order of keys
+    """
+    if not keys:
+        return []
+    with connection.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.get(prefix + key)
+        values = pipe.execute()
+    found = [key for key, value in zip(keys, values) if value is not None]
+    if found:
+        # XX: don't re-add keys that were evicted meanwhile
+        connection.zadd(lru_key, {key: time.time() for key in found}, xx=True)
+    return values
+
+def lru_put_many(connection, prefix, lru_key, items, ttl, max_entries):
+    """
+    Store {key: value} with a TTL, then evict the least recently used keys
+    beyond max_entries
+
+    Returns:
+        Number of evicted entries
+    """
+    if not items:
+        return 0
+    now = time.time()
+    with connection.pipeline(transaction=False) as pipe:
+        for key, value in items.items():
+            pipe.set(prefix + key, value, ex=ttl)
+        pipe.zadd(lru_key, {key: now for key in items})
+        # entries not used for a whole TTL have expired
+        pipe.zremrangebyscore(lru_key, '-inf', now - ttl)
+        pipe.zcard(lru_key)
+        entries = pipe.execute()[-1]
+    overflow = entries - max_entries
+    if overflow <= 0:
+        return 0
+    evicted = [member for member, _ in connection.zpopmin(lru_key, overflow)]
+    if evicted:
+        connection.delete(*(prefix + member.decode() for member in evicted))
+    return len(evicted)
+
+def get_cached_many(connection, keys):
+    """
+    Look up cached results in one pipeline, marking hits as recently used
+
+    Returns:
+        List of results (None for misses), in the order of keys
+    """
+    if not keys:
+        return []
+    values = lru_get_many(connection, RESULT_KEY_PREFIX, LRU_KEY, keys)
+    results = [json.loads(value) if value is not None else None for value in values]
+    hits = sum(result is not None for result in results)
+    with connection.pipeline(transaction=False) as pipe:
+        if hits:
+            pipe.hincrby(STATS_KEY, 'hits', hits)
+        if hits < len(keys):
+            pipe.hincrby(STATS_KEY, 'misses', len(keys) - hits)
+        pipe.execute()
+    return results
+
+def get_cached(connection, key):
+    """Cached result for key, or None"""
+    return get_cached_many(connection, [key])[0]
+
+def store_result(connection, key, result):
+    """
+    Cache a job result, evicting least recently used entries past the bound
+
+    Returns:
+        True if the result was stored
+    """
+    payload = json.dumps(result)
+    if len(payload) > RESULT_CACHE_MAX_BYTES:
+        logger.info(f"Result for cache key {key} is {len(payload)} bytes; not caching")
+        return False
+    evicted = lru_put_many(connection, RESULT_KEY_PREFIX, LRU_KEY, {key: payload},
+                           RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES)
+    with connection.pipeline(transaction=False) as pipe:
+        pipe.hincrby(STATS_KEY, 'stores', 1)
+        if evicted:
+            pipe.hincrby(STATS_KEY, 'evictions', evicted)
+        pipe.execute()
+    return True
+
+def cache_job_result(connection, job):
+    """Store a finished job's result if its enqueue asked for caching and it succeeded"""
+    key = job.meta.get('cache_key')
+    result = job.result
+    if not key or not isinstance(result, dict) or result.get('status') != 'success':
+        return False
+    results = result.get('results')
+    if isinstance(results, dict) and 'error' in results:
+        # a failure reported inside a "success" wrapper; never serve it again
+        logger.warning(f"Not caching result of job {job.id}: {results['error']}")
+        return False
+    try:
+        return store_result(connection, key, result)
+    except Exception as e:
+        logger.warning(f"Could not cache result of job {job.id}: {str(e)}")
+        return False
+
+def cache_stats(connection):
+    """Hit-rate metrics and size of the result cache"""
+    with connection.pipeline(transaction=False) as pipe:
+        pipe.hgetall(STATS_KEY)
+        pipe.zcard(LRU_KEY)
+        counters, entries = pipe.execute()
+    stats = {name: int(counters.get(name.encode(), 0))
+             for name in ('hits', 'misses', 'stores', 'evictions')}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    stats['entries'] = entries
+    stats['max_entries'] = RESULT_CACHE_MAX_ENTRIES
+    stats['ttl'] = RESULT_CACHE_TTL
+    return stats
@@ -0,0 +1,192 @@
+"""
+Priority queues, weighted fair scheduling and queue-wait SLO metrics
+
+Jobs are routed to one RQ queue per priority and job type:
+
+    <RQ_QUEUE_NAME>:<priority>:<job_type>    e.g. batch_processing:high:text_processing
+
+The priority is options['priority'] ("high", "normal" or "low"). Without it,
+jobs of at most PRIORITY_SMALL_ITEMS items (rows, or characters of text)
+are high, jobs of PRIORITY_LARGE_ITEMS or more are low, and the rest are normal.
+
+Workers listen on every queue (plus RQ_QUEUE_NAME itself, for jobs enqueued
+before priorities existed, and WEBHOOK_QUEUE_NAME at low weight) and choose between them by stride scheduling.
+Each queue has a virtual time that advances by 1 / weight whenever a job is
+taken from it, and the worker polls the queues in order of virtual time.
+Under a backlog, queues are therefore served in proportion to their
+PRIORITY_WEIGHTS: no queue starves, and a burst of large data jobs can't hold
+up small text jobs. A queue that was empty catches up to the current virtual
+time rather than banking credit.
+
+Workers also record each job's queue wait (enqueue to start) per queue:
+
+    batch:queue_wait:<queue>   - the last QUEUE_WAIT_SAMPLES waits in seconds
+    batch:queue_wait:stats     - <queue>:jobs and <queue>:slo_missed counters
+
+GET /queues/stats turns these into p50/p95/p99 waits against QUEUE_WAIT_SLO.
+"""
+import math
+from rq import Queue
+from rq.utils import utcnow
+from .config import (
+    RQ_QUEUE_NAME, WEBHOOK_QUEUE_NAME, PRIORITY_WEIGHTS, PRIORITY_SMALL_ITEMS, PRIORITY_LARGE_ITEMS,
+    QUEUE_WAIT_SLO, QUEUE_WAIT_SAMPLES
+)
+from .operations import row_count
+
+PRIORITIES = ("high", "normal", "low")
+JOB_TYPES = ("data_processing", "text_processing")
+DEFAULT_PRIORITY = "normal"
+QUEUE_WAIT_PREFIX = 'batch:queue_wait:'
+QUEUE_WAIT_STATS_KEY = 'batch:queue_wait:stats'
+
+def parse_priority_map(value):
+    """'high:6,normal:3,low:1' -> {"high": 6.0, "normal": 3.0, "low": 1.0}"""
+    mapping = {}
+    for pair in value.split(','):
+        name, _, number = pair.partition(':')
+        mapping[name.strip()] = float(number)
+    missing = set(PRIORITIES) - set(mapping)
+    if missing:
+        raise ValueError(f"No value for priorities {sorted(missing)} in {value!r}")
+    return mapping
+
+WEIGHTS = parse_priority_map(PRIORITY_WEIGHTS)
+WAIT_SLO = parse_priority_map(QUEUE_WAIT_SLO)
+
+def queue_name(priority, job_type):
+    return f"{RQ_QUEUE_NAME}:{priority}:{job_type}"
+
+def queue_priority(name):
+    """
+    Priority of a queue name; the legacy RQ_QUEUE_NAME queue counts as normal
+    and webhook deliveries as low
+    """
+    if name == WEBHOOK_QUEUE_NAME:
+        return "low"
+    parts = name.rsplit(':', 2)
+    return parts[1] if len(parts) == 3 and parts[1] in PRIORITIES else DEFAULT_PRIORITY
+
+def queue_weight(name):
+    return WEIGHTS[queue_priority(name)]
+
+def queue_names():
+    """Every queue workers listen on, highest priority first"""
+    return [queue_name(priority, job_type) for priority in PRIORITIES for job_type in JOB_TYPES] + [RQ_QUEUE_NAME]
+
+def job_queues(connection=None):
+    """Queue objects for queue_names()"""
+    return [Queue(name, connection=connection) for name in queue_names()]
+
+def worker_queues(connection=None):
+    """Everything a worker serves: the job queues, then the webhook deliveries"""
+    return job_queues(connection) + [Queue(WEBHOOK_QUEUE_NAME, connection=connection)]
+
+def job_priority(job_type, job_data, options):
+    """
+    options['priority'], else a priority from the payload size
+
+    Raises:
+        ValueError for an unknown priority
+    """
+    priority = options.get('priority')
+    if priority is not None:
+        if priority not in PRIORITIES:
+            raise ValueError(f"options.priority must be one of {list(PRIORITIES)}")
+        return priority
+    items = len(job_data) if job_type == "text_processing" else row_count(job_data)
+    if items <= PRIORITY_SMALL_ITEMS:
+        return "high"
+    if items >= PRIORITY_LARGE_ITEMS:
+        return "low"
+    return DEFAULT_PRIORITY
+
+class StrideScheduler:
+    """
+    Orders queues for a worker's next dequeue by weighted virtual time
+
+    Args:
+        queues: The worker's queues
+        weight: Function queue name -> weight
+    """
+
+    def __init__(self, queues, weight=queue_weight):
+        self.queues = list(queues)
+        self.weight = weight
+        self.virtual_time = {queue.name: 0.0 for queue in self.queues}
+
+    def order(self):
+        # ties: heavier queues first
+        return sorted(self.queues, key=lambda queue: (self.virtual_time[queue.name], -self.weight(queue.name)))
+
+    def served(self, queue):
+        """Advance queue's virtual time after a job was taken from it; returns the new order"""
+        now = self.virtual_time[queue.name]
+        for name, virtual_time in self.virtual_time.items():
+            # queues polled before this one were empty: no credit for idling
+            if virtual_time < now:
+                self.virtual_time[name] = now
+        self.virtual_time[queue.name] = now + 1.0 / self.weight(queue.name)
+        return self.order()
+
+def record_queue_wait(connection, queue_name, job):
+    """Record how long job waited in queue_name before a worker took it"""
+    if job.enqueued_at is None:
+        return None
+    # RQ stores naive UTC datetimes
+    wait = max(0.0, (utcnow() - job.enqueued_at).total_seconds())
+    key = QUEUE_WAIT_PREFIX + queue_name
+    with connection.pipeline(transaction=False) as pipe:
+        pipe.lpush(key, f"{wait:.6f}")
+        pipe.ltrim(key, 0, QUEUE_WAIT_SAMPLES - 1)
+        pipe.hincrby(QUEUE_WAIT_STATS_KEY, f"{queue_name}:jobs", 1)
+        if wait > WAIT_SLO[queue_priority(queue_name)]:
+            pipe.hincrby(QUEUE_WAIT_STATS_KEY, f"{queue_name}:slo_missed", 1)
+        pipe.execute()
+    return wait
+
+def _percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def queue_stats(connection):
+    """
+    Per-queue backlog, weight and queue-wait percentiles against the SLO
+
+    Percentiles and slo_met cover the last QUEUE_WAIT_SAMPLES jobs of each
+    queue; jobs and slo_missed count every job since the stats were reset.
+    """
+    names = queue_names()
+    with connection.pipeline(transaction=False) as pipe:
+        for name in names:
+            pipe.llen(Queue.redis_queue_namespace_prefix + name)
+            pipe.lrange(QUEUE_WAIT_PREFIX + name, 0, -1)
+        pipe.hgetall(QUEUE_WAIT_STATS_KEY)
+        *replies, counters = pipe.execute()
+    stats = []
+    for index, name in enumerate(names):
+        queued, samples = replies[2 * index], replies[2 * index + 1]
+        waits = sorted(float(sample) for sample in samples)
+        priority = queue_priority(name)
+        slo = WAIT_SLO[priority]
+        stats.append({
+            "queue": name,
+            "priority": priority,
+            "weight": queue_weight(name),
+            "queued": queued,
+            "jobs": int(counters.get(f"{name}:jobs".encode(), 0)),
+            "slo_seconds": slo,
+            "slo_missed": int(counters.get(f"{name}:slo_missed".encode(), 0)),
+            "wait_seconds": {
+                "samples": len(waits),
+                "p50": _percentile(waits, 0.50),
+                "p95": _percentile(waits, 0.95),
+                "p99": _percentile(waits, 0.99),
+                "max": waits[-1] if waits else None,
+            },
+            "slo_met": sum(wait <= slo for wait in waits) / len(waits) if waits else None,
+        })
+    return stats
@@ -0,0 +1,149 @@
+"""
+Lexicon-based sentiment for text_processing jobs
+
+A lexicon is a set of positive and a set of negative entries; an entry is a
+word or a phrase of up to a few words (an n-gram). They are compiled into a
+word -> polarity and a token tuple -> polarity mapping, plus a frozenset of
+the tokens worth looking at. At each token position the longest matching phrase counts;
+words inside a matched phrase don't count again on their own. A match is
+flipped when a negation ("not", "never", "don't", ...) occurs within
+NEGATION_WINDOW tokens before it in the same clause.
+
+Every decision looks at most context_size() tokens around a position, so a
+chunk scored with that much context from its neighbours counts exactly what
+the same positions count in a pass over the whole text.
+
+The built-in lexicon is replaced by a JSON file at SENTIMENT_LEXICON_PATH:
+
+    {"positive": ["good", "well done"], "negative": ["bad", "waste of time"]}
+"""
+import json
+import hashlib
+import functools
+from collections import namedtuple
+from .config import SENTIMENT_LEXICON_PATH
+from .tokenizer import CLAUSE_PUNCTUATION, tokenize
+
+NEGATIONS = frozenset(["not", "no", "never", "nothing", "nobody", "none", "neither", "nor",
+                       "cannot", "without", "hardly"])
+NEGATION_WINDOW = 3  # tokens after a negation that it applies to
+
+DEFAULT_LEXICON = {
+    "positive": [
+        "good", "great", "excellent", "best", "happy", "love", "wonderful", "amazing",
+        "fantastic", "nice", "perfect", "awesome", "pleased", "enjoy", "recommend",
+        "well done", "works great", "highly recommend",
+    ],
+    "negative": [
+        "bad", "worst", "poor", "terrible", "sad", "hate", "awful", "horrible",
+        "disappointing", "broken", "useless", "angry", "annoying",
+        "waste of time", "let down", "not worth",
+    ],
+}
+
+# words: word -> "positive"/"negative"; phrases: token tuple -> polarity for
+# multi-word entries, which can only start with a token in phrase_starts;
+# triggers: tokens that can start a match, end a clause or negate, so every
+# other token is skipped with a single set lookup
+Lexicon = namedtuple("Lexicon", ["words", "phrases", "phrase_starts", "max_ngram", "triggers"])
+
+def compile_lexicon(entries):
+    """
+    Build a Lexicon from {"positive": [...], "negative": [...]}
+
+    Entries are tokenized like the text, so "Well-done!" matches "well done".
+
+    Raises:
+        ValueError if an entry is empty or in both lists
+    """
+    polarity = {}
+    for name in ("positive", "negative"):
+        phrases = set()
+        for entry in entries.get(name, []):
+            phrase = tuple(token for token in tokenize(entry) if token not in CLAUSE_PUNCTUATION)
+            if not phrase:
+                raise ValueError(f"Empty {name} lexicon entry: {entry!r}")
+            phrases.add(phrase)
+        polarity[name] = frozenset(phrases)
+    overlap = polarity["positive"] & polarity["negative"]
+    if overlap:
+        raise ValueError(f"Lexicon entries are both positive and negative: {sorted(overlap)}")
+    entries = {phrase: name for name, phrases in polarity.items() for phrase in phrases}
+    words = {phrase[0]: name for phrase, name in entries.items() if len(phrase) == 1}
+    phrases = {phrase: name for phrase, name in entries.items() if len(phrase) > 1}
+    phrase_starts = frozenset(phrase[0] for phrase in phrases)
+    max_ngram = max((len(phrase) for phrase in entries), default=1)
+    triggers = frozenset(words) | phrase_starts | NEGATIONS | CLAUSE_PUNCTUATION
+    return Lexicon(words, phrases, phrase_starts, max_ngram, triggers)
+
+@functools.lru_cache(maxsize=None)
+def load_lexicon(path=SENTIMENT_LEXICON_PATH):
+    """The configured lexicon, compiled once per process"""
+    if not path:
+        return compile_lexicon(DEFAULT_LEXICON)
+    with open(path) as f:
+        return compile_lexicon(json.load(f))
+
+@functools.lru_cache(maxsize=None)
+def lexicon_fingerprint(path=SENTIMENT_LEXICON_PATH):
+    """Short digest of the configured lexicon, for cache keys of sentiment results"""
+    lexicon = load_lexicon(path)
+    entries = sorted([[word], polarity] for word, polarity in lexicon.words.items())
+    entries += sorted([list(phrase), polarity] for phrase, polarity in lexicon.phrases.items())
+    return hashlib.sha256(json.dumps(entries).encode('utf-8')).hexdigest()[:16]
+
+def context_size(lexicon):
+    """Tokens of context needed on each side of a chunk"""
+    return max(NEGATION_WINDOW, lexicon.max_ngram - 1)
+
+def is_negation(token):
+    return token in NEGATIONS or token.endswith("n't")
+
+def score_tokens(tokens, lexicon, start=0, stop=None):
+    """
+    Count sentiment matches starting at positions start..stop of tokens
+
+    Tokens outside that range are context: they affect matching and negation
+    but aren't counted.
+
+    Returns:
+        {"positive": n, "negative": n, "negated": n}
+    """
+    stop = len(tokens) if stop is None else stop
+    counts = {"positive": 0, "negative": 0, "negated": 0}
+    words, phrases, phrase_starts, triggers = lexicon.words, lexicon.phrases, lexicon.phrase_starts, lexicon.triggers
+    last_negation = last_clause_end = -1
+    covered_until = 0  # positions before this are inside a matched phrase
+    lo = max(0, start - context_size(lexicon))
+    # only positions that can match, end a clause or negate matter
+    candidates = [i for i, token in enumerate(tokens[lo:stop], lo) if token in triggers or "'" in token]
+    for i in candidates:
+        token = tokens[i]
+        if token in CLAUSE_PUNCTUATION:
+            last_clause_end = i
+            continue
+        # longest phrase starting here, else the word on its own
+        label = None
+        if token in phrase_starts:
+            for n in range(min(lexicon.max_ngram, len(tokens) - i), 1, -1):
+                label = phrases.get(tuple(tokens[i:i + n]))
+                if label:
+                    covered_until = max(covered_until, i + n)
+                    break
+        if label is None and i >= covered_until:
+            label = words.get(token)
+        if label and i >= start:
+            if last_negation > last_clause_end and i - last_negation <= NEGATION_WINDOW:
+                label = "negative" if label == "positive" else "positive"
+                counts["negated"] += 1
+            counts[label] += 1
+        if is_negation(token):
+            last_negation = i
+    return counts
+
+def sentiment_label(counts):
+    if counts["positive"] > counts["negative"]:
+        return "positive"
+    if counts["negative"] > counts["positive"]:
+        return "negative"
+    return "neutral"
@@ -1,8 +1,46 @@
 import time
 import json
 import logging
+from rq import get_current_job
 from . import logger
+from .config import PROGRESS_INTERVAL
+from .operations import row_count, run_operation
+from .partitioning import record_item_cost, worth_distributing
 from .ray_cluster import run_distributed_task
+from .text_stats import analyze_text, text_settings
+
+def progress_reporter(interval=PROGRESS_INTERVAL):
+    """
+    Progress callback for run_distributed_task
+    
+    Records {"chunks_done", "chunks_total", "percent"} in the current RQ job's
+    meta, which GET /job/<job_id> reports. Writes are throttled to one per
+    interval seconds, except for the last chunk.
+    
+    Returns:
+        Function (chunks_done, chunks_total), or None outside an RQ job
+    """
+    job = get_current_job()
+    if job is None:
+        return None
+    last_saved = [0.0]
+    
+    def report(done, total):
+        now = time.monotonic()
+        if done < total and now - last_saved[0] < interval:
+            return
+        last_saved[0] = now
+        job.meta['progress'] = {
+            "chunks_done": done,
+            "chunks_total": total,
+            "percent": round(100.0 * done / total, 1) if total else 100.0,
+        }
+        try:
+            job.save_meta()
+        except Exception as e:
+            logger.warning(f"Could not save progress for job {job.id}: {str(e)}")
+    
+    return report
 
 def process_data(data, options=None):
     """
@@ -19,8 +57,9 @@ def process_data(data, options=None):
     options = options or {}
     
     # Extract processing parameters
-    batch_size = options.get('batch_size', 10)
+    batch_size = options.get('batch_size')  # None: sized by the adaptive partitioner
     use_ray = options.get('use_ray', True)
+    operation = options.get('operation')
     
     try:
         # Simulate some initial data validation/preprocessing
@@ -29,26 +68,28 @@ def process_data(data, options=None):
             
         # Log the start of processing
         start_time = time.time()
-        logger.info(f"Starting data processing job with {len(data)} items")
+        items = row_count(data)
+        logger.info(f"Starting data processing job with {items} items")
         
         results = {}
         
-        if use_ray:
+        if use_ray and (batch_size or worth_distributing("data_processing", items)):
             # Use Ray for distributed processing
             logger.info("Using Ray for distributed processing")
             results = run_distributed_task(
                 task_type="data_processing",
                 data=data,
-                batch_size=batch_size
+                batch_size=batch_size,
+                operation=operation,
+                incremental=options.get('incremental', False),
+                backend=options.get('backend'),
+                progress=progress_reporter()
             )
         else:
-            # Simple sequential processing
-            logger.info("Using sequential processing")
-            # Simulate processing each key-value pair
-            for key, value in data.items():
-                # Simulate processing work
-                time.sleep(0.1)
-                results[key] = f"Processed: {value}"
+            # Vectorized processing in this process
+            logger.info("Using in-process vectorized processing")
+            results = run_operation(data, operation)
+            record_item_cost("data_processing", items, time.time() - start_time)
         
         # Calculate processing time
         processing_time = time.time() - start_time
@@ -57,7 +98,7 @@ def process_data(data, options=None):
         result = {
             "status": "success",
             "processing_time": processing_time,
-            "items_processed": len(data),
+            "items_processed": items,
             "results": results
         }
         
@@ -93,6 +134,7 @@ def process_text(text, options=None):
         # Validate input
         if not isinstance(text, str):
             raise ValueError("Text must be a string")
+        top_k, approximate = text_settings(options)
             
         # Log the start of processing
         start_time = time.time()
@@ -100,52 +142,27 @@ def process_text(text, options=None):
         
         results = {}
         
-        if use_ray and len(text) > 1000:
+        if use_ray and worth_distributing("text_processing", len(text)):
             # Use Ray for distributed processing of larger text
             logger.info("Using Ray for distributed text processing")
             results = run_distributed_task(
                 task_type="text_processing",
                 data=text,
-                operations=operations
+                operations=operations,
+                top_k=top_k,
+                approximate=approximate,
+                incremental=options.get('incremental', False),
+                backend=options.get('backend'),
+                progress=progress_reporter()
             )
         else:
             # Simple sequential processing
             logger.info("Using sequential processing")
             
-            # Perform requested operations
-            if 'count' in operations:
-                # Count words and characters
-                words = text.split()
-                results['word_count'] = len(words)
-                results['char_count'] = len(text)
-                
-            if 'tokenize' in operations:
-                # Simple tokenization (in real app, would use an NLP library)
-                results['tokens'] = text.split()[:100]  # Limit output tokens
-                results['unique_tokens'] = list(set(text.lower().split()))[:100]
-                
-            if 'sentiment' in operations:
-                # Simulate sentiment analysis
-                # (would use a real NLP model in production)
-                positive_words = ['good', 'great', 'excellent', 'best', 'happy']
-                negative_words = ['bad', 'worst', 'poor', 'terrible', 'sad']
-                
-                words = text.lower().split()
-                pos_count = sum(1 for word in words if word in positive_words)
-                neg_count = sum(1 for word in words if word in negative_words)
-                
-                if pos_count > neg_count:
-                    sentiment = "positive"
-                elif neg_count > pos_count:
-                    sentiment = "negative"
-                else:
-                    sentiment = "neutral"
-                    
-                results['sentiment'] = {
-                    'label': sentiment,
-                    'positive_words': pos_count,
-                    'negative_words': neg_count
-                }
+            # Word counts, token statistics and sentiment
+            results = analyze_text(text, operations, top_k, approximate)
+            
+            record_item_cost("text_processing", len(text), time.time() - start_time)
         
         # Calculate processing time
         processing_time = time.time() - start_time
@@ -0,0 +1,206 @@
+"""
+Map-reduce word statistics for text_processing jobs
+
+Each chunk of text is mapped to a small, mergeable state:
+
+    words, chars  - running counts
+    counts        - Counter of lowercased tokens (exact), or its most common
+                    `sketch_size` entries (approximate)
+    registers     - HyperLogLog registers for approximate unique counts
+    sample        - (chunk index, tokens) pieces holding the first SAMPLE_SIZE
+                    tokens of the text, in order
+    sentiment     - positive/negative/negated match counts (see app/sentiment.py)
+
+States merge associatively, so the Ray path reduces them pairwise as a tree
+and nothing on the driver grows with the number of tokens: memory is
+O(vocabulary) when exact, O(sketch_size) when approximate.
+
+Options (besides options['operations']):
+    top_k        - number of most frequent tokens to report (default TEXT_TOP_K)
+    approximate  - use the sketches instead of exact counts (default False)
+"""
+import hashlib
+import math
+import heapq
+from collections import Counter
+import numpy as np
+from .config import TEXT_TOP_K, TEXT_SKETCH_SIZE
+from .sentiment import context_size, load_lexicon, score_tokens, sentiment_label
+from .tokenizer import tokenize
+
+SAMPLE_SIZE = 100  # tokens / unique_tokens returned in results
+HLL_PRECISION = 12  # 4096 registers, ~1.6% standard error
+_HLL_REGISTERS = 1 << HLL_PRECISION
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / _HLL_REGISTERS)
+
+def text_settings(options):
+    """
+    Read and validate the text statistics options
+
+    Returns:
+        (top_k, approximate)
+
+    Raises:
+        ValueError for invalid options
+    """
+    top_k = options.get('top_k', TEXT_TOP_K)
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 0:
+        raise ValueError("options.top_k must be a non-negative integer")
+    approximate = options.get('approximate', False)
+    if not isinstance(approximate, bool):
+        raise ValueError("options.approximate must be true or false")
+    return top_k, approximate
+
+def _token_hash(token):
+    # Python's hash() is salted per process, so Ray workers would disagree
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def hll_registers(tokens):
+    """HyperLogLog registers for an iterable of distinct tokens"""
+    registers = np.zeros(_HLL_REGISTERS, dtype=np.uint8)
+    width = 64 - HLL_PRECISION
+    for token in tokens:
+        h = _token_hash(token)
+        rest = h & ((1 << width) - 1)
+        rank = width - rest.bit_length() + 1
+        index = h >> width
+        if rank > registers[index]:
+            registers[index] = rank
+    return registers
+
+def hll_estimate(registers):
+    """Estimated number of distinct tokens from HyperLogLog registers"""
+    m = len(registers)
+    estimate = _HLL_ALPHA * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # small-range (linear counting) correction
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+def _top(counts, n):
+    """n most common (token, count) pairs, ties broken by token so merge order doesn't matter"""
+    return heapq.nsmallest(n, counts.items(), key=lambda item: (-item[1], item[0]))
+
+def _most_common(counts, n):
+    """Counter truncated to its n most common entries"""
+    if len(counts) <= n:
+        return counts
+    return Counter(dict(_top(counts, n)))
+
+def _trim_sample(pieces):
+    """Keep the pieces (in chunk order) needed for the first SAMPLE_SIZE tokens"""
+    kept, total = [], 0
+    for index, tokens in sorted(pieces, key=lambda piece: piece[0]):
+        if total >= SAMPLE_SIZE:
+            break
+        kept.append((index, tokens[:SAMPLE_SIZE - total]))
+        total += len(kept[-1][1])
+    return kept
+
+def chunk_sentiment(text, before="", after=""):
+    """
+    Sentiment counts for text, using the end of before and the start of
+    after (whole words of the neighbouring text) as context
+    """
+    lexicon = load_lexicon()
+    context = context_size(lexicon)
+    head = tokenize(before)[-context:] if before else []
+    body = tokenize(text)
+    tail = tokenize(after)[:context] if after else []
+    return score_tokens(head + body + tail, lexicon, len(head), len(head) + len(body))
+
+def text_chunk_stats(text, operations, index=0, approximate=False, sketch_size=TEXT_SKETCH_SIZE,
+                     before="", after=""):
+    """
+    Map step: statistics for one chunk of text
+
+    Args:
+        text: The chunk
+        operations: Requested operations ('count', 'tokenize', 'sentiment')
+        index: Position of the chunk in the text, for ordering the token sample
+        approximate: Keep sketches instead of exact counts
+        sketch_size: Tokens kept per state when approximate
+        before, after: Neighbouring text, used as context for sentiment
+
+    Returns:
+        Mergeable state (see merge_text_stats)
+    """
+    state = {"words": 0, "chars": len(text), "counts": None, "registers": None,
+             "sample": [], "sketch_size": sketch_size if approximate else None, "sentiment": None}
+    if 'tokenize' in operations:
+        tokens = text.split()
+        state["words"] = len(tokens)
+        state["sample"] = [(index, tokens[:SAMPLE_SIZE])]
+        counts = Counter(text.lower().split())
+        if approximate:
+            state["registers"] = hll_registers(counts)
+            counts = _most_common(counts, sketch_size)
+        state["counts"] = counts
+    elif 'count' in operations:
+        state["words"] = len(text.split())
+    if 'sentiment' in operations:
+        state["sentiment"] = chunk_sentiment(text, before, after)
+    return state
+
+def merge_text_stats(a, b):
+    """Reduce step: combine two states (associative and commutative)"""
+    counts = None
+    if a["counts"] is not None and b["counts"] is not None:
+        counts = Counter(a["counts"])
+        counts.update(b["counts"])
+        if a["sketch_size"]:
+            counts = _most_common(counts, a["sketch_size"])
+    registers = None
+    if a["registers"] is not None and b["registers"] is not None:
+        registers = np.maximum(a["registers"], b["registers"])
+    sentiment = None
+    if a["sentiment"] is not None and b["sentiment"] is not None:
+        sentiment = {key: a["sentiment"][key] + b["sentiment"][key] for key in a["sentiment"]}
+    return {
+        "words": a["words"] + b["words"],
+        "chars": a["chars"] + b["chars"],
+        "counts": counts,
+        "registers": registers,
+        "sample": _trim_sample(a["sample"] + b["sample"]),
+        "sketch_size": a["sketch_size"],
+        "sentiment": sentiment,
+    }
+
+def finalize_text_stats(state, operations, top_k=TEXT_TOP_K):
+    """
+    Turn a merged state into the job results
+
+    Returns:
+        Dictionary with word_count/char_count ('count'), tokens,
+        unique_tokens, unique_token_count, top_tokens ('tokenize') and
+        sentiment ('sentiment')
+    """
+    result = {}
+    if 'count' in operations:
+        result['word_count'] = state["words"]
+        result['char_count'] = state["chars"]
+    if 'tokenize' in operations:
+        counts = state["counts"]
+        result['tokens'] = [token for _, tokens in _trim_sample(state["sample"]) for token in tokens]
+        result['unique_tokens'] = [token for token, _ in _top(counts, SAMPLE_SIZE)]
+        if state["registers"] is not None:
+            result['unique_token_count'] = hll_estimate(state["registers"])
+        else:
+            result['unique_token_count'] = len(counts)
+        result['top_tokens'] = [[token, count] for token, count in _top(counts, top_k)]
+        result['approximate'] = state["sketch_size"] is not None
+    if 'sentiment' in operations:
+        counts = state["sentiment"]
+        result['sentiment'] = {
+            'label': sentiment_label(counts),
+            'positive_words': counts["positive"],
+            'negative_words': counts["negative"],
+            'negated': counts["negated"],
+        }
+    return result
+
+def analyze_text(text, operations, top_k=TEXT_TOP_K, approximate=False):
+    """Run the statistics over a whole text in this process"""
+    state = text_chunk_stats(text, operations, approximate=approximate)
+    return finalize_text_stats(state, operations, top_k)
@@ -0,0 +1,22 @@
+"""
+Tokenizer and normalizer for text_processing jobs
+
+Text is normalized (lowercased, typographic apostrophes folded to ') and
+split by one compiled regular expression into word tokens and clause
+punctuation. Splitting never crosses whitespace, so tokenizing chunks cut at
+whitespace gives the same tokens as tokenizing the whole text.
+"""
+import re
+
+# words (letters/digits, with inner apostrophes as in "don't") or clause punctuation
+TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)*|[.!?;:,]")
+CLAUSE_PUNCTUATION = frozenset(".!?;:,")
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'", "`": "'"})
+
+def normalize(text):
+    """Lowercase text and fold apostrophe variants"""
+    return text.lower().translate(_APOSTROPHES)
+
+def tokenize(text):
+    """Normalized word and punctuation tokens of text"""
+    return TOKEN_RE.findall(normalize(text))
@@ -0,0 +1,107 @@
+"""
+Throughput of the execution backends by payload size
+
+Runs the same chunked jobs on each backend (see app/executors.py):
+    data - a filter -> group_by pipeline over columnar rows (items/sec)
+    text - count, tokenize and sentiment over review-like text (MB/s)
+with one chunk per CPU of the backend, and checks every backend's results
+against the in-process path. The first run of each backend (worker startup,
+warm-up) is excluded.
+
+Usage (from batch_processing_service/):
+    python benchmarks/bench_backends.py [--rows 100000 1000000] [--text-mb 1 10]
+        [--backends local process ray] [--rounds 3]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+# Add the parent directory to the path so we can import app modules
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.config import EXECUTOR_PROCESSES, RAY_NUM_CPUS
+from app.operations import run_operation
+from app.ray_cluster import run_distributed_task, shutdown_ray
+from app.text_stats import analyze_text
+from bench_text import ALL_OPERATIONS, generate_text
+
+PIPELINE = [
+    {"type": "filter", "where": "value > 0.1"},
+    {"type": "group_by", "by": "category", "columns": {"value": ["sum", "count"]}},
+]
+CPUS = {"local": 1, "process": EXECUTOR_PROCESSES, "ray": RAY_NUM_CPUS}
+
+
+def generate_rows(n, rng):
+    return {
+        "category": [rng.choice(["a", "b", "c", "d"]) for _ in range(n)],
+        "value": [rng.random() for _ in range(n)],
+    }
+
+
+def same_groups(a, b):
+    return (a["category"] == b["category"] and a["value_count"] == b["value_count"]
+            and all(math.isclose(x, y) for x, y in zip(a["value_sum"], b["value_sum"])))
+
+
+def best_time(fn, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Execution backend throughput benchmark')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--text-mb', type=float, nargs='+', default=[1, 10])
+    parser.add_argument('--backends', nargs='+', default=['local', 'process', 'ray'])
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    warm_rows = generate_rows(10_000, rng)
+    for backend in args.backends:
+        run_distributed_task("data_processing", warm_rows, batch_size=5_000, operation=PIPELINE, backend=backend)
+
+    try:
+        print(f"{'rows':>10} " + " ".join(f"{name + ' items/s':>18}" for name in args.backends))
+        for n in args.rows:
+            data = generate_rows(n, rng)
+            expected = run_operation(data, PIPELINE)
+            rates = []
+            for backend in args.backends:
+                chunk_size = math.ceil(n / CPUS[backend])
+                elapsed, result = best_time(lambda: run_distributed_task(
+                    "data_processing", data, batch_size=chunk_size, operation=PIPELINE, backend=backend
+                ), args.rounds)
+                assert same_groups(result, expected), f"{backend} results differ"
+                rates.append(n / elapsed)
+            print(f"{n:>10,} " + " ".join(f"{rate:>18,.0f}" for rate in rates))
+
+        print(f"\n{'MB':>10} " + " ".join(f"{name + ' MB/s':>18}" for name in args.backends))
+        for size in args.text_mb:
+            text = generate_text(size, rng)
+            megabytes = len(text.encode('utf-8')) / (1024 * 1024)
+            expected = analyze_text(text, ALL_OPERATIONS)
+            rates = []
+            for backend in args.backends:
+                chunk_size = math.ceil(len(text.encode('utf-8')) / CPUS[backend])
+                elapsed, result = best_time(lambda: run_distributed_task(
+                    "text_processing", text, chunk_size=chunk_size, operations=ALL_OPERATIONS, backend=backend
+                ), args.rounds)
+                assert result == expected, f"{backend} results differ"
+                rates.append(megabytes / elapsed)
+            print(f"{megabytes:>10.1f} " + " ".join(f"{rate:>18,.1f}" for rate in rates))
+    finally:
+        shutdown_ray()
+
+
+if __name__ == '__main__':
+    main()
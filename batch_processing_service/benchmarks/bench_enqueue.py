@@ -0,0 +1,66 @@
+"""
+Jobs/sec through POST /enqueue (one job per request) vs POST /enqueue/batch
+
+Runs the Flask app in-process (test client, no HTTP server) against the Redis
+at REDIS_URL, using a throwaway queue that is emptied afterwards.
+
+Usage (from batch_processing_service/):
+    python benchmarks/bench_enqueue.py [--jobs 5000] [--batch-size 1000]
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('RQ_QUEUE_NAME', 'bench_enqueue')
+
+# Add the parent directory to the path so we can import app modules
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app import create_app, task_queue
+
+
+def job_spec(i):
+    return {"job_type": "data_processing", "data": {"item": i}, "options": {"use_ray": False}}
+
+
+def bench_single(client, n):
+    start = time.perf_counter()
+    for i in range(n):
+        resp = client.post('/enqueue', json=job_spec(i))
+        assert resp.status_code == 202, resp.json
+    return time.perf_counter() - start
+
+
+def bench_batch(client, n, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, n, batch_size):
+        jobs = [job_spec(i) for i in range(offset, min(n, offset + batch_size))]
+        resp = client.post('/enqueue/batch', json={"jobs": jobs})
+        assert resp.status_code == 202, resp.json
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Enqueue throughput benchmark')
+    parser.add_argument('--jobs', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    client = create_app().test_client()
+    try:
+        task_queue.empty()
+        single = bench_single(client, args.jobs)
+        task_queue.empty()
+        batch = bench_batch(client, args.jobs, args.batch_size)
+    finally:
+        task_queue.empty()
+
+    print(f"{args.jobs} jobs on queue {task_queue.name}")
+    print(f"  /enqueue        {single:8.2f} s  {args.jobs / single:10.0f} jobs/s")
+    print(f"  /enqueue/batch  {batch:8.2f} s  {args.jobs / batch:10.0f} jobs/s  (batch size {args.batch_size})")
+
+
+if __name__ == '__main__':
+    main()
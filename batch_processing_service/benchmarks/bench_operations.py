@@ -0,0 +1,111 @@
+"""
+Items/sec of data_processing jobs by data size
+
+Runs the same map -> filter -> aggregate pipeline three ways, on key -> value
+data and on columnar data ({"value": [...]}):
+    python     - a per-item Python loop (how the sequential path used to work,
+                 minus its simulated sleep)
+    vectorized - process_data with use_ray=False (NumPy, in-process)
+    ray        - process_data with use_ray=True, one chunk per Ray CPU
+    auto       - process_data with use_ray=True and the adaptive partitioner
+                 (stays in-process for small jobs)
+
+Usage (from batch_processing_service/):
+    python benchmarks/bench_operations.py [--sizes 1000 10000 100000 1000000] [--skip-ray]
+        [--layout keyed columnar]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+# Add the parent directory to the path so we can import app modules
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.config import RAY_NUM_CPUS
+from app.operations import row_count
+from app.ray_cluster import init_ray, shutdown_ray
+from app.tasks import process_data
+
+OPERATION = [
+    {"type": "map", "columns": {"value": "value * 1.5 + 1"}},
+    {"type": "filter", "where": "value > 50"},
+    {"type": "aggregate", "columns": {"value": ["count", "sum", "mean", "std"]}},
+]
+
+
+def python_loop(data):
+    items = data["value"] if set(data) == {"value"} else data.values()
+    values = [v * 1.5 + 1 for v in items]
+    values = [v for v in values if v > 50]
+    n = len(values)
+    mean = sum(values) / n
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / n)
+    return {"value": {"count": n, "sum": sum(values), "mean": mean, "std": std}}
+
+
+def run_vectorized(data):
+    return process_data(data, {"use_ray": False, "operation": OPERATION})["results"]
+
+
+def run_ray(data):
+    batch_size = math.ceil(row_count(data) / RAY_NUM_CPUS)
+    return process_data(data, {"use_ray": True, "batch_size": batch_size, "operation": OPERATION})["results"]
+
+
+def run_auto(data):
+    return process_data(data, {"use_ray": True, "operation": OPERATION})["results"]
+
+
+def best_time(fn, data, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(data)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Data-processing operations benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--skip-ray', action='store_true')
+    parser.add_argument('--layout', nargs='+', choices=['keyed', 'columnar'], default=['keyed', 'columnar'])
+    args = parser.parse_args()
+
+    paths = {'python': python_loop, 'vectorized': run_vectorized}
+    if not args.skip_ray and init_ray():
+        paths['ray'] = run_ray
+        paths['auto'] = run_auto
+        run_ray({"warmup": 1.0})
+
+    rng = random.Random(42)
+    print(f"{'layout':<9} {'items':>10} " + " ".join(f"{name + ' items/s':>18}" for name in paths))
+    try:
+        for layout in args.layout:
+            for size in args.sizes:
+                values = [rng.uniform(0, 100) for _ in range(size)]
+                if layout == 'keyed':
+                    data = {f"item{i}": v for i, v in enumerate(values)}
+                else:
+                    data = {"value": values}
+                rates = []
+                reference = None
+                for name, fn in paths.items():
+                    elapsed, result = best_time(fn, data, args.rounds)
+                    if reference is None:
+                        reference = result
+                    else:
+                        assert result["value"]["count"] == reference["value"]["count"], (name, result)
+                    rates.append(size / elapsed)
+                print(f"{layout:<9} {size:>10} " + " ".join(f"{rate:>18,.0f}" for rate in rates))
+    finally:
+        shutdown_ray()
+
+
+if __name__ == '__main__':
+    main()
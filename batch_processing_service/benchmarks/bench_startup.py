@@ -0,0 +1,83 @@
+"""
+Startup cost of the batch processing service's processes
+
+Measures wall time and peak RSS of fresh subprocesses for:
+    api    - import the package and build the Flask app (create_app)
+    worker - import what an RQ worker loads before its first job
+    tests  - run the pytest suite
+and reports whether Ray ended up imported / initialized in each.
+
+Usage (from batch_processing_service/):
+    python benchmarks/bench_startup.py [--rounds 3] [--skip-tests]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+SERVICE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Each probe prints a JSON line with its own peak RSS and Ray state
+_PROBE_TAIL = """
+import json, resource, sys
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+ray_mod = sys.modules.get('ray')
+print(json.dumps({
+    'rss_mb': rss_kb / 1024,
+    'ray_imported': ray_mod is not None,
+    'ray_initialized': bool(ray_mod and ray_mod.is_initialized()),
+}))
+"""
+
+PROBES = {
+    'api': "from app import create_app\ncreate_app()\n",
+    'worker': "import app.queue_worker\nimport app.tasks\n",
+}
+
+
+def run_probe(name):
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, '-c', PROBES[name] + _PROBE_TAIL],
+        cwd=SERVICE_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    elapsed = time.perf_counter() - start
+    stats = json.loads(out.strip().splitlines()[-1])
+    stats['seconds'] = elapsed
+    return stats
+
+
+def run_tests():
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider'],
+        cwd=SERVICE_DIR, capture_output=True, text=True,
+    )
+    return {
+        'seconds': time.perf_counter() - start,
+        'result': (proc.stdout.strip().splitlines() or ['?'])[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup-time benchmark')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--skip-tests', action='store_true')
+    args = parser.parse_args()
+
+    print(f"{'process':<8} {'best s':>8} {'rss MB':>8}  ray imported / initialized")
+    for name in PROBES:
+        runs = [run_probe(name) for _ in range(args.rounds)]
+        best = min(runs, key=lambda r: r['seconds'])
+        print(f"{name:<8} {best['seconds']:>8.2f} {best['rss_mb']:>8.0f}  "
+              f"{best['ray_imported']} / {best['ray_initialized']}")
+
+    if not args.skip_tests:
+        stats = run_tests()
+        print(f"{'tests':<8} {stats['seconds']:>8.2f} {'':>8}  {stats['result']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Throughput (MB/s) of text_processing jobs by text size
+
+Scores the same generated review text several ways:
+    legacy     - the old sentiment branch of process_text (list lookups over
+                 text.lower().split(), no negation or phrases)
+    sentiment  - process_text with operations=['sentiment'], in-process
+    all        - process_text with count, tokenize and sentiment, in-process
+    ray        - the same as 'all' on Ray, one chunk per Ray CPU
+
+The in-process and Ray results are checked to be identical.
+
+Usage (from batch_processing_service/):
+    python benchmarks/bench_text.py [--sizes 1 10 50] [--rounds 3] [--skip-ray]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+# Add the parent directory to the path so we can import app modules
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(parent_dir)
+
+from app.config import RAY_NUM_CPUS
+from app.ray_cluster import init_ray, run_distributed_task, shutdown_ray
+from app.tasks import process_text
+
+ALL_OPERATIONS = ['count', 'tokenize', 'sentiment']
+WORDS = ("the service was quick and the staff were friendly but the room was "
+         "small and the coffee cold we would come back for the view").split()
+OPINIONS = ["great", "not bad", "terrible", "never happy", "highly recommend",
+            "a waste of time", "good", "didn't love it", "awful", "well done"]
+
+
+def generate_text(megabytes, rng):
+    """Review-like text of about the given size"""
+    sentences = []
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        words = rng.sample(WORDS, 8)
+        words.insert(rng.randrange(len(words)), rng.choice(OPINIONS))
+        sentence = " ".join(words).capitalize() + rng.choice([".", "!", ","])
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def legacy_sentiment(text):
+    positive_words = ['good', 'great', 'excellent', 'best', 'happy']
+    negative_words = ['bad', 'worst', 'poor', 'terrible', 'sad']
+    words = text.lower().split()
+    pos_count = sum(1 for word in words if word in positive_words)
+    neg_count = sum(1 for word in words if word in negative_words)
+    return {'positive_words': pos_count, 'negative_words': neg_count}
+
+
+def run_sentiment(text):
+    return process_text(text, {"operations": ['sentiment'], "use_ray": False})["results"]
+
+
+def run_all(text):
+    return process_text(text, {"operations": ALL_OPERATIONS, "use_ray": False})["results"]
+
+
+def run_ray(text):
+    chunk_size = math.ceil(len(text.encode('utf-8')) / RAY_NUM_CPUS)
+    return run_distributed_task("text_processing", text, chunk_size=chunk_size, operations=ALL_OPERATIONS)
+
+
+def best_time(fn, text, rounds):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Text processing throughput benchmark')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 10, 50], help='text sizes in MB')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--skip-ray', action='store_true')
+    args = parser.parse_args()
+
+    paths = {'legacy': legacy_sentiment, 'sentiment': run_sentiment, 'all': run_all}
+    if not args.skip_ray and init_ray():
+        paths['ray'] = run_ray
+        run_ray(generate_text(0.1, random.Random(0)))
+
+    rng = random.Random(42)
+    print(f"{'MB':>6} " + " ".join(f"{name + ' MB/s':>16}" for name in paths))
+    try:
+        for size in args.sizes:
+            text = generate_text(size, rng)
+            megabytes = len(text.encode('utf-8')) / (1024 * 1024)
+            rates = []
+            results = {}
+            for name, fn in paths.items():
+                elapsed, results[name] = best_time(fn, text, args.rounds)
+                rates.append(megabytes / elapsed)
+            if 'ray' in results:
+                assert results['ray'] == results['all'], "Ray and in-process results differ"
+            print(f"{megabytes:>6.1f} " + " ".join(f"{rate:>16,.1f}" for rate in rates))
+    finally:
+        shutdown_ray()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,13 @@
 import pytest
 import json
+import time
 from app import create_app, task_queue
+from app.config import JOB_EVENTS_CHANNEL
+from app.result_cache import RESULT_KEY_PREFIX
+from app.queue_worker import FairWorker
+from app.scheduling import QUEUE_WAIT_PREFIX, job_queues, queue_name, worker_queues
+from rq import Queue
+from rq.job import Job
 
 @pytest.fixture
 def app():
@@ -10,13 +17,34 @@ def app():
         "TESTING": True,
     })
     
-    # Ensure tasks don't actually run during tests
-    task_queue.is_async = False
+    # Ensure tasks don't actually run during tests: no worker is started, so
+    # enqueued jobs just stay queued (Queue.is_async is read-only in RQ)
+    clear_result_cache()
     
     yield app
     
-    # Cleanup: Clear any queued jobs
-    task_queue.empty()
+    # Cleanup: Clear any queued jobs and results cached by burst workers
+    empty_queues()
+    clear_result_cache()
+
+def empty_queues():
+    for queue in worker_queues(task_queue.connection):
+        queue.empty()
+    keys = list(task_queue.connection.scan_iter(match=QUEUE_WAIT_PREFIX + '*'))
+    if keys:
+        task_queue.connection.delete(*keys)
+
+def empty_registries():
+    for queue in job_queues(task_queue.connection):
+        task_queue.connection.delete(queue.failed_job_registry.key, queue.finished_job_registry.key)
+
+def queued_count():
+    return sum(len(queue) for queue in job_queues(task_queue.connection))
+
+def clear_result_cache():
+    keys = list(task_queue.connection.scan_iter(match=RESULT_KEY_PREFIX + '*'))
+    if keys:
+        task_queue.connection.delete(*keys)
 
 @pytest.fixture
 def client(app):
@@ -125,3 +153,327 @@ class TestEndpoints:
         # Check response
         assert response.status_code == 400
         assert "error" in response.json
+    
+    def test_invalid_operation(self, client):
+        """Test that malformed operations are rejected at enqueue time"""
+        payload = {
+            "job_type": "data_processing",
+            "data": {"a": 1},
+            "options": {"operation": {"type": "filter", "where": "__import__('os')"}}
+        }
+        
+        response = client.post('/enqueue', json=payload)
+        
+        assert response.status_code == 400
+        assert "Unsupported function" in response.json["error"]
+    
+    def test_enqueue_batch(self, client):
+        """Test enqueueing several jobs in one request"""
+        payload = {
+            "jobs": [
+                {"job_type": "data_processing", "data": {"k": i}, "options": {"use_ray": False}}
+                for i in range(5)
+            ] + [
+                {"job_type": "text_processing", "data": "some text"}
+            ]
+        }
+        
+        response = client.post(
+            '/enqueue/batch',
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        
+        # Check response
+        assert response.status_code == 202
+        assert response.json["count"] == 6
+        assert len(set(response.json["job_ids"])) == 6
+        
+        # Jobs are stored with their arguments
+        job = Job.fetch(response.json["job_ids"][2], connection=task_queue.connection)
+        assert job.args == ({"k": 2}, {"use_ray": False})
+    
+    def test_enqueue_batch_is_validated_up_front(self, client):
+        """Test that one invalid spec rejects the whole batch"""
+        queued_before = queued_count()
+        payload = {
+            "jobs": [
+                {"job_type": "data_processing", "data": {"k": 1}},
+                {"job_type": "invalid_type", "data": "x"},
+            ]
+        }
+        
+        response = client.post(
+            '/enqueue/batch',
+            data=json.dumps(payload),
+            content_type='application/json'
+        )
+        
+        # Check response
+        assert response.status_code == 400
+        assert response.json["index"] == 1
+        assert queued_count() == queued_before
+    
+    def test_list_jobs_paginates(self, client, monkeypatch):
+        """Test that /v2/jobs returns counts and pages through queued job IDs"""
+        empty_queues()
+        payload = {"jobs": [{"job_type": "data_processing", "data": {"k": i}} for i in range(5)]}
+        job_ids = client.post('/enqueue/batch', json=payload).json["job_ids"]
+        
+        first = client.get('/v2/jobs?limit=3')
+        assert first.status_code == 200
+        assert first.json["queued_count"] == 5
+        assert [j["job_id"] for j in first.json["jobs"]] == job_ids[:3]
+        assert all(j["status"] == "queued" for j in first.json["jobs"])
+        
+        # The cursor's list index still holds its job, so no search is needed
+        with monkeypatch.context() as patch:
+            patch.setattr(task_queue.connection, "lpos", None)
+            second = client.get(f'/v2/jobs?limit=3&cursor={first.json["next_cursor"]}')
+        assert [j["job_id"] for j in second.json["jobs"]] == job_ids[3:]
+        
+        # Jobs leaving the queue between pages don't shift the next one
+        Queue(Job.fetch(job_ids[0], connection=task_queue.connection).origin,
+              connection=task_queue.connection).remove(job_ids[0])
+        second = client.get(f'/v2/jobs?limit=3&cursor={first.json["next_cursor"]}')
+        assert [j["job_id"] for j in second.json["jobs"]] == job_ids[3:]
+        assert second.json["next_cursor"] is None
+        
+        # Unknown statuses and malformed cursors are rejected
+        assert client.get('/v2/jobs?status=bogus').status_code == 400
+        assert client.get('/v2/jobs?cursor=bogus').status_code == 400
+    
+    def test_list_jobs_registry_cursor(self, client):
+        """Registry pages continue after the last job's score, ties ordered by ID"""
+        empty_queues()
+        empty_registries()
+        registry = Queue(queue_name("normal", "data_processing"), connection=task_queue.connection).failed_job_registry
+        task_queue.connection.zadd(registry.key, {"a": 2e10, "b": 2e10, "c": 2e10, "d": 3e10})
+        
+        first = client.get('/v2/jobs?status=failed&limit=2').json
+        assert [j["job_id"] for j in first["jobs"]] == ["a", "b"]
+        task_queue.connection.zrem(registry.key, "a")
+        rest = client.get(f'/v2/jobs?status=failed&limit=2&cursor={first["next_cursor"]}').json
+        assert [j["job_id"] for j in rest["jobs"]] == ["c", "d"]
+        assert rest["next_cursor"] is None
+    
+    def test_list_jobs_legacy(self, client):
+        """/jobs keeps its original fields"""
+        empty_queues()
+        empty_registries()
+        job_id = client.post('/enqueue', json={"job_type": "data_processing", "data": {"k": 1}}).json["job_id"]
+        
+        response = client.get('/jobs')
+        assert response.json["queued_count"] == 1
+        assert response.json["queued_jobs"] == [{"job_id": job_id, "status": "queued"}]
+        assert response.json["failed_jobs"] == []
+        assert response.json["completed_jobs"] == []
+        assert "/v2/jobs" in response.headers["Link"]
+    
+    def test_bulk_job_status(self, client):
+        """Test looking up several jobs in one request"""
+        empty_queues()
+        payload = {"jobs": [{"job_type": "data_processing", "data": {"k": i}} for i in range(3)]}
+        job_ids = client.post('/enqueue/batch', json=payload).json["job_ids"]
+        
+        response = client.post('/jobs/status', json={"job_ids": job_ids + ["missing"]})
+        
+        # Check response
+        assert response.status_code == 200
+        jobs = response.json["jobs"]
+        assert [j["job_id"] for j in jobs] == job_ids
+        assert [j["queue_position"] for j in jobs] == [0, 1, 2]
+        assert all(j["status"] == "queued" for j in jobs)
+        assert response.json["not_found"] == ["missing"]
+        
+        # Matches the single-job endpoint
+        single = client.get(f'/job/{job_ids[1]}').json
+        assert single == jobs[1]
+    
+    def test_job_progress(self, client, monkeypatch):
+        """Progress recorded by a running job is reported by /job/<job_id>"""
+        from app import tasks
+        job_id = client.post('/enqueue', json={"job_type": "data_processing", "data": {"k": 1}}).json["job_id"]
+        assert client.get(f'/job/{job_id}').json["progress"] is None
+        
+        # What a distributed job does from inside the worker
+        monkeypatch.setattr(tasks, "get_current_job", lambda: Job.fetch(job_id, connection=task_queue.connection))
+        report = tasks.progress_reporter(interval=60)
+        report(1, 4)
+        report(2, 4)  # throttled
+        assert client.get(f'/job/{job_id}').json["progress"] == {
+            "chunks_done": 1, "chunks_total": 4, "percent": 25.0}
+        
+        report(4, 4)  # the last chunk is always recorded
+        assert client.get(f'/job/{job_id}').json["progress"]["percent"] == 100.0
+    
+    def test_job_completion_events(self, client):
+        """Test that workers publish completions and /jobs/events streams them"""
+        empty_queues()
+        payload = {"jobs": [
+            {"job_type": "data_processing", "data": {"k": i}, "options": {"use_ray": False}}
+            for i in range(2)
+        ]}
+        job_ids = client.post('/enqueue/batch', json=payload).json["job_ids"]
+        
+        pubsub = task_queue.connection.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(JOB_EVENTS_CHANNEL)
+        FairWorker(job_queues(task_queue.connection), connection=task_queue.connection).work(burst=True)
+        
+        published = []
+        deadline = time.monotonic() + 5
+        while len(published) < 2 and time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=1)
+            if message and message["type"] == "message":
+                published.append(json.loads(message["data"]))
+        pubsub.close()
+        assert sorted(e["job_id"] for e in published) == sorted(job_ids)
+        assert all(e["status"] == "finished" and e["result_status"] == "success" for e in published)
+        
+        # Jobs that finished before the stream opened are reported right away
+        response = client.get(f'/jobs/events?job_ids={",".join(job_ids)}')
+        assert response.mimetype == 'text/event-stream'
+        events = [json.loads(line[len('data: '):])
+                  for line in response.get_data(as_text=True).splitlines()
+                  if line.startswith('data: ')]
+        assert [e.get("job_id") for e in events[:2]] == job_ids
+        assert events[-1] == {"status": "complete"}
+    
+    def test_result_cache(self, client):
+        """Test that resubmitted payloads are answered from the result cache"""
+        empty_queues()
+        operation = {"type": "aggregate", "columns": {"value": ["sum"]}}
+        spec = {"job_type": "data_processing", "data": {"a": 1.0, "b": 2.0},
+                "options": {"use_ray": False, "operation": operation}}
+        first = client.post('/enqueue', json=spec)
+        assert first.status_code == 202
+        FairWorker(job_queues(task_queue.connection), connection=task_queue.connection).work(burst=True)
+        
+        # Same data and result options, different key order and run options
+        resubmitted = {"job_type": "data_processing", "data": {"b": 2.0, "a": 1.0},
+                       "options": {"operation": operation, "batch_size": 1}}
+        response = client.post('/enqueue', json=resubmitted)
+        assert response.status_code == 200
+        assert response.json["cached"] is True
+        assert response.json["result"] == client.get(f'/job/{first.json["job_id"]}').json["result"]
+        assert queued_count() == 0
+        
+        # Opting out, or a different operation, enqueues a job
+        assert client.post('/enqueue', json={**spec, "options": {"cache": False}}).status_code == 202
+        batch = client.post('/enqueue/batch', json={"jobs": [resubmitted, {**spec, "data": {"a": 3}}]}).json
+        assert batch["job_ids"][0] is None and batch["job_ids"][1]
+        assert batch["cached"]["0"] == response.json["result"]
+        assert batch["count"] == 1
+        
+        # A cache hit with a webhook still runs, so the callback is sent
+        webhook = {**resubmitted, "options": {**resubmitted["options"], "webhook_url": "http://93.184.216.34/hook"}}
+        response = client.post('/enqueue', json=webhook)
+        assert response.status_code == 202 and response.json["job_id"]
+        batch = client.post('/enqueue/batch', json={"jobs": [webhook, resubmitted]}).json
+        assert batch["job_ids"][0] and batch["job_ids"][1] is None
+        assert list(batch["cached"]) == ["1"]
+        
+        stats = client.get('/cache/stats').json
+        assert stats["hits"] >= 2 and stats["entries"] == 1
+        assert 0 < stats["hit_rate"] <= 1
+    
+    def test_priority_queues(self, client):
+        """Test that jobs are routed by priority and job type, with queue-wait stats"""
+        empty_queues()
+        small = client.post('/enqueue', json={"job_type": "text_processing", "data": "hi",
+                                              "options": {"use_ray": False, "cache": False}})
+        low = client.post('/enqueue', json={"job_type": "data_processing", "data": {"a": 1},
+                                            "options": {"use_ray": False, "priority": "low"}})
+        assert small.json["queue"] == queue_name("high", "text_processing")
+        assert low.json["queue"] == queue_name("low", "data_processing")
+        invalid = client.post('/enqueue', json={"job_type": "text_processing", "data": "hi",
+                                                "options": {"priority": "urgent"}})
+        assert invalid.status_code == 400
+        
+        # each job is first in its own queue
+        statuses = client.post('/jobs/status', json={"job_ids": [small.json["job_id"], low.json["job_id"]]}).json
+        assert [job["queue_position"] for job in statuses["jobs"]] == [0, 0]
+        
+        FairWorker(job_queues(task_queue.connection), connection=task_queue.connection).work(burst=True)
+        stats = {queue["queue"]: queue for queue in client.get('/queues/stats').json["queues"]}
+        high = stats[small.json["queue"]]
+        assert high["jobs"] == 1 and high["queued"] == 0 and high["priority"] == "high"
+        assert high["wait_seconds"]["samples"] == 1 and high["wait_seconds"]["p95"] >= 0
+        assert stats[low.json["queue"]]["weight"] < high["weight"]
+        assert stats[queue_name("normal", "data_processing")]["slo_met"] is None
+    
+    def test_webhook_url_is_validated(self, client):
+        """Test that a malformed webhook_url is rejected at enqueue time"""
+        payload = {"job_type": "text_processing", "data": "hi", "options": {"webhook_url": "ftp://x"}}
+        
+        response = client.post('/enqueue', json=payload)
+        
+        assert response.status_code == 400
+        assert "webhook_url" in response.json["error"]
+        
+        # Internal addresses are refused, so clients can't reach them through the worker
+        for url in ("http://127.0.0.1:6379/", "http://localhost/hook", "http://169.254.169.254/latest",
+                    "http://10.0.0.5/hook", "http://[::1]/hook"):
+            payload["options"]["webhook_url"] = url
+            response = client.post('/enqueue', json=payload)
+            assert response.status_code == 400, url
+    
+    def test_webhook_host_resolved_once_per_batch(self, client, monkeypatch):
+        """Test that a batch's jobs sharing a webhook host cost one DNS lookup"""
+        import socket
+        lookups = []
+        def getaddrinfo(host, *args, **kwargs):
+            lookups.append(host)
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('93.184.216.34', 0))]
+        monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+        
+        empty_queues()
+        spec = {"job_type": "text_processing", "data": "hi",
+                "options": {"cache": False, "webhook_url": "https://hooks.example.com/done"}}
+        response = client.post('/enqueue/batch', json={"jobs": [spec] * 3})
+        assert response.status_code == 202
+        assert lookups == ["hooks.example.com"]
+    
+    def test_webhook_is_sent_to_the_checked_address(self, monkeypatch):
+        """Test that a webhook connects to the address that passed the check (no DNS rebinding)"""
+        import socket
+        import requests
+        from requests.adapters import HTTPAdapter
+        from app.notifications import post_webhook
+        
+        answers = iter(["93.184.216.34", "127.0.0.1"])
+        monkeypatch.setattr(socket, "getaddrinfo", lambda host, *args, **kwargs: [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, '', (next(answers), 0))])
+        sent = []
+        def send(adapter, request, **kwargs):
+            sent.append((request.url, request.headers["Host"],
+                         adapter.poolmanager.connection_pool_kw.get("server_hostname")))
+            response = requests.Response()
+            response.status_code = 204
+            return response
+        monkeypatch.setattr(HTTPAdapter, "send", send)
+        
+        assert post_webhook("https://hooks.example.com:8443/done?x=1", {"job_id": "j"})
+        assert sent == [("https://93.184.216.34:8443/done?x=1", "hooks.example.com:8443", "hooks.example.com")]
+        # The next lookup is internal: refused before anything is sent
+        assert not post_webhook("https://hooks.example.com/done", {"job_id": "j"})
+        assert len(sent) == 1
+    
+    def test_webhook_is_queued(self):
+        """Test that webhooks are sent from their own queue, not inline by the job's worker"""
+        from types import SimpleNamespace
+        from rq import Queue
+        from app.config import WEBHOOK_QUEUE_NAME
+        from app.notifications import notify_job_done, post_webhook
+        
+        empty_queues()
+        job = SimpleNamespace(id="j", args=({}, {"webhook_url": "http://93.184.216.34/hook"}),
+                              result={"status": "success"}, ended_at=None)
+        event = notify_job_done(task_queue.connection, job, "finished")
+        webhooks = Queue(WEBHOOK_QUEUE_NAME, connection=task_queue.connection)
+        assert len(webhooks) == 1
+        assert webhooks.jobs[0].args == ("http://93.184.216.34/hook", event)
+        
+        # checked again at delivery time
+        assert post_webhook("http://127.0.0.1:6379/", event) is False
+        empty_queues()
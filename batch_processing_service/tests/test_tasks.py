@@ -30,6 +30,21 @@ class TestTasks:
         assert result["status"] == "error"
         assert "error" in result
     
+    def test_distributed_failure_is_an_error(self):
+        """A failed chunked run reports status error, like the in-process path, and isn't cached"""
+        from types import SimpleNamespace
+        from app.result_cache import cache_job_result
+        
+        options = {"operation": {"type": "aggregate", "columns": {"name": ["sum"]}}, "backend": "local"}
+        data = {"name": ["x", "y", "z"]}
+        assert process_data(data, {**options, "use_ray": False})["status"] == "error"
+        result = process_data(data, {**options, "batch_size": 1})
+        assert result["status"] == "error"
+        
+        job = SimpleNamespace(id="j", meta={"cache_key": "k"},
+                              result={"status": "success", "results": {"error": "chunks failed"}})
+        assert cache_job_result(None, job) is False
+    
     def test_process_text(self):
         """Test text processing functionality"""
         # Test text
@@ -72,3 +87,313 @@ class TestTasks:
         assert "results" in result
         assert "sentiment" in result["results"]
         assert result["results"]["sentiment"]["label"] == "negative"
+
+    def test_ray_not_started_without_distributed_work(self):
+        """Importing the app and running local jobs must not boot Ray"""
+        from app import create_app
+        from app.ray_cluster import is_ray_initialized
+        
+        create_app()
+        process_data({"item1": "value1"}, {"use_ray": False})
+        
+        # Small jobs stay in-process even when Ray is allowed
+        result = process_data({"item1": "value1"})
+        assert result["results"] == {"item1": "value1"}
+        
+        assert not is_ray_initialized()
+
+    def test_process_data_operations(self):
+        """Test filter/map pipelines and group-by on columnar data"""
+        data = {"price": [1, 2, 3, 4], "qty": [10, 0, 5, None]}
+        operation = [
+            {"type": "map", "columns": {"total": "price * qty"}},
+            {"type": "filter", "where": "total > 0"},
+        ]
+        
+        result = process_data(data, {"use_ray": False, "operation": operation})
+        
+        assert result["status"] == "success"
+        assert result["items_processed"] == 4
+        assert result["results"]["total"] == [10.0, 15.0]
+        
+        # Key -> value data can be coerced and aggregated
+        result = process_data(
+            {"a": "1", "b": "2.5", "c": "n/a"},
+            {"use_ray": False, "operation": [
+                {"type": "coerce", "columns": {"value": "float"}},
+                {"type": "aggregate", "columns": {"value": ["sum", "count", "max"]}},
+            ]}
+        )
+        assert result["results"] == {"value": {"sum": 3.5, "count": 2, "max": 2.5}}
+        
+        # Constant arithmetic is bounded like column arithmetic
+        result = process_data({"value": [1, 2]}, {"use_ray": False, "operation": {
+            "type": "filter", "where": "value > 9 ** 9 ** 9"}})
+        assert result["status"] == "success"
+        for where in ("value > 100000000000000000000", "str(value) == 'x' * 400000000", "str(value) * 3 == 'x'"):
+            result = process_data({"value": [1, 2]}, {"use_ray": False, "operation": {
+                "type": "filter", "where": where}})
+            assert result["status"] == "error"
+
+    def test_chunked_reductions_match_single_pass(self):
+        """Partial states merged across chunks give the same result as one pass"""
+        from app.operations import combine_chunks, parse_operation, run_chunk, split_columns, to_columns
+        
+        data = {
+            "group": ["a", "b", "a", "c", "b", "a", "c"],
+            "value": [1.0, 2.0, 3.5, None, 4.0, -1.0, 7.0],
+        }
+        steps = parse_operation({"type": "group_by", "by": "group",
+                                 "columns": {"value": ["count", "sum", "mean", "std", "min", "max"]}})
+        columns, keyed = to_columns(data)
+        
+        whole = combine_chunks([run_chunk(columns, steps)], steps, keyed)
+        chunked = combine_chunks([run_chunk(c, steps) for c in split_columns(columns, 2)], steps, keyed)
+        
+        assert whole["group"] == chunked["group"] == ["a", "b", "c"]
+        assert whole["value_count"] == chunked["value_count"] == [3, 2, 1]
+        assert chunked["value_std"] == pytest.approx(whole["value_std"])
+        assert chunked["value_mean"] == pytest.approx([3.5 / 3, 3.0, 7.0])
+
+    def test_text_chunk_bounds(self):
+        """Byte ranges cut at whitespace and never split a UTF-8 character"""
+        from app.ray_cluster import text_chunk_bounds
+        
+        raw = "naïve café señor über ünïcödé".encode('utf-8')
+        for size in (1, 3, 7, 64):
+            bounds = text_chunk_bounds(raw, size)
+            assert bounds[0][0] == 0 and bounds[-1][1] == len(raw)
+            assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+            pieces = [raw[start:stop].decode('utf-8') for start, stop in bounds]
+            assert "".join(pieces).split() == raw.decode('utf-8').split()
+        
+        # Cuts land on whitespace whenever a chunk contains some
+        assert text_chunk_bounds(b"aaa bbb ccc", 5) == [(0, 3), (3, 7), (7, 11)]
+
+    def test_shared_column_chunks(self):
+        """Chunks read from shared columns match chunks of the original data"""
+        from app.operations import combine_chunks, parse_operation, row_ranges, run_chunk, to_columns
+        from app.executors import _packed_strings
+        from app.ray_cluster import process_data_chunk
+        
+        data = {"name": ["x", "yy", "x", "zzz", "yy"], "tags": [[1], [2], [], [3], [4]],
+                "value": [1.0, 2.0, 3.0, 4.0, 5.0]}
+        steps = parse_operation({"type": "group_by", "by": "name", "columns": {"value": ["sum"]}})
+        columns, keyed = to_columns(data)
+        
+        # What shareable_columns shares
+        shared = {"name": _packed_strings(columns["name"]), "tags": None, "value": columns["value"]}
+        assert shared["name"].dtype.kind == "U"
+        assert _packed_strings(columns["tags"]) is None
+        
+        outputs = [
+            process_data_chunk(shared, start, stop, {"tags": columns["tags"][start:stop]}, steps)
+            for start, stop in row_ranges(5, 2)
+        ]
+        expected = combine_chunks([run_chunk(columns, steps)], steps, keyed)
+        assert combine_chunks(outputs, steps, keyed) == expected
+
+    def test_text_stats_merge(self):
+        """Chunk states reduced pairwise match a single pass over the text"""
+        from app.ray_cluster import text_chunk_bounds
+        from app.text_stats import analyze_text, finalize_text_stats, merge_text_stats, text_chunk_stats
+        
+        text = " ".join(f"Word{i % 700} word{i % 3}" for i in range(5000))
+        raw = text.encode('utf-8')
+        operations = ['count', 'tokenize']
+        states = [
+            text_chunk_stats(raw[start:stop].decode('utf-8'), operations, index)
+            for index, (start, stop) in enumerate(text_chunk_bounds(raw, 997))
+        ]
+        # Reduce out of order, as a tree
+        while len(states) > 1:
+            states = [merge_text_stats(states[i], states[i - 1]) if i else states[0]
+                      for i in range(len(states) - 1, -1, -2)]
+        
+        whole = analyze_text(text, operations, top_k=3)
+        assert finalize_text_stats(states[0], operations, top_k=3) == whole
+        assert whole["tokens"] == text.split()[:100]
+        assert whole["unique_token_count"] == 700
+        assert whole["top_tokens"][0] == ["word0", 5000 // 3 + 1 + 5000 // 700 + 1]
+        
+        # Sketches estimate the unique count within a few percent
+        approximate = analyze_text(text, operations, approximate=True)
+        assert approximate["approximate"] is True
+        assert approximate["unique_token_count"] == pytest.approx(700, rel=0.05)
+
+    def test_sentiment_chunks_match_sequential(self):
+        """Negation and phrases are scored the same in chunks as in one pass"""
+        import numpy as np
+        from app.ray_cluster import process_text_range, text_chunk_bounds
+        from app.text_stats import analyze_text, finalize_text_stats, merge_text_stats
+        
+        result = analyze_text("Not bad at all. It's good, but I don't love it. A waste of time!",
+                              ['sentiment'])["sentiment"]
+        # "not bad" and "don't love" flip; "waste of time" counts once
+        assert result == {"label": "neutral", "positive_words": 2, "negative_words": 2, "negated": 2}
+        
+        sentences = ["The service was not good.", "Highly recommend it!", "I never felt sad here",
+                     "what a waste of time", "it wasn't terrible, great\nfood", "Well done."]
+        text = " ".join(sentences[i % len(sentences)] for i in range(300))
+        raw = text.encode('utf-8')
+        buffer = np.frombuffer(raw, dtype=np.uint8)
+        operations = ['sentiment']
+        for chunk_size in (7, 50, 333):
+            states = [process_text_range(buffer, start, stop, index, operations)
+                      for index, (start, stop) in enumerate(text_chunk_bounds(raw, chunk_size))]
+            merged = states[0]
+            for state in states[1:]:
+                merged = merge_text_stats(merged, state)
+            assert finalize_text_stats(merged, operations) == analyze_text(text, operations)
+
+    def test_partition_plan(self, monkeypatch):
+        """Chunk counts follow estimated work, free CPUs and payload size"""
+        from app import partitioning
+        monkeypatch.setattr(partitioning, "item_cost", lambda task_type: 1e-6)
+        
+        # ~0.1s of work: not worth distributing
+        assert not partitioning.plan_partitions("data_processing", 100_000, cpus=8).distributed
+        
+        # ~2s of work: enough 0.25s tasks, capped at 2 per CPU
+        plan = partitioning.plan_partitions("data_processing", 2_000_000, cpus=2)
+        assert plan.distributed
+        assert plan.num_chunks == 4
+        assert plan.chunk_size == 500_000
+        
+        # A huge payload is cut so no chunk exceeds RAY_MAX_CHUNK_BYTES
+        plan = partitioning.plan_partitions("data_processing", 2_000_000, payload_bytes=10 * 2**30, cpus=2)
+        assert plan.num_chunks == 10 * 2**30 // partitioning.RAY_MAX_CHUNK_BYTES
+
+    def test_content_defined_chunks(self):
+        """An edit only changes the chunks around it, and chunk results are memoized"""
+        import random
+        from app import redis_conn
+        from app.incremental import (
+            CHUNK_MEMO_LRU_KEY, CHUNK_MEMO_PREFIX, chunk_digest, load_chunk_results, row_bounds,
+            store_chunk_results, text_bounds
+        )
+        from app.operations import to_columns
+        
+        rng = random.Random(7)
+        data = {f"key{i}": rng.random() for i in range(20000)}
+        columns, keyed = to_columns(data)
+        bounds = row_bounds(columns, keyed, 500)
+        assert bounds[0][0] == 0 and bounds[-1][1] == 20000
+        assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+        
+        # Insert a row in the middle: all but the chunk holding it are unchanged
+        items = list(data.items())
+        items.insert(10000, ("new", 1.0))
+        edited, _ = to_columns(dict(items))
+        chunk_keys = lambda cols: {tuple(cols["key"][start:stop]) for start, stop in row_bounds(cols, True, 500)}
+        assert len(chunk_keys(columns) - chunk_keys(edited)) == 1
+        
+        # Text chunks end at whitespace and survive an insertion elsewhere
+        raw = " ".join(f"w{rng.randrange(1000)}" for _ in range(20000)).encode('utf-8')
+        chunks = {raw[start:stop] for start, stop in text_bounds(raw, 2000)}
+        assert b"".join(raw[start:stop] for start, stop in text_bounds(raw, 2000)) == raw
+        edited = raw[:50000] + b" a few more words" + raw[50000:]
+        assert len(chunks - {edited[start:stop] for start, stop in text_bounds(edited, 2000)}) <= 2
+        
+        digest = chunk_digest({"steps": []}, columns["value"][:10])
+        assert digest != chunk_digest({"steps": []}, columns["value"][1:11])
+        try:
+            store_chunk_results(redis_conn, {digest: {"value": columns["value"][:10]}})
+            memo = load_chunk_results(redis_conn, [digest, "missing"])
+            assert list(memo) == [digest]
+            assert list(memo[digest]["value"]) == list(columns["value"][:10])
+        finally:
+            redis_conn.delete(CHUNK_MEMO_PREFIX + digest)
+            redis_conn.zrem(CHUNK_MEMO_LRU_KEY, digest)
+
+    def test_chunk_worker(self):
+        """Actors warm up once and return timed, indexed chunk results"""
+        import numpy as np
+        from app.actor_pool import ChunkWorker
+        from app.ray_cluster import process_text_range
+        from app.text_stats import analyze_text, finalize_text_stats
+        
+        text = "Not bad at all, highly recommend"
+        buffer = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+        worker = ChunkWorker("text_processing")
+        assert worker.ping()
+        index, seconds, state = worker.run(3, process_text_range, buffer, 0, len(buffer), 3, ['sentiment'])
+        assert index == 3 and seconds >= 0
+        assert finalize_text_stats(state, ['sentiment']) == analyze_text(text, ['sentiment'])
+
+    def test_executor_backends(self):
+        """The local and process backends chunk and merge like the in-process path"""
+        from app.executors import get_executor
+        from app.operations import run_operation
+        from app.ray_cluster import run_distributed_task
+        from app.text_stats import analyze_text
+        
+        data = {"name": ["x", "yy", "x", "zzz", "yy"] * 40, "tags": [[1], [2], [], [3], [4]] * 40,
+                "value": [float(i) for i in range(200)]}
+        operation = [{"type": "filter", "where": "value > 10"},
+                     {"type": "group_by", "by": "name", "columns": {"value": ["sum", "count"]}}]
+        text = "It was not bad, highly recommend. " * 200
+        operations = ['count', 'tokenize', 'sentiment']
+        for backend in ("local", "process"):
+            assert get_executor(backend, "data_processing").name == backend
+            result = run_distributed_task("data_processing", data, batch_size=30, operation=operation,
+                                          backend=backend)
+            assert result == run_operation(data, operation)
+            result = run_distributed_task("text_processing", text, chunk_size=500, operations=operations,
+                                          backend=backend)
+            assert result == analyze_text(text, operations)
+        with pytest.raises(ValueError):
+            get_executor("gpu", "data_processing")
+        
+        # only backends with long-lived workers need the in-process RQ worker
+        from app.executors import executor_class
+        assert executor_class("process").persistent and not executor_class("local").persistent
+    
+    def test_cache_key_options(self, monkeypatch):
+        """Chunking matters to approximate results, and the lexicon to sentiment"""
+        from app import result_cache
+        from app.result_cache import cache_key
+        
+        exact = {"operations": ["count"]}
+        assert cache_key("text_processing", "hi", exact) == cache_key("text_processing", "hi", {**exact, "chunk_size": 5})
+        approximate = {"operations": ["count"], "approximate": True}
+        assert cache_key("text_processing", "hi", approximate) != cache_key(
+            "text_processing", "hi", {**approximate, "chunk_size": 5})
+        assert cache_key("text_processing", "hi", approximate) == cache_key(
+            "text_processing", "hi", {**approximate, "use_ray": True})
+        
+        sentiment = {"operations": ["sentiment"]}
+        key = cache_key("text_processing", "hi", sentiment)
+        monkeypatch.setattr(result_cache, "lexicon_fingerprint", lambda: "other")
+        assert cache_key("text_processing", "hi", sentiment) != key
+    
+    def test_stride_scheduler(self):
+        """Backlogged queues are served in proportion to their weights"""
+        from collections import Counter
+        from types import SimpleNamespace
+        from app.scheduling import StrideScheduler, job_priority
+        
+        weights = {"high": 6, "normal": 3, "low": 1}
+        queues = [SimpleNamespace(name=name) for name in weights]
+        scheduler = StrideScheduler(queues, weight=weights.get)
+        served = Counter()
+        order = scheduler.order()
+        for _ in range(100):
+            # every queue has jobs: the first in order is served
+            served[order[0].name] += 1
+            order = scheduler.served(order[0])
+        assert served == {"high": 60, "normal": 30, "low": 10}
+        
+        # idle queues catch up instead of banking credit: after ten jobs from
+        # high alone, low gets one turn, not ten
+        for _ in range(10):
+            order = scheduler.served(queues[0])
+        order = scheduler.served(order[0])
+        assert [queue.name for queue in order] == ["low", "high", "normal"]
+        order = scheduler.served(order[0])
+        assert order[0].name == "high"
+        
+        assert job_priority("text_processing", "short", {}) == "high"
+        assert job_priority("data_processing", {"a": 1}, {"priority": "low"}) == "low"
+        with pytest.raises(ValueError):
+            job_priority("data_processing", {"a": 1}, {"priority": "urgent"})
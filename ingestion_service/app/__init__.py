@@ -4,9 +4,11 @@ from .database import init_db
 from .extensions import db
 logger = setup_logger()
 
-def create_app():
+def create_app(config_overrides=None):
     app = Flask(__name__)
     app.config.from_object('config.Config')
+    if config_overrides:
+        app.config.update(config_overrides)
 
     db.init_app(app)
 
@@ -17,4 +19,17 @@ def create_app():
     from .routes import bp as routes_bp
     app.register_blueprint(routes_bp)
 
+    from .cli import register_cli
+    register_cli(app)
+
+    from .counters import init_page_views
+    init_page_views(app)
+
+    from .idempotency import init_idempotency
+    init_idempotency(app)
+
+    if app.config['WRITE_BEHIND_ENABLED']:
+        from .write_behind import init_write_behind
+        init_write_behind(app)
+
     return app
\ No newline at end of file
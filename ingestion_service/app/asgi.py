@@ -0,0 +1,197 @@
+"""
+ASGI variant of the ingestion service for high-concurrency intake.
+
+Serves /health, /views and /events with the same Event table, validation,
+page-view counter, idempotency handling, write-behind buffer and config as the
+Flask app. Page-view reads and event inserts use pooled async drivers (asyncpg /
+aiosqlite and redis.asyncio); the shared idempotency and write-behind steps are
+synchronous and run in a worker thread.
+
+    hypercorn app.asgi:app -b 0.0.0.0:5000 --workers 2
+
+Schema management (partitions, column upgrades) stays with the Flask app's
+init_db(); this variant only creates the events table if it is missing.
+"""
+import asyncio
+import time
+import redis
+import redis.asyncio as aioredis
+from flask import Flask
+from quart import Quart, jsonify, render_template_string, request
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from . import db, logger
+from .counters import build_page_view_counter, page_path
+from .idempotency import begin_request, build_idempotency_guard, end_request
+from .ingest import InvalidEvent, insert_statement, validate_events
+from .models import Event
+from .pagination import MAX_PAGE_SIZE, ORDERINGS, filter_conditions, seek, split_page
+from .routes import HTML_TEMPLATE
+from .write_behind import BUFFER_FULL, buffer_rows, build_write_behind
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url):
+    """Map a sync SQLAlchemy URL from config onto its async driver."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend!r}')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_asgi_app(config_overrides=None):
+    app = Quart(__name__)
+    app.config.from_object('config.Config')
+    if config_overrides:
+        app.config.update(config_overrides)
+
+    @app.before_serving
+    async def startup():
+        url = async_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        pool_args = {}
+        if url.get_backend_name() != 'sqlite':
+            pool_args = {
+                'pool_size': app.config['ASYNC_DB_POOL_SIZE'],
+                'max_overflow': app.config['ASYNC_DB_MAX_OVERFLOW'],
+                'pool_pre_ping': True,
+            }
+        app.engine = create_async_engine(url, **pool_args)
+        async with app.engine.begin() as conn:
+            await conn.run_sync(Event.__table__.create, checkfirst=True)
+        app.redis = aioredis.from_url(
+            app.config['REDIS_URL'],
+            max_connections=app.config['ASYNC_REDIS_MAX_CONNECTIONS'],
+        )
+        sync_redis = redis.Redis.from_url(app.config['REDIS_URL'])
+        # the Flask app's counter, so both servers count the same keys the same way;
+        # requests read through app.redis, only the background flusher uses the sync client
+        app.page_views = build_page_view_counter(app.config, sync_redis)
+        app.page_views.start()
+        app.idempotency = build_idempotency_guard(app.config, sync_redis)
+        app.write_behind = None
+        if app.config['WRITE_BEHIND_ENABLED']:
+            # flushes go through bulk_insert_events, which needs a Flask-SQLAlchemy session
+            store = Flask(__name__)
+            store.config.update(app.config)
+            db.init_app(store)
+            app.write_behind = build_write_behind(store, sync_redis, app.idempotency)
+        logger.info(f'ASGI ingestion service started ({url.get_backend_name()})')
+
+    @app.after_serving
+    async def shutdown():
+        app.page_views.stop()
+        if app.write_behind is not None:
+            await asyncio.to_thread(app.write_behind.stop)
+        await app.redis.close()
+        await app.engine.dispose()
+
+    @app.route('/health', methods=['GET'])
+    async def health():
+        return jsonify({'status': 'ok'}), 200
+
+    @app.route('/views')
+    @app.route('/views/<path:page>')
+    async def view_counter(page=None):
+        path = page_path(page, app.config)
+        if path is None:
+            return jsonify({'error': 'Unknown page'}), 404
+        count = await app.page_views.aincr(path, app.redis)
+        return await render_template_string(HTML_TEMPLATE, count=count)
+
+    @app.route('/events', methods=['POST'])
+    async def post_events():
+        # same Idempotency-Key handling as routes._idempotent_response
+        guard = app.idempotency
+        batch_key = request.headers.get('Idempotency-Key')
+        early = await asyncio.to_thread(begin_request, guard, batch_key)
+        if early is not None:
+            body, status, headers = early
+            return jsonify(body), status, headers
+
+        try:
+            body, status = await ingest_events(guard)
+        except Exception:
+            if batch_key:
+                await asyncio.to_thread(guard.release_batch, batch_key)
+            raise
+        headers = await asyncio.to_thread(end_request, guard, batch_key, body, status)
+        return jsonify(body), status, headers
+
+    async def ingest_events(guard):
+        """routes._ingest_events with the insert on the async engine. Returns (body, status)."""
+        data = await request.get_json(silent=True)
+        if not data:
+            return {'error': 'Invalid JSON'}, 400
+
+        events = data if isinstance(data, list) else [data]
+        try:
+            rows = validate_events(events)
+        except InvalidEvent as e:
+            return {'error': str(e), 'index': e.index}, 400
+        rows, claimed, duplicates = await asyncio.to_thread(
+            guard.filter_new, rows, app.write_behind is None or app.write_behind.buffer.durable)
+
+        if app.write_behind is not None:
+            if not await asyncio.to_thread(buffer_rows, app.write_behind, guard, rows, claimed):
+                return BUFFER_FULL, 429
+            return {'accepted': len(rows), 'duplicates': duplicates, 'buffered': True}, 202
+
+        start = time.perf_counter()
+        inserted = 0
+        if rows:
+            try:
+                async with app.engine.begin() as conn:
+                    result = await conn.execute(insert_statement(app.engine.dialect.name), rows)
+            except Exception:
+                await asyncio.to_thread(guard.release_events, claimed)
+                raise
+            inserted = result.rowcount if result.rowcount >= 0 else len(rows)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        duplicates += len(rows) - inserted
+        return {'inserted': inserted, 'duplicates': duplicates, 'elapsed_ms': round(elapsed_ms, 3)}, 200
+
+    @app.route('/events', methods=['GET'])
+    async def get_events():
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PAGE_SIZE)
+        order = request.args.get('order', 'id')
+        if order not in ORDERINGS:
+            return jsonify({'error': f"order must be one of {', '.join(ORDERINGS)}"}), 400
+        try:
+            conditions = filter_conditions(
+                event_type=request.args.get('event_type'),
+                since=request.args.get('since'),
+                until=request.args.get('until'),
+            )
+            order_by, seek_conditions = seek(order, request.args.get('cursor'))
+        except ValueError as e:
+            # bad since/until or an InvalidCursor
+            return jsonify({'error': str(e)}), 400
+
+        table = Event.__table__
+        stmt = (select(table).where(*conditions, *seek_conditions)
+                .order_by(*order_by).limit(per_page + 1))
+        async with app.engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+        rows, next_cursor = split_page(rows, per_page, order)
+        items = [
+            {
+                'id': r.id,
+                'event_type': r.event_type,
+                'timestamp': r.timestamp,
+                'metadata': r._mapping['metadata'],
+            }
+            for r in rows
+        ]
+        return jsonify({'events': items, 'next_cursor': next_cursor}), 200
+
+    return app
+
+
+app = create_asgi_app()
@@ -0,0 +1,48 @@
+import click
+import json
+from .extensions import db
+from .partitions import apply_retention, ensure_partitions, is_partitioned
+
+
+def register_cli(app):
+    @app.cli.group()
+    def partitions():
+        """Manage time-bucketed event storage."""
+
+    @partitions.command('ensure')
+    @click.option('--days', default=None, type=int, help='Days ahead to pre-create (default: PARTITION_PREMAKE_DAYS).')
+    def ensure_cmd(days):
+        """Create upcoming daily partitions."""
+        if not is_partitioned(db.engine):
+            raise click.ClickException('events table is not partitioned')
+        days = app.config['PARTITION_PREMAKE_DAYS'] if days is None else days
+        for name in ensure_partitions(db.engine, days):
+            click.echo(name)
+
+    @partitions.command('retention')
+    @click.option('--days', default=None, type=int, help='Keep this many days (default: EVENT_RETENTION_DAYS).')
+    def retention_cmd(days):
+        """Drop events (or whole partitions) older than the retention window."""
+        days = app.config['EVENT_RETENTION_DAYS'] if days is None else days
+        if days is None:
+            raise click.ClickException('no retention configured; pass --days or set EVENT_RETENTION_DAYS')
+        click.echo(json.dumps(apply_retention(db.engine, days)))
+
+    @app.cli.command('export-events')
+    @click.argument('out_dir')
+    @click.option('--format', 'fmt', type=click.Choice(['parquet', 'arrow']), default='parquet')
+    @click.option('--batch-size', default=None, type=int, help='Rows per read batch / row group.')
+    @click.option('--event-type', default=None)
+    @click.option('--since', default=None, help='ISO-8601 or epoch seconds, inclusive.')
+    @click.option('--until', default=None, help='ISO-8601 or epoch seconds, exclusive.')
+    def export_events_cmd(out_dir, fmt, batch_size, event_type, since, until):
+        """Export events to Parquet/Arrow files partitioned by date and event_type."""
+        from .export import export_to_directory
+        batch_size = batch_size or app.config['EXPORT_BATCH_SIZE']
+        with db.engine.connect() as conn:
+            result = export_to_directory(
+                conn, out_dir, fmt=fmt, batch_size=batch_size,
+                sample_rows=app.config['EXPORT_SCHEMA_SAMPLE_ROWS'],
+                event_type=event_type, since=since, until=until,
+            )
+        click.echo(f"Exported {result['rows']} event(s) to {len(result['files'])} file(s)")
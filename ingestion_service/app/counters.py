@@ -0,0 +1,214 @@
+"""
+Sharded, batched page-view counters.
+
+Views are counted in process and flushed every `flush_interval` seconds with
+one pipelined INCRBY per (path, shard), so a page hit costs no Redis round
+trip. Each flush writes a path's delta to a random one of `shards` sub-keys
+(page_views:<path>:<n>), spreading a hot page over several keys/slots.
+Reads sum the shards with one MGET and cache the total for `cache_ttl`;
+aincr() does that read through a redis.asyncio client for the ASGI app.
+
+Loss semantics: increments live only in process memory until flushed, so a
+hard crash loses at most one flush interval of views per process. If Redis
+is unreachable, pending counts are kept and retried, but at most
+`max_pending_keys` distinct paths are held; increments for new paths beyond
+that are dropped and counted in `dropped`. A clean shutdown flushes (atexit).
+Displayed counts are approximate: cached total plus this process's pending.
+Cached totals are kept for at most `max_cached_keys` paths, least recently
+read first out.
+
+Only pages accepted by `page_path` are counted: with PAGE_VIEW_PAGES set, the
+listed pages; otherwise normalized paths of a bounded length and depth, so a
+client can't create keys for arbitrary URLs.
+"""
+import atexit
+import random
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from . import logger
+
+PAGE_SEGMENT = re.compile(r'^[a-z0-9][a-z0-9_.-]*$')
+
+
+class PageViewCounter:
+    def __init__(self, redis_client, shards=8, flush_interval=0.5, cache_ttl=1.0,
+                 max_pending_keys=10000, max_cached_keys=10000, prefix='page_views', legacy_keys=None):
+        self.redis = redis_client
+        self.shards = shards
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.max_pending_keys = max_pending_keys
+        self.max_cached_keys = max_cached_keys
+        self.prefix = prefix
+        # pre-sharding counters folded into a path's total, e.g. {'/views': 'page_views'}
+        self.legacy_keys = legacy_keys or {}
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # path -> (total, read at), least recently read first
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'flushes': 0, 'flush_errors': 0, 'last_flush_ms': None, 'dropped': 0}
+
+    def shard_keys(self, path):
+        return [f'{self.prefix}:{path}:{n}' for n in range(self.shards)]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='page-view-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def incr(self, path, n=1):
+        """Count n views of path locally and return the approximate total."""
+        self._count(path, n)
+        return self.get(path)
+
+    async def aincr(self, path, redis_client, n=1):
+        """incr() for asyncio callers; a cache miss reads through redis_client (redis.asyncio)."""
+        self._count(path, n)
+        now = time.monotonic()
+        cached = self._cached(path)
+        if cached is None or now - cached[1] > self.cache_ttl:
+            try:
+                cached = self._store(path, await redis_client.mget(self._read_keys(path)), now)
+            except Exception as e:
+                logger.warning(f'Page view read for {path} failed: {e}')
+                if cached is None:
+                    cached = (0, now)
+        return cached[0] + self._pending.get(path, 0)
+
+    def get(self, path):
+        """Cached Redis total (refreshed after cache_ttl) plus local pending views."""
+        now = time.monotonic()
+        cached = self._cached(path)
+        if cached is None or now - cached[1] > self.cache_ttl:
+            try:
+                cached = self._store(path, self.redis.mget(self._read_keys(path)), now)
+            except Exception as e:
+                logger.warning(f'Page view read for {path} failed: {e}')
+                if cached is None:
+                    cached = (0, now)
+        return cached[0] + self._pending.get(path, 0)
+
+    def _count(self, path, n):
+        with self._lock:
+            if path in self._pending or len(self._pending) < self.max_pending_keys:
+                self._pending[path] += n
+            else:
+                self.stats['dropped'] += n
+
+    def _read_keys(self, path):
+        keys = self.shard_keys(path)
+        if path in self.legacy_keys:
+            keys.append(self.legacy_keys[path])
+        return keys
+
+    def _cached(self, path):
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None:
+                self._cache.move_to_end(path)
+        return cached
+
+    def _store(self, path, values, now):
+        """Cache the shard total read at `now`; returns the (total, read at) entry."""
+        cached = (sum(int(v) for v in values if v is not None), now)
+        with self._lock:
+            self._cache[path] = cached
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_cached_keys:
+                self._cache.popitem(last=False)
+        return cached
+
+    def flush(self):
+        """Push pending increments to Redis in one pipeline. Returns views written."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+
+        start = time.perf_counter()
+        pipe = self.redis.pipeline(transaction=False)
+        for path, delta in pending.items():
+            pipe.incrby(f'{self.prefix}:{path}:{random.randrange(self.shards)}', delta)
+        try:
+            pipe.execute()
+        except Exception as e:
+            logger.error(f'Page view flush failed, keeping {sum(pending.values())} view(s): {e}')
+            self.stats['flush_errors'] += 1
+            with self._lock:
+                for path, delta in pending.items():
+                    if path in self._pending or len(self._pending) < self.max_pending_keys:
+                        self._pending[path] += delta
+                    else:
+                        self.stats['dropped'] += delta
+            return 0
+
+        self.stats['flushes'] += 1
+        self.stats['last_flush_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        with self._lock:
+            for path in pending:
+                # next read sees the flushed views instead of stale cache + empty pending
+                self._cache.pop(path, None)
+        return sum(pending.values())
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def metrics(self):
+        return {**self.stats, 'pending_keys': len(self._pending), 'cached_keys': len(self._cache),
+                'shards': self.shards}
+
+
+def page_path(page, config):
+    """
+    The counter path for /views/<page>, or None if the page isn't counted.
+
+    Pages are lowercased and stripped of empty segments; with PAGE_VIEW_PAGES
+    set only those pages count, otherwise any page of at most
+    PAGE_VIEW_MAX_DEPTH simple segments and PAGE_VIEW_MAX_PATH_LENGTH chars.
+    """
+    if page is None:
+        return '/views'
+    segments = [segment for segment in page.lower().split('/') if segment]
+    normalized = '/'.join(segments)
+    allowed = config['PAGE_VIEW_PAGES']
+    if allowed:
+        return f'/views/{normalized}' if normalized in allowed else None
+    if (not segments or len(segments) > config['PAGE_VIEW_MAX_DEPTH']
+            or len(normalized) > config['PAGE_VIEW_MAX_PATH_LENGTH']
+            or not all(PAGE_SEGMENT.match(segment) for segment in segments)):
+        return None
+    return f'/views/{normalized}'
+
+
+def build_page_view_counter(config, redis_client):
+    """PageViewCounter from app config; shared by the Flask and ASGI apps."""
+    return PageViewCounter(
+        redis_client,
+        shards=config['PAGE_VIEW_SHARDS'],
+        flush_interval=config['PAGE_VIEW_FLUSH_INTERVAL'],
+        cache_ttl=config['PAGE_VIEW_CACHE_TTL'],
+        max_pending_keys=config['PAGE_VIEW_MAX_PENDING_KEYS'],
+        max_cached_keys=config['PAGE_VIEW_MAX_CACHED_KEYS'],
+        legacy_keys={'/views': 'page_views'},
+    )
+
+
+def init_page_views(app):
+    """Create the page-view counter and start its flusher; stored in app.extensions."""
+    from .extensions import redis_client
+    counter = build_page_view_counter(app.config, redis_client)
+    counter.start()
+    app.extensions['page_views'] = counter
+    return counter
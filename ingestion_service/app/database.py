@@ -1,5 +1,59 @@
+import logging
+from sqlalchemy import inspect, select, text
 from .extensions import db
+from .timeutil import parse_timestamp
+
+# imported before app/__init__ defines `logger`; same 'ingestion' logger
+logger = logging.getLogger('ingestion')
 
 def init_db(app):
+    from .models import Event
+    from .partitions import init_partitioning
     with app.app_context():
+        init_partitioning(app)
         db.create_all()
+        upgrade_event_table(Event)
+        # create_all() only adds indexes with new tables; add any that
+        # were introduced after the table already existed
+        for index in Event.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def upgrade_event_table(Event, batch_size=5000):
+    """Add columns introduced after an events table was first created."""
+    columns = {c['name'] for c in inspect(db.engine).get_columns(Event.__tablename__)}
+    if 'idempotency_key' not in columns:
+        logger.info('Adding idempotency_key column to events table')
+        with db.engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE {Event.__tablename__} ADD COLUMN idempotency_key VARCHAR(128)'))
+    if 'ts_us' not in columns:
+        backfill_ts_us(Event, batch_size)
+
+def backfill_ts_us(Event, batch_size):
+    """Add the ts_us column and fill it by parsing the stored timestamp strings."""
+    logger.info('Adding ts_us column to events table')
+    table = Event.__table__
+    with db.engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN ts_us BIGINT'))
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                select(table.c.id, table.c.timestamp)
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            params = []
+            for row_id, ts in rows:
+                try:
+                    ts_us = parse_timestamp(ts)
+                except ValueError:
+                    logger.warning(f'Event {row_id} has unparseable timestamp {ts!r}; using 0')
+                    ts_us = 0
+                params.append({'row_id': row_id, 'ts_us': ts_us})
+            conn.execute(
+                text(f'UPDATE {table.name} SET ts_us = :ts_us WHERE id = :row_id'),
+                params,
+            )
+            last_id = rows[-1][0]
@@ -0,0 +1,246 @@
+"""
+Columnar export of the events table to Parquet or Arrow IPC.
+
+Rows are read with keyset pagination in ts_us order, `batch_size` at a time,
+and written as row groups, so memory is bounded by the batch size (times the
+number of partitions open for the current day) rather than the table size.
+
+`metadata` is flattened into typed `metadata.<key>` columns (nested objects
+use dotted keys) for every key whose values in a leading sample all share a
+scalar type. Keys that are mixed, nested lists, or unseen in the sample, as
+well as values that later disagree with their column type, are kept in a JSON
+`metadata` column so nothing is lost.
+"""
+import json
+import os
+from collections import defaultdict
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+
+from .models import Event
+from .pagination import filter_conditions, seek, split_page
+from .timeutil import from_micros
+
+FORMATS = ('parquet', 'arrow')
+EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+# Python type -> arrow type for inferable metadata columns; bool before int
+# because bool is an int subclass
+_SCALAR_TYPES = ((bool, pa.bool_()), (int, pa.int64()), (float, pa.float64()), (str, pa.string()))
+
+
+def _scalar_type(value):
+    for py_type, arrow_type in _SCALAR_TYPES:
+        if isinstance(value, py_type):
+            return arrow_type
+    return None
+
+
+def flatten(metadata, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}"""
+    flat = {}
+    for key, value in (metadata or {}).items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, f'{name}.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def infer_metadata_schema(metadata_values):
+    """Return {flat_key: arrow type} for keys with one consistent scalar type."""
+    seen = defaultdict(set)
+    for metadata in metadata_values:
+        for key, value in flatten(metadata).items():
+            if value is not None:
+                seen[key].add(_scalar_type(value))
+
+    columns = {}
+    for key, types in sorted(seen.items()):
+        if None in types:
+            continue
+        if types == {pa.int64(), pa.float64()}:
+            columns[key] = pa.float64()
+        elif len(types) == 1:
+            columns[key] = next(iter(types))
+    return columns
+
+
+class EventSchema:
+    """Arrow schema for exported events plus the row -> column conversion."""
+
+    def __init__(self, metadata_columns):
+        self.metadata_columns = metadata_columns
+        self.schema = pa.schema(
+            [
+                ('id', pa.int64()),
+                ('event_type', pa.string()),
+                ('timestamp', pa.string()),
+                ('ts', pa.timestamp('us', tz='UTC')),
+            ]
+            + [(f'metadata.{key}', t) for key, t in metadata_columns.items()]
+            + [('metadata', pa.string())]
+        )
+
+    def _fits(self, value, arrow_type):
+        value_type = _scalar_type(value)
+        return value_type == arrow_type or (arrow_type == pa.float64() and value_type == pa.int64())
+
+    def to_table(self, rows):
+        columns = {name: [] for name in self.schema.names}
+        for row in rows:
+            columns['id'].append(row.id)
+            columns['event_type'].append(row.event_type)
+            columns['timestamp'].append(row.timestamp)
+            columns['ts'].append(from_micros(row.ts_us))
+            rest = flatten(row.metadata)
+            for key, arrow_type in self.metadata_columns.items():
+                value = rest.get(key)
+                if value is not None and self._fits(value, arrow_type):
+                    del rest[key]
+                    if arrow_type == pa.float64():
+                        value = float(value)
+                    columns[f'metadata.{key}'].append(value)
+                else:
+                    columns[f'metadata.{key}'].append(None)
+            columns['metadata'].append(json.dumps(rest) if rest else None)
+        return pa.Table.from_pydict(columns, schema=self.schema)
+
+
+def iter_event_batches(conn, batch_size, event_type=None, since=None, until=None):
+    """Yield lists of event rows in (ts_us, id) order, batch_size at a time."""
+    table = Event.__table__
+    conditions = filter_conditions(event_type, since, until)
+    cursor = None
+    while True:
+        order_by, seek_conditions = seek('timestamp', cursor)
+        stmt = (select(table).where(*conditions, *seek_conditions)
+                .order_by(*order_by).limit(batch_size + 1))
+        rows = [_Row(r) for r in conn.execute(stmt)]
+        rows, cursor = split_page(rows, batch_size, 'timestamp')
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+class _Row:
+    """Attribute access to a Core row; 'metadata' clashes with Row internals."""
+    __slots__ = ('id', 'event_type', 'timestamp', 'ts_us', 'metadata')
+
+    def __init__(self, row):
+        mapping = row._mapping
+        for name in self.__slots__:
+            setattr(self, name, mapping[name])
+
+
+def build_schema(conn, sample_rows, event_type=None, since=None, until=None):
+    sample = []
+    for batch in iter_event_batches(conn, min(sample_rows, 10000), event_type, since, until):
+        sample.extend(r.metadata for r in batch)
+        if len(sample) >= sample_rows:
+            break
+    return EventSchema(infer_metadata_schema(sample[:sample_rows]))
+
+
+def _open_writer(fmt, sink, schema):
+    if fmt == 'parquet':
+        return pq.ParquetWriter(sink, schema)
+    return pa.ipc.new_file(sink, schema)
+
+
+def export_to_directory(conn, out_dir, fmt='parquet', batch_size=50000, sample_rows=10000,
+                        event_type=None, since=None, until=None):
+    """
+    Write events to out_dir/date=YYYY-MM-DD/event_type=<type>/part-0.<ext>
+    (hive-style partitions). Each batch_size chunk becomes one row group per
+    partition it touches. Since rows arrive in time order, a day's writers are
+    closed as soon as the export moves past that day.
+
+    Returns {'rows': n, 'files': [paths]}.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    event_schema = build_schema(conn, sample_rows, event_type, since, until)
+
+    writers = {}
+    files = []
+    total = 0
+    current_day = None
+
+    def close_all():
+        for writer in writers.values():
+            writer.close()
+        writers.clear()
+
+    try:
+        for rows in iter_event_batches(conn, batch_size, event_type, since, until):
+            parts = defaultdict(list)
+            for row in rows:
+                parts[(from_micros(row.ts_us).date().isoformat(), row.event_type)].append(row)
+            for (day, evt_type), part_rows in sorted(parts.items()):
+                if day != current_day:
+                    close_all()
+                    current_day = day
+                key = (day, evt_type)
+                if key not in writers:
+                    part_dir = os.path.join(out_dir, f'date={day}', f"event_type={quote(evt_type, safe='')}")
+                    os.makedirs(part_dir, exist_ok=True)
+                    path = os.path.join(part_dir, f'part-0.{EXTENSIONS[fmt]}')
+                    writers[key] = _open_writer(fmt, path, event_schema.schema)
+                    files.append(path)
+                writers[key].write_table(event_schema.to_table(part_rows))
+                total += len(part_rows)
+    finally:
+        close_all()
+    return {'rows': total, 'files': files}
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+        self._pos = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+def stream_export(conn, fmt='arrow', batch_size=50000, sample_rows=10000,
+                  event_type=None, since=None, until=None):
+    """Yield one Parquet file or Arrow IPC stream as bytes, a row group at a time."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    event_schema = build_schema(conn, sample_rows, event_type, since, until)
+    sink = _ChunkSink()
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), event_schema.schema)
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), event_schema.schema)
+    for rows in iter_event_batches(conn, batch_size, event_type, since, until):
+        writer.write_table(event_schema.to_table(rows))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,188 @@
+import json
+from . import logger
+
+NEW, REPLAY, IN_PROGRESS = 'new', 'replay', 'in_progress'
+_PENDING = b'__pending__'
+
+
+class IdempotencyGuard:
+    """
+    Redis-backed fast path for deduplicating client retries.
+
+    Event keys are claimed with SET NX EX, so a key seen within `ttl` seconds is
+    dropped before touching the database; the unique index on
+    Event.idempotency_key catches anything older or any claim lost to a Redis
+    outage. Keys of rows buffered for write-behind are released if the rows
+    are dead-lettered; with a buffer that does not survive the process they
+    are only claimed once the rows are committed. Whole batches sent with an
+    Idempotency-Key header have their response cached for `ttl` and replayed
+    on retry.
+
+    Every Redis failure degrades to "not seen", leaving dedup to the database.
+    """
+
+    def __init__(self, redis_client, ttl, prefix='idem', pending_ttl=60):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.pending_ttl = pending_ttl
+        self.stats = {'event_duplicates': 0, 'batch_replays': 0, 'redis_errors': 0}
+
+    def _event_key(self, key):
+        return f'{self.prefix}:event:{key}'
+
+    def _batch_key(self, key):
+        return f'{self.prefix}:batch:{key}'
+
+    def filter_new(self, rows, claim=True):
+        """
+        Drop rows whose idempotency_key repeats within the batch or was claimed
+        recently. Returns (rows to insert, keys claimed, duplicates dropped).
+
+        With claim=False keys are only checked, not claimed; the caller claims
+        them with claim_events() once the rows are committed.
+        """
+        seen = set()
+        unique_rows = []
+        for row in rows:
+            key = row['idempotency_key']
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            unique_rows.append(row)
+        duplicates = len(rows) - len(unique_rows)
+
+        claimed = []
+        keyed = [row['idempotency_key'] for row in unique_rows if row['idempotency_key'] is not None]
+        if keyed and self.redis is not None:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keyed:
+                if claim:
+                    pipe.set(self._event_key(key), 1, nx=True, ex=self.ttl)
+                else:
+                    pipe.exists(self._event_key(key))
+            try:
+                results = pipe.execute()
+            except Exception as e:
+                logger.warning(f'Idempotency pre-check failed, relying on the database: {e}')
+                self.stats['redis_errors'] += 1
+            else:
+                # SET NX succeeds for a new key; EXISTS is 0 for one
+                new = [bool(ok) == claim for ok in results]
+                already = {key for key, is_new in zip(keyed, new) if not is_new}
+                if claim:
+                    claimed = [key for key, is_new in zip(keyed, new) if is_new]
+                if already:
+                    before = len(unique_rows)
+                    unique_rows = [r for r in unique_rows if r['idempotency_key'] not in already]
+                    duplicates += before - len(unique_rows)
+
+        self.stats['event_duplicates'] += duplicates
+        return unique_rows, claimed, duplicates
+
+    def claim_events(self, keys):
+        """Claim keys of rows that have been committed (see filter_new(claim=False))."""
+        if not keys or self.redis is None:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(self._event_key(key), 1, ex=self.ttl)
+        try:
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f'Could not claim {len(keys)} stored idempotency key(s): {e}')
+            self.stats['redis_errors'] += 1
+
+    def release_events(self, keys):
+        """Forget claims for rows that were not stored after all."""
+        if not keys or self.redis is None:
+            return
+        try:
+            self.redis.delete(*[self._event_key(k) for k in keys])
+        except Exception as e:
+            logger.warning(f'Could not release {len(keys)} idempotency claim(s): {e}')
+
+    def begin_batch(self, key):
+        """
+        Returns (NEW, None) when this request should run, (REPLAY, cached) when
+        an earlier response can be returned, or (IN_PROGRESS, None).
+        """
+        if self.redis is None:
+            return NEW, None
+        try:
+            if self.redis.set(self._batch_key(key), _PENDING, nx=True, ex=self.pending_ttl):
+                return NEW, None
+            cached = self.redis.get(self._batch_key(key))
+        except Exception as e:
+            logger.warning(f'Idempotent batch lookup failed: {e}')
+            self.stats['redis_errors'] += 1
+            return NEW, None
+        if cached is None:
+            # expired between SET and GET; treat as new
+            return NEW, None
+        if cached == _PENDING:
+            return IN_PROGRESS, None
+        self.stats['batch_replays'] += 1
+        return REPLAY, json.loads(cached)
+
+    def finish_batch(self, key, body, status):
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self._batch_key(key), json.dumps({'body': body, 'status': status}), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f'Could not cache idempotent batch response: {e}')
+
+    def release_batch(self, key):
+        if self.redis is None:
+            return
+        try:
+            self.redis.delete(self._batch_key(key))
+        except Exception as e:
+            logger.warning(f'Could not release idempotent batch: {e}')
+
+    def metrics(self):
+        return dict(self.stats)
+
+
+def begin_request(guard, batch_key):
+    """
+    Start a request sent with an Idempotency-Key header (batch_key None if not).
+    Returns None when it should run, else the (body, status, headers) to answer
+    with. Shared by the Flask and ASGI apps.
+    """
+    if not batch_key:
+        return None
+    state, cached = guard.begin_batch(batch_key)
+    if state == REPLAY:
+        return cached['body'], cached['status'], {'Idempotent-Replayed': 'true'}
+    if state == IN_PROGRESS:
+        return {'error': 'A request with this Idempotency-Key is in progress'}, 409, {}
+    return None
+
+
+def end_request(guard, batch_key, body, status):
+    """
+    Cache a finished request's response for replay; a 429 releases the key so
+    the retry runs. Returns extra response headers.
+    """
+    if batch_key:
+        if status == 429:
+            guard.release_batch(batch_key)
+        else:
+            guard.finish_batch(batch_key, body, status)
+    return {'Retry-After': '1'} if status == 429 else {}
+
+
+def build_idempotency_guard(config, redis_client):
+    """IdempotencyGuard from app config; shared by the Flask and ASGI apps."""
+    return IdempotencyGuard(redis_client if config['IDEMPOTENCY_PRECHECK'] else None, config['IDEMPOTENCY_TTL'])
+
+
+def init_idempotency(app):
+    """Create the idempotency guard; stored in app.extensions."""
+    from .extensions import redis_client
+    guard = build_idempotency_guard(app.config, redis_client)
+    app.extensions['idempotency'] = guard
+    return guard
@@ -0,0 +1,139 @@
+import gzip
+import json
+import time
+from .extensions import db
+from .models import Event
+from .timeutil import parse_timestamp
+
+REQUIRED_FIELDS = ('event_type', 'timestamp')
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
+
+
+class InvalidEvent(ValueError):
+    """Raised when an event in a batch fails validation; carries its position."""
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+def event_row(evt):
+    """Map one incoming event dict onto a row for the events table."""
+    if not isinstance(evt, dict):
+        raise ValueError('Event must be a JSON object')
+    missing = [f for f in REQUIRED_FIELDS if f not in evt]
+    if missing:
+        raise ValueError(f"Missing fields in event: {', '.join(missing)}")
+    key = evt.get('idempotency_key')
+    if key is not None:
+        if not isinstance(key, (str, int)) or isinstance(key, bool):
+            raise ValueError('idempotency_key must be a string')
+        key = str(key)
+        if not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise ValueError(f'idempotency_key must be 1-{MAX_IDEMPOTENCY_KEY_LENGTH} characters')
+    return {
+        'event_type': evt['event_type'],
+        'timestamp': str(evt['timestamp']),
+        'ts_us': parse_timestamp(evt['timestamp']),
+        # column key is 'metadata' (see Event.event_metadata)
+        'metadata': evt.get('metadata', {}),
+        'idempotency_key': key,
+    }
+
+
+def validate_events(events):
+    """Validate a whole batch up front and return the rows to insert."""
+    rows = []
+    for i, evt in enumerate(events):
+        try:
+            rows.append(event_row(evt))
+        except ValueError as e:
+            raise InvalidEvent(i, str(e))
+    return rows
+
+
+def insert_statement(dialect_name):
+    """
+    INSERT for the events table that skips rows violating the idempotency_key
+    unique index, where the dialect supports it.
+    """
+    table = Event.__table__
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing()
+    return table.insert()
+
+
+def bulk_insert_events(rows, commit=True):
+    """
+    Write already-validated rows with a single executemany INSERT. Rows whose
+    idempotency_key is already stored are skipped.
+
+    Returns (rows inserted, elapsed milliseconds).
+    """
+    start = time.perf_counter()
+    inserted = 0
+    if rows:
+        result = db.session.execute(insert_statement(db.engine.dialect.name), rows)
+        # rowcount excludes skipped duplicates; some drivers report -1
+        inserted = result.rowcount if result.rowcount >= 0 else len(rows)
+    if commit:
+        db.session.commit()
+    return inserted, (time.perf_counter() - start) * 1000
+
+
+def ingest_ndjson(stream, chunk_size, store, compressed=False, max_errors=20):
+    """
+    Read newline-delimited JSON events from a file-like stream and hand them to
+    store(rows) in chunks of chunk_size, so only one chunk is ever held in memory.
+
+    store returns (rows stored, duplicates dropped), or None when it cannot take
+    the chunk right now; reading then stops and resume_line gives the first line
+    of the refused chunk.
+
+    Malformed or invalid lines are counted and skipped; the first max_errors of
+    them are reported by line number.
+    """
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+
+    result = {'accepted': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0, 'chunks': 0, 'errors': []}
+    rows = []
+    first_line = None
+
+    def flush():
+        stored = store(rows)
+        if stored is None:
+            result['resume_line'] = first_line
+            return False
+        result['accepted'] += len(rows)
+        result['inserted'] += stored[0]
+        result['duplicates'] += stored[1]
+        result['chunks'] += 1
+        return True
+
+    for lineno, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rows.append(event_row(json.loads(line)))
+        except ValueError as e:
+            # json.JSONDecodeError and UnicodeDecodeError are ValueErrors too
+            result['rejected'] += 1
+            if len(result['errors']) < max_errors:
+                result['errors'].append({'line': lineno, 'error': str(e)})
+            continue
+        if first_line is None:
+            first_line = lineno
+        if len(rows) >= chunk_size:
+            if not flush():
+                return result
+            rows = []
+            first_line = None
+    if rows:
+        flush()
+    return result
@@ -1,11 +1,33 @@
 from .extensions import db
 
 class Event(db.Model):
+    # Composite indexes backing keyset pagination and the GET /events filters
+    __table_args__ = (
+        db.Index('ix_event_type_id', 'event_type', 'id'),
+        db.Index('ix_event_ts_us_id', 'ts_us', 'id'),
+        db.Index('ix_event_type_ts_us_id', 'event_type', 'ts_us', 'id'),
+        # backstop for ingest-time dedup; NULL keys never conflict
+        db.Index('ux_event_idempotency_key', 'idempotency_key', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     event_type = db.Column(db.String(50), nullable=False)
+    # original client-supplied string, returned as-is by the API
     timestamp = db.Column(db.String(50), nullable=False)
+    # parsed at ingest: epoch microseconds, UTC; used for all range queries
+    ts_us = db.Column(db.BigInteger, nullable=False)
     # 'metadata' is reserved; use attribute 'event_metadata' mapping to column 'metadata'
     event_metadata = db.Column('metadata', db.JSON, nullable=False)
+    # optional client-supplied ID; retries carrying the same key are dropped
+    idempotency_key = db.Column(db.String(128), nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'timestamp': self.timestamp,
+            'metadata': self.event_metadata
+        }
 
     def __repr__(self):
         return f'<Event {self.id} {self.event_type}>'
\ No newline at end of file
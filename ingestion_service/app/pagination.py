@@ -0,0 +1,96 @@
+import base64
+import json
+from sqlalchemy import and_, or_
+from .models import Event
+from .timeutil import parse_timestamp
+
+MAX_PAGE_SIZE = 1000
+ORDERINGS = ('id', 'timestamp')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order, event):
+    """Opaque cursor pointing just past `event` in the given ordering."""
+    key = {'o': order, 'id': event.id}
+    if order == 'timestamp':
+        key['ts'] = event.ts_us
+    raw = json.dumps(key, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, order):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if key['o'] != order or not isinstance(key['id'], int):
+            raise ValueError
+        if order == 'timestamp' and not isinstance(key.get('ts'), int):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    return key
+
+
+def filter_conditions(event_type=None, since=None, until=None):
+    """
+    WHERE clauses for the type and [since, until) time-range filters. since/until
+    take anything parse_timestamp() does and raise ValueError otherwise.
+    """
+    conditions = []
+    if event_type:
+        conditions.append(Event.event_type == event_type)
+    if since is not None:
+        conditions.append(Event.ts_us >= parse_timestamp(since))
+    if until is not None:
+        conditions.append(Event.ts_us < parse_timestamp(until))
+    return conditions
+
+
+def filtered_query(event_type=None, since=None, until=None):
+    return Event.query.filter(*filter_conditions(event_type, since, until))
+
+
+def seek(order='id', cursor=None):
+    """
+    ORDER BY columns and the keyset condition selecting rows strictly after
+    the cursor. Returns (order_by, conditions).
+    """
+    if order == 'timestamp':
+        order_by = (Event.ts_us, Event.id)
+        if not cursor:
+            return order_by, []
+        key = decode_cursor(cursor, order)
+        return order_by, [or_(
+            Event.ts_us > key['ts'],
+            and_(Event.ts_us == key['ts'], Event.id > key['id']),
+        )]
+    order_by = (Event.id,)
+    if not cursor:
+        return order_by, []
+    key = decode_cursor(cursor, order)
+    return order_by, [Event.id > key['id']]
+
+
+def split_page(events, limit, order):
+    """Trim the one-row lookahead and build next_cursor (None on the last page)."""
+    if len(events) > limit:
+        events = events[:limit]
+        return events, encode_cursor(order, events[-1])
+    return events, None
+
+
+def keyset_page(query, limit, order='id', cursor=None):
+    """
+    Fetch one page with keyset (seek) pagination: rows strictly after the
+    cursor, ordered by (order, id). Cost does not grow with page depth since
+    no rows are skipped and no COUNT is issued.
+
+    Returns (events, next_cursor); next_cursor is None on the last page.
+    """
+    order_by, conditions = seek(order, cursor)
+    # one extra row tells us whether another page exists
+    events = query.filter(*conditions).order_by(*order_by).limit(limit + 1).all()
+    return split_page(events, limit, order)
@@ -0,0 +1,229 @@
+"""
+Time-bucketed storage for the events table.
+
+With EVENT_PARTITIONING=daily on Postgres, `event` is created as a declarative
+RANGE partitioned table on ts_us with one partition per UTC day, so time-window
+scans are pruned to the matching days and retention is a DROP TABLE per day.
+Other databases keep a single table and retention falls back to a range
+DELETE on the ts_us index.
+
+Rows for days without a partition land in `event_default`. When such a day's
+partition is created later, its rows are first moved out of the default
+partition (Postgres refuses to add a partition whose range already has rows
+there). A background PartitionMaintainer creates upcoming partitions and
+applies retention every PARTITION_MAINTENANCE_INTERVAL seconds.
+"""
+import atexit
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import Index, MetaData, PrimaryKeyConstraint, inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from . import logger
+from .extensions import db
+from .models import Event
+from .timeutil import DAY_US, day_start, from_micros
+
+DEFAULT_PARTITION = 'event_default'
+
+
+def is_partitioned(engine):
+    if engine.dialect.name != 'postgresql':
+        return False
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT 1 FROM pg_partitioned_table pt "
+                 "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :name"),
+            {'name': Event.__tablename__},
+        ).first() is not None
+
+
+def create_partitioned_table(engine):
+    """
+    Create `event` as a partitioned parent table built from the Event model.
+    Postgres requires the partition key in the primary key and in unique
+    indexes, so the PK becomes (id, ts_us) and idempotency keys are unique per
+    timestamp (retries resend the same timestamp). Rows outside every daily
+    range land in a DEFAULT partition.
+    """
+    table = Event.__table__.to_metadata(MetaData())
+    table.c.id.autoincrement = True
+    table.c.ts_us.primary_key = True
+    table.append_constraint(PrimaryKeyConstraint(table.c.id, table.c.ts_us))
+    table.dialect_options['postgresql']['partition_by'] = 'RANGE (ts_us)'
+    # unique indexes on a partitioned table must include the partition key too
+    for index in list(table.indexes):
+        if index.unique and 'ts_us' not in index.columns:
+            table.indexes.remove(index)
+            Index(index.name, *index.columns, table.c.ts_us, unique=True)
+
+    with engine.begin() as conn:
+        conn.execute(CreateTable(table))
+        for index in table.indexes:
+            conn.execute(CreateIndex(index))
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {table.name} DEFAULT'
+        ))
+    logger.info('Created partitioned events table')
+
+
+def partition_name(ts_us):
+    return f"{Event.__tablename__}_p{from_micros(day_start(ts_us)):%Y%m%d}"
+
+
+def _create_partition(conn, name, lo, hi):
+    """
+    Add the [lo, hi) partition, first moving that range's rows out of the
+    default partition; Postgres refuses to create a partition while the
+    default one holds rows that belong to it.
+    """
+    parent = Event.__tablename__
+    stranded = conn.execute(text(
+        f'SELECT 1 FROM {DEFAULT_PARTITION} WHERE ts_us >= :lo AND ts_us < :hi LIMIT 1'
+    ), {'lo': lo, 'hi': hi}).first()
+    if stranded is None:
+        conn.execute(text(f'CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM ({lo}) TO ({hi})'))
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    columns = ', '.join(quote(c.name) for c in Event.__table__.columns)
+    conn.execute(text(f'CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    moved = conn.execute(text(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE ts_us >= :lo AND ts_us < :hi '
+        f'RETURNING {columns}) INSERT INTO {name} ({columns}) SELECT {columns} FROM moved'
+    ), {'lo': lo, 'hi': hi}).rowcount
+    # indexes and the primary key are created from the parent's on attach
+    conn.execute(text(f'ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM ({lo}) TO ({hi})'))
+    logger.info(f'Moved {moved} event(s) from {DEFAULT_PARTITION} into new partition {name}')
+
+
+def ensure_partitions(engine, days_ahead, start_us=None):
+    """
+    Create missing daily partitions from start_us (default: today) through
+    days_ahead days. Returns the names of the partitions in that range.
+    """
+    if start_us is None:
+        start_us = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    first = day_start(start_us)
+    existing = set(list_partitions(engine))
+    names = []
+    for i in range(days_ahead + 1):
+        lo = first + i * DAY_US
+        name = partition_name(lo)
+        if name not in existing:
+            # one transaction per day, so the default partition is locked briefly
+            with engine.begin() as conn:
+                _create_partition(conn, name, lo, lo + DAY_US)
+        names.append(name)
+    return names
+
+
+def list_partitions(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :name"
+        ), {'name': Event.__tablename__})
+        return sorted(r[0] for r in rows)
+
+
+def apply_retention(engine, retention_days, now_us=None):
+    """
+    Remove events older than retention_days. Drops whole daily partitions when
+    the table is partitioned (and deletes old rows that landed in the default
+    partition); otherwise deletes by ts_us range.
+    Returns a short description of what was removed.
+    """
+    if now_us is None:
+        now_us = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    cutoff = day_start(now_us) - retention_days * DAY_US
+
+    if is_partitioned(engine):
+        cutoff_name = partition_name(cutoff)
+        dropped = [
+            name for name in list_partitions(engine)
+            if name != DEFAULT_PARTITION and name < cutoff_name
+        ]
+        with engine.begin() as conn:
+            for name in dropped:
+                conn.execute(text(f'DROP TABLE {name}'))
+            deleted = conn.execute(
+                text(f'DELETE FROM {DEFAULT_PARTITION} WHERE ts_us < :cutoff'), {'cutoff': cutoff}
+            ).rowcount
+        return {'dropped_partitions': dropped, 'deleted_default_rows': deleted}
+
+    with engine.begin() as conn:
+        deleted = conn.execute(Event.__table__.delete().where(Event.ts_us < cutoff)).rowcount
+    return {'deleted_rows': deleted}
+
+
+class PartitionMaintainer:
+    """
+    Background thread that keeps days_ahead partitions ahead of today and
+    applies retention every `interval` seconds. Every app process runs one;
+    a Postgres advisory lock lets only one of them work at a time.
+    """
+
+    LOCK_ID = 0x6576656E74  # 'event'
+
+    def __init__(self, engine, days_ahead, retention_days, interval):
+        self.engine = engine
+        self.days_ahead = days_ahead
+        self.retention_days = retention_days
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='partition-maintainer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def run_once(self):
+        """Returns what was done, or None if another process holds the lock."""
+        with self.engine.connect() as lock_conn:
+            if not lock_conn.execute(text('SELECT pg_try_advisory_lock(:id)'), {'id': self.LOCK_ID}).scalar():
+                return None
+            try:
+                done = {'partitions': ensure_partitions(self.engine, self.days_ahead)}
+                if self.retention_days is not None:
+                    done['retention'] = apply_retention(self.engine, self.retention_days)
+                return done
+            finally:
+                lock_conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': self.LOCK_ID})
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f'Partition maintenance failed: {e}')
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def init_partitioning(app):
+    """Called from init_db before create_all()."""
+    engine = db.engine
+    if app.config['EVENT_PARTITIONING'] != 'daily':
+        return
+    if engine.dialect.name != 'postgresql':
+        logger.warning('EVENT_PARTITIONING=daily needs Postgres; using a single events table')
+        return
+    if not inspect(engine).has_table(Event.__tablename__):
+        create_partitioned_table(engine)
+    elif not is_partitioned(engine):
+        logger.warning('events table already exists unpartitioned; leaving it as is')
+        return
+    ensure_partitions(engine, app.config['PARTITION_PREMAKE_DAYS'])
+    if app.config['PARTITION_MAINTENANCE_INTERVAL'] > 0:
+        maintainer = PartitionMaintainer(
+            engine,
+            days_ahead=app.config['PARTITION_PREMAKE_DAYS'],
+            retention_days=app.config['EVENT_RETENTION_DAYS'],
+            interval=app.config['PARTITION_MAINTENANCE_INTERVAL'],
+        )
+        maintainer.start()
+        app.extensions['partition_maintainer'] = maintainer
@@ -1,7 +1,12 @@
-from flask import Blueprint, request, jsonify, render_template_string
+import zlib
+from flask import Blueprint, Response, request, jsonify, render_template_string, current_app, stream_with_context
 from . import db, logger
 from .models import Event
-from .extensions import redis_client
+from .counters import page_path
+from .ingest import InvalidEvent, validate_events, bulk_insert_events, ingest_ndjson
+from .idempotency import begin_request, end_request
+from .write_behind import BUFFER_FULL, buffer_rows
+from .pagination import InvalidCursor, MAX_PAGE_SIZE, ORDERINGS, filter_conditions, filtered_query, keyset_page
 
 bp = Blueprint('routes', __name__)
 
@@ -16,8 +21,13 @@ HTML_TEMPLATE = """
 """
 
 @bp.route("/views")
-def view_counter():
-    count = redis_client.incr("page_views")
+@bp.route("/views/<path:page>")
+def view_counter(page=None):
+    path = page_path(page, current_app.config)
+    if path is None:
+        return jsonify({'error': 'Unknown page'}), 404
+    # counted locally and flushed in batches; see app/counters.py
+    count = current_app.extensions['page_views'].incr(path)
     return render_template_string(HTML_TEMPLATE, count=count)
 
 @bp.route("/", methods=["GET"])
@@ -28,41 +38,187 @@ def home():
 def health():
     return jsonify({'status': 'ok'}), 200
 
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    write_behind = current_app.extensions.get('write_behind')
+    return jsonify({
+        'write_behind': write_behind.metrics() if write_behind is not None else None,
+        'page_views': current_app.extensions['page_views'].metrics(),
+        'idempotency': current_app.extensions['idempotency'].metrics(),
+    }), 200
+
 @bp.route('/events', methods=['POST'])
 def post_events():
+    return _idempotent_response(_ingest_events)
+
+def _idempotent_response(handler):
+    """
+    Run handler(guard) -> (body, status) at most once per Idempotency-Key header;
+    retries of a finished request replay its response.
+    """
+    guard = current_app.extensions['idempotency']
+    batch_key = request.headers.get('Idempotency-Key')
+    early = begin_request(guard, batch_key)
+    if early is not None:
+        body, status, headers = early
+        return jsonify(body), status, headers
+
+    try:
+        body, status = handler(guard)
+    except Exception:
+        if batch_key:
+            guard.release_batch(batch_key)
+        raise
+    return jsonify(body), status, end_request(guard, batch_key, body, status)
+
+def _store_rows(guard, rows):
+    """
+    Dedupe rows, then insert them or hand them to the write-behind buffer.
+    Returns (rows stored, duplicates dropped, elapsed ms), or None when the
+    buffer is full.
+    """
+    write_behind = current_app.extensions.get('write_behind')
+    # rows in an in-memory buffer die with the process; claim their keys once committed
+    rows, claimed, duplicates = guard.filter_new(
+        rows, claim=write_behind is None or write_behind.buffer.durable)
+
+    if write_behind is not None:
+        if not buffer_rows(write_behind, guard, rows, claimed):
+            return None
+        return len(rows), duplicates, 0.0
+
+    try:
+        inserted, elapsed_ms = bulk_insert_events(rows)
+    except Exception:
+        db.session.rollback()
+        guard.release_events(claimed)
+        raise
+    return inserted, duplicates + len(rows) - inserted, elapsed_ms
+
+def _ingest_events(guard):
+    """Validate, dedupe and store (or buffer) the posted batch. Returns (body, status)."""
     data = request.get_json()
     if not data:
-        return jsonify({'error': 'Invalid JSON'}), 400
+        return {'error': 'Invalid JSON'}, 400
 
     events = data if isinstance(data, list) else [data]
-    inserted = []
-    for evt in events:
-        try:
-            e = Event(
-                event_type=evt['event_type'],
-                timestamp=evt['timestamp'],
-                event_metadata=evt.get('metadata', {})
+    try:
+        rows = validate_events(events)
+    except InvalidEvent as e:
+        return {'error': str(e), 'index': e.index}, 400
+
+    stored = _store_rows(guard, rows)
+    if stored is None:
+        return BUFFER_FULL, 429
+    inserted, duplicates, elapsed_ms = stored
+    if current_app.extensions.get('write_behind') is not None:
+        return {'accepted': inserted, 'duplicates': duplicates, 'buffered': True}, 202
+    logger.info(f'Inserted {inserted} event(s) in {elapsed_ms:.1f} ms, {duplicates} duplicate(s)')
+    return {'inserted': inserted, 'duplicates': duplicates, 'elapsed_ms': round(elapsed_ms, 3)}, 200
+
+@bp.route('/events/stream', methods=['POST'])
+def post_events_stream():
+    chunk_size = request.args.get('chunk_size', current_app.config['STREAM_CHUNK_SIZE'], type=int)
+    if chunk_size < 1:
+        return jsonify({'error': 'chunk_size must be positive'}), 400
+    return _idempotent_response(lambda guard: _ingest_stream(guard, chunk_size))
+
+def _ingest_stream(guard, chunk_size):
+    """
+    Store (or buffer) an NDJSON body chunk by chunk through the same dedupe
+    path as POST /events. Returns (body, status).
+    """
+    def store(rows):
+        stored = _store_rows(guard, rows)
+        return stored[:2] if stored is not None else None
+
+    compressed = request.headers.get('Content-Encoding', '').lower() == 'gzip'
+    try:
+        result = ingest_ndjson(request.stream, chunk_size, store, compressed=compressed)
+    except (OSError, EOFError, zlib.error):
+        # chunks stored before the corrupt data stay stored
+        return {'error': 'Invalid gzip body'}, 400
+
+    buffered = current_app.extensions.get('write_behind') is not None
+    if buffered:
+        # rows are written later; the buffer cannot tell how many will conflict
+        result['buffered'] = True
+        del result['inserted']
+    logger.info(
+        f"Streamed {result['accepted']} event(s) in {result['chunks']} chunk(s), "
+        f"{result['duplicates']} duplicate(s), rejected {result['rejected']}"
+    )
+    if 'resume_line' in result:
+        result.update(BUFFER_FULL)
+        return result, 429
+    return result, 202 if buffered else 200
+
+@bp.route('/events/export', methods=['GET'])
+def export_events():
+    """
+    Stream matching events as one Arrow IPC stream (format=arrow, default) or
+    Parquet file (format=parquet). Filters: event_type, since, until.
+    """
+    from .export import FORMATS, stream_export
+    fmt = request.args.get('format', 'arrow')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(FORMATS)}"}), 400
+    filters = {
+        'event_type': request.args.get('event_type'),
+        'since': request.args.get('since'),
+        'until': request.args.get('until'),
+    }
+    try:
+        filter_conditions(**filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        with db.engine.connect() as conn:
+            yield from stream_export(
+                conn, fmt=fmt,
+                batch_size=current_app.config['EXPORT_BATCH_SIZE'],
+                sample_rows=current_app.config['EXPORT_SCHEMA_SAMPLE_ROWS'],
+                **filters,
             )
-            db.session.add(e)
-            inserted.append(evt)
-        except KeyError:
-            return jsonify({'error': 'Missing fields in event'}), 400
-    db.session.commit()
-    logger.info(f'Inserted {len(inserted)} event(s)')
-    return jsonify({'inserted': len(inserted)}), 200
+
+    mimetype = 'application/vnd.apache.arrow.stream' if fmt == 'arrow' else 'application/vnd.apache.parquet'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=events.{fmt}',
+    })
 
 @bp.route('/events', methods=['GET'])
 def get_events():
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
-    evts = Event.query.paginate(page=page, per_page=per_page, error_out=False)
-    items = [
-        {
-            'id': e.id,
-            'event_type': e.event_type,
-            'timestamp': e.timestamp,
-            'metadata': e.event_metadata
-        }
-        for e in evts.items
-    ]
-    return jsonify({'events': items}), 200
+    """
+    Keyset-paginated event listing.
+
+    Query params: per_page (max 1000), cursor (next_cursor from the previous
+    page), order ('id' or 'timestamp'), event_type, since, until.
+    The legacy `page` param is still honoured when no cursor is given.
+    """
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PAGE_SIZE)
+    order = request.args.get('order', 'id')
+    if order not in ORDERINGS:
+        return jsonify({'error': f"order must be one of {', '.join(ORDERINGS)}"}), 400
+    cursor = request.args.get('cursor')
+    try:
+        query = filtered_query(
+            event_type=request.args.get('event_type'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    page = request.args.get('page', type=int)
+    if page and page > 1 and not cursor:
+        # Deprecated OFFSET paging, kept for old clients (no COUNT(*) though)
+        order_col = Event.ts_us if order == 'timestamp' else Event.id
+        evts = query.order_by(order_col, Event.id).offset((page - 1) * per_page).limit(per_page).all()
+        return jsonify({'events': [e.to_dict() for e in evts], 'next_cursor': None}), 200
+
+    try:
+        evts, next_cursor = keyset_page(query, per_page, order=order, cursor=cursor)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'events': [e.to_dict() for e in evts], 'next_cursor': next_cursor}), 200
@@ -0,0 +1,66 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICRO = timedelta(microseconds=1)
+DAY_US = 24 * 3600 * 1_000_000
+# what from_micros() can turn back into a datetime; well inside int64
+MIN_US = (datetime.min.replace(tzinfo=timezone.utc) - EPOCH) // ONE_MICRO
+MAX_US = (datetime.max.replace(tzinfo=timezone.utc) - EPOCH) // ONE_MICRO
+
+
+def _checked(ts_us, original):
+    if not MIN_US <= ts_us <= MAX_US:
+        raise ValueError(f'Timestamp out of range: {original!r}')
+    return ts_us
+
+
+def _from_epoch_seconds(seconds, original):
+    if not math.isfinite(seconds):
+        raise ValueError(f'Invalid timestamp: {original!r}')
+    return _checked(int(round(seconds * 1_000_000)), original)
+
+
+def parse_timestamp(value):
+    """
+    Parse an event timestamp into epoch microseconds (UTC).
+
+    Accepts ISO-8601 strings (a trailing 'Z' is allowed; naive values are taken
+    as UTC) or numeric epoch seconds between years 1 and 9999. Raises
+    ValueError otherwise.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid timestamp: {value!r}')
+    if isinstance(value, (int, float)):
+        return _from_epoch_seconds(value, value)
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid timestamp: {value!r}')
+
+    text = value.strip()
+    try:
+        # numeric strings (e.g. from query params) are epoch seconds too
+        seconds = float(text)
+    except ValueError:
+        pass
+    else:
+        return _from_epoch_seconds(seconds, value)
+    if text.endswith(('Z', 'z')):
+        # fromisoformat() only understands 'Z' from Python 3.11
+        text = text[:-1] + '+00:00'
+    try:
+        dt = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f'Invalid timestamp: {value!r}')
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    # a UTC offset can push year 1 or 9999 past the representable range
+    return _checked((dt - EPOCH) // ONE_MICRO, value)
+
+
+def from_micros(ts_us):
+    return EPOCH + ts_us * ONE_MICRO
+
+
+def day_start(ts_us):
+    """Epoch micros of the UTC midnight on or before ts_us."""
+    return ts_us - ts_us % DAY_US
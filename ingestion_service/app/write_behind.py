@@ -0,0 +1,370 @@
+import atexit
+import json
+import threading
+from collections import deque
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+from . import db, logger
+from .ingest import bulk_insert_events
+
+# Atomically append one batch if it fits under the event limit.
+# KEYS: list, depth counter  ARGV: limit, batch size, encoded batch
+_PUSH_SCRIPT = """
+local depth = tonumber(redis.call('GET', KEYS[2]) or '0')
+local n = tonumber(ARGV[2])
+if depth + n > tonumber(ARGV[1]) then
+    return -1
+end
+redis.call('RPUSH', KEYS[1], ARGV[3])
+return redis.call('INCRBY', KEYS[2], n)
+"""
+
+# Atomically pop whole batches until at least ARGV[1] events are taken. A
+# batch that already failed to flush ("<count>:<attempts>:<json>") is popped
+# on its own, so fresh batches never share its retries.
+# KEYS: list, depth counter  ARGV: max events
+_DRAIN_SCRIPT = """
+local out = {}
+local taken = 0
+while taken < tonumber(ARGV[1]) do
+    local item = redis.call('LPOP', KEYS[1])
+    if not item then break end
+    local n = string.match(item, '^(%d+):')
+    local attempts = tonumber(string.match(item, '^%d+:(%d+):') or '0')
+    if attempts > 0 and #out > 0 then
+        redis.call('LPUSH', KEYS[1], item)
+        break
+    end
+    taken = taken + tonumber(n)
+    table.insert(out, item)
+    if attempts > 0 then break end
+end
+if taken > 0 then
+    redis.call('DECRBY', KEYS[2], taken)
+end
+return out
+"""
+
+
+class MemoryBuffer:
+    """Bounded in-process buffer of event batches; one per worker process."""
+
+    durable = False  # lost if the process dies
+
+    def __init__(self, max_size, dead_letter_size=1000):
+        self.max_size = max_size
+        self._batches = deque()  # (rows, failed flush attempts)
+        self._depth = 0
+        self._lock = threading.Lock()
+        self._dead = deque(maxlen=dead_letter_size)
+
+    def offer(self, rows):
+        with self._lock:
+            if self._depth + len(rows) > self.max_size:
+                return False
+            self._batches.append((rows, 0))
+            self._depth += len(rows)
+            return True
+
+    def drain(self, max_rows):
+        """Pop batches up to max_rows events; returns (rows, failed attempts so far)."""
+        rows = []
+        with self._lock:
+            if self._batches and self._batches[0][1]:
+                # a retried batch goes alone
+                batch, attempts = self._batches.popleft()
+                self._depth -= len(batch)
+                return batch, attempts
+            while self._batches and len(rows) < max_rows and not self._batches[0][1]:
+                batch, _ = self._batches.popleft()
+                self._depth -= len(batch)
+                rows.extend(batch)
+        return rows, 0
+
+    def requeue(self, rows, attempts):
+        with self._lock:
+            self._batches.appendleft((rows, attempts))
+            self._depth += len(rows)
+
+    def dead_letter(self, rows, error):
+        with self._lock:
+            self._dead.append({'rows': rows, 'error': error})
+
+    def dead_letters(self):
+        with self._lock:
+            return list(self._dead)
+
+    def depth(self):
+        return self._depth
+
+
+class RedisBuffer:
+    """
+    Bounded buffer of event batches kept in a Redis list, shared by every
+    worker pointing at the same Redis. Each list item is "<count>:<json rows>",
+    or "<count>:<attempts>:<json rows>" once it has failed to flush. Batches
+    given up on are kept in the <key>:dead list.
+    """
+
+    durable = True
+
+    def __init__(self, redis_client, max_size, key='ingest:write_behind', dead_letter_size=1000):
+        self.redis = redis_client
+        self.max_size = max_size
+        self.key = key
+        self.depth_key = f'{key}:depth'
+        self.dead_key = f'{key}:dead'
+        self.dead_letter_size = dead_letter_size
+        self._push = redis_client.register_script(_PUSH_SCRIPT)
+        self._drain = redis_client.register_script(_DRAIN_SCRIPT)
+
+    def _encode(self, rows, attempts=0):
+        if attempts:
+            return f'{len(rows)}:{attempts}:{json.dumps(rows)}'
+        return f'{len(rows)}:{json.dumps(rows)}'
+
+    def offer(self, rows):
+        res = self._push(keys=[self.key, self.depth_key],
+                         args=[self.max_size, len(rows), self._encode(rows)])
+        return res != -1
+
+    def drain(self, max_rows):
+        """Pop batches up to max_rows events; returns (rows, failed attempts so far)."""
+        rows = []
+        attempts = 0
+        for item in self._drain(keys=[self.key, self.depth_key], args=[max_rows]):
+            _, rest = item.split(b':', 1)
+            if not rest.startswith(b'['):
+                count, rest = rest.split(b':', 1)
+                attempts = int(count)
+            rows.extend(json.loads(rest))
+        return rows, attempts
+
+    def requeue(self, rows, attempts):
+        pipe = self.redis.pipeline()
+        pipe.lpush(self.key, self._encode(rows, attempts))
+        pipe.incrby(self.depth_key, len(rows))
+        pipe.execute()
+
+    def dead_letter(self, rows, error):
+        pipe = self.redis.pipeline()
+        pipe.lpush(self.dead_key, json.dumps({'rows': rows, 'error': error}))
+        pipe.ltrim(self.dead_key, 0, self.dead_letter_size - 1)
+        pipe.execute()
+
+    def dead_letters(self):
+        return [json.loads(item) for item in self.redis.lrange(self.dead_key, 0, -1)]
+
+    def depth(self):
+        return int(self.redis.get(self.depth_key) or 0)
+
+
+def _keys(rows):
+    return [row['idempotency_key'] for row in rows if row['idempotency_key'] is not None]
+
+
+def _row_error(e):
+    """True for errors caused by the row itself rather than the database."""
+    return isinstance(e, (IntegrityError, DataError)) or (
+        isinstance(e, StatementError) and not isinstance(e, DBAPIError))
+
+
+class WriteBehindFlusher:
+    """
+    Background thread that drains the buffer into the events table whenever
+    flush_size events are waiting or flush_interval seconds have passed.
+
+    A batch whose insert fails is put back and retried on later flushes, on
+    its own. After max_attempts failures its rows are inserted one by one and
+    the ones the database rejects (constraint or data errors) go to the
+    buffer's dead-letter list, so one bad row can't block the buffer (and turn
+    every POST into a 429). Other errors, like a database outage, leave the
+    rows buffered.
+
+    With a guard, dead-lettered rows give up their idempotency claims so the
+    client can retry them, and rows from a buffer that is not durable have
+    their keys claimed only once committed (see _store_rows in routes.py).
+    """
+
+    def __init__(self, app, buffer, flush_size, flush_interval, max_attempts=5, guard=None):
+        self.app = app
+        self.buffer = buffer
+        self.guard = guard
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self.stats = {
+            'accepted': 0,
+            'rejected_full': 0,
+            'flushes': 0,
+            'flushed_events': 0,
+            'flush_errors': 0,
+            'dead_lettered': 0,
+            'last_flush_ms': None,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+            'max_depth': 0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='write-behind-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def offer(self, rows):
+        """Buffer rows for a later flush; returns False when the buffer is full."""
+        if not self.buffer.offer(rows):
+            with self._stats_lock:
+                self.stats['rejected_full'] += 1
+            return False
+        depth = self.buffer.depth()
+        with self._stats_lock:
+            self.stats['accepted'] += len(rows)
+            self.stats['max_depth'] = max(self.stats['max_depth'], depth)
+        if depth >= self.flush_size:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        """Drain everything currently buffered. Returns the number of events written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                rows, attempts = self.buffer.drain(self.flush_size)
+                if not rows:
+                    break
+                try:
+                    with self.app.app_context():
+                        _, elapsed_ms = bulk_insert_events(rows)
+                except Exception as e:
+                    attempts += 1
+                    logger.error(f'Write-behind flush of {len(rows)} event(s) failed '
+                                 f'(attempt {attempts}/{self.max_attempts}): {e}')
+                    with self._stats_lock:
+                        self.stats['flush_errors'] += 1
+                    if attempts < self.max_attempts:
+                        self.buffer.requeue(rows, attempts)
+                        break
+                    written += self._salvage(rows)
+                    break
+                written += len(rows)
+                self._stored(rows)
+                with self._stats_lock:
+                    self.stats['flushes'] += 1
+                    self.stats['flushed_events'] += len(rows)
+                    self.stats['last_flush_ms'] = round(elapsed_ms, 3)
+                    self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], round(elapsed_ms, 3))
+                    self.stats['total_flush_ms'] += elapsed_ms
+        return written
+
+    def _salvage(self, rows):
+        """Insert a repeatedly failing batch row by row, dead-lettering the rows that fail."""
+        stored = []
+        dead = []
+        with self.app.app_context():
+            for index, row in enumerate(rows):
+                try:
+                    bulk_insert_events([row])
+                    stored.append(row)
+                except Exception as e:
+                    db.session.rollback()
+                    if not _row_error(e):
+                        # not this row's fault; keep the rest for the next flush
+                        self.buffer.requeue(rows[index:], self.max_attempts - 1)
+                        break
+                    logger.error(f'Write-behind gave up on an event after {self.max_attempts} attempts; '
+                                 f'dead-lettered: {e}')
+                    self.buffer.dead_letter([row], str(e))
+                    dead.append(row)
+        self._stored(stored)
+        if dead and self.guard is not None and self.buffer.durable:
+            # claimed when buffered; let the client's retry through
+            self.guard.release_events(_keys(dead))
+        with self._stats_lock:
+            self.stats['flushed_events'] += len(stored)
+            self.stats['dead_lettered'] += len(dead)
+        return len(stored)
+
+    def _stored(self, rows):
+        if self.guard is not None and not self.buffer.durable:
+            self.guard.claim_events(_keys(rows))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self):
+        """Stop the thread and flush whatever is left (registered with atexit)."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        written = self.flush()
+        logger.info(f'Write-behind shutdown flushed {written} event(s)')
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        flushes = stats['flushes']
+        return {
+            **stats,
+            'total_flush_ms': round(stats['total_flush_ms'], 3),
+            'avg_flush_ms': round(stats['total_flush_ms'] / flushes, 3) if flushes else None,
+            'depth': self.buffer.depth(),
+            'capacity': self.buffer.max_size,
+        }
+
+
+BUFFER_FULL = {'error': 'Write buffer full, retry later'}
+
+
+def buffer_rows(flusher, guard, rows, claimed):
+    """
+    Offer deduped rows to the write-behind buffer, releasing their idempotency
+    claims if it is full. Returns False when full (answer 429 with BUFFER_FULL).
+    """
+    if not flusher.offer(rows):
+        guard.release_events(claimed)
+        return False
+    return True
+
+
+def build_write_behind(app, redis_client, guard=None):
+    """
+    Create the configured buffer and start its flusher. `app` is the Flask app
+    whose database session flushes use; shared by the Flask and ASGI apps.
+    """
+    max_size = app.config['WRITE_BEHIND_MAX_SIZE']
+    dead_letter_size = app.config['WRITE_BEHIND_DEAD_LETTER_SIZE']
+    if app.config['WRITE_BEHIND_BACKEND'] == 'redis':
+        buffer = RedisBuffer(redis_client, max_size, dead_letter_size=dead_letter_size)
+    else:
+        buffer = MemoryBuffer(max_size, dead_letter_size=dead_letter_size)
+
+    flusher = WriteBehindFlusher(
+        app,
+        buffer,
+        flush_size=app.config['WRITE_BEHIND_FLUSH_SIZE'],
+        flush_interval=app.config['WRITE_BEHIND_FLUSH_INTERVAL'],
+        max_attempts=app.config['WRITE_BEHIND_MAX_ATTEMPTS'],
+        guard=guard,
+    )
+    flusher.start()
+    logger.info(f"Write-behind enabled ({app.config['WRITE_BEHIND_BACKEND']} buffer, {max_size} events)")
+    return flusher
+
+
+def init_write_behind(app):
+    """Create the configured buffer and start its flusher; stored in app.extensions."""
+    from .extensions import redis_client
+    flusher = build_write_behind(app, redis_client, app.extensions.get('idempotency'))
+    app.extensions['write_behind'] = flusher
+    return flusher
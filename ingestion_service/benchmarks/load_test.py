@@ -0,0 +1,102 @@
+"""
+Closed-loop HTTP load test for comparing the Flask and ASGI ingestion servers.
+
+Start both against the same database and Redis, e.g.
+    gunicorn app.main:app -b 127.0.0.1:5000 --workers 2 --threads 8
+    hypercorn app.asgi:app -b 127.0.0.1:5001 --workers 2
+then run (from ingestion_service/):
+    python benchmarks/load_test.py --target flask=http://127.0.0.1:5000 \\
+        --target asgi=http://127.0.0.1:5001 --concurrency 1000 --duration 30
+
+Each of --concurrency connections sends requests back to back for --duration
+seconds. Reports requests/sec, error count and p50/p99 latency per target and
+scenario. Raise `ulimit -n` above the concurrency first.
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+SCENARIOS = {
+    'health': ('GET', '/health', None),
+    'views': ('GET', '/views', None),
+    'post_event': ('POST', '/events', {
+        'event_type': 'click',
+        'timestamp': '2025-05-03T12:00:00Z',
+        'metadata': {'path': '/product/1'},
+    }),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float('nan')
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def run_scenario(base_url, scenario, concurrency, duration):
+    method, path, body = SCENARIOS[scenario]
+    url = base_url.rstrip('/') + path
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def client_loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    async with session.request(method, url, json=body) as resp:
+                        await resp.read()
+                        ok = resp.status < 400
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+async def main_async(args):
+    print(f"{'target':<10} {'scenario':<11} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for target in args.target:
+        name, _, url = target.partition('=')
+        for scenario in args.scenario:
+            stats = await run_scenario(url, scenario, args.concurrency, args.duration)
+            print(f"{name:<10} {scenario:<11} {stats['rps']:>10.0f} {stats['p50_ms']:>9.1f} "
+                  f"{stats['p99_ms']:>9.1f} {stats['errors']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', action='append', required=True,
+                        help='name=base_url; repeat to compare servers')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='default: all scenarios')
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=30)
+    args = parser.parse_args()
+    args.scenario = args.scenario or list(SCENARIOS)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,3 +6,51 @@ load_dotenv()
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///./events.sqlite3')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Rows committed per chunk by POST /events/stream
+    STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 1000))
+
+    # Optional write-behind buffering for POST /events
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'False').lower() == 'true'
+    WRITE_BEHIND_BACKEND = os.getenv('WRITE_BEHIND_BACKEND', 'memory')  # 'memory' or 'redis'
+    WRITE_BEHIND_MAX_SIZE = int(os.getenv('WRITE_BEHIND_MAX_SIZE', 50000))
+    WRITE_BEHIND_FLUSH_SIZE = int(os.getenv('WRITE_BEHIND_FLUSH_SIZE', 2000))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', 1.0))
+    # Failed flushes of a batch before its rows are tried one by one and the
+    # failing ones dead-lettered; dead letters kept for inspection
+    WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv('WRITE_BEHIND_MAX_ATTEMPTS', 5))
+    WRITE_BEHIND_DEAD_LETTER_SIZE = int(os.getenv('WRITE_BEHIND_DEAD_LETTER_SIZE', 1000))
+
+    # Event storage layout: 'none' or 'daily' (Postgres declarative partitions)
+    EVENT_PARTITIONING = os.getenv('EVENT_PARTITIONING', 'none')
+    PARTITION_PREMAKE_DAYS = int(os.getenv('PARTITION_PREMAKE_DAYS', 7))
+    EVENT_RETENTION_DAYS = int(os.getenv('EVENT_RETENTION_DAYS')) if os.getenv('EVENT_RETENTION_DAYS') else None
+    # Seconds between background partition creation + retention runs; 0 disables
+    PARTITION_MAINTENANCE_INTERVAL = float(os.getenv('PARTITION_MAINTENANCE_INTERVAL', 3600))
+
+    # Used by the ASGI variant (app/asgi.py)
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
+    ASYNC_DB_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', 20))
+    ASYNC_DB_MAX_OVERFLOW = int(os.getenv('ASYNC_DB_MAX_OVERFLOW', 20))
+    ASYNC_REDIS_MAX_CONNECTIONS = int(os.getenv('ASYNC_REDIS_MAX_CONNECTIONS', 100))
+
+    # Batched, sharded page-view counters (app/counters.py)
+    PAGE_VIEW_SHARDS = int(os.getenv('PAGE_VIEW_SHARDS', 8))
+    PAGE_VIEW_FLUSH_INTERVAL = float(os.getenv('PAGE_VIEW_FLUSH_INTERVAL', 0.5))
+    PAGE_VIEW_CACHE_TTL = float(os.getenv('PAGE_VIEW_CACHE_TTL', 1.0))
+    PAGE_VIEW_MAX_PENDING_KEYS = int(os.getenv('PAGE_VIEW_MAX_PENDING_KEYS', 10000))
+    PAGE_VIEW_MAX_CACHED_KEYS = int(os.getenv('PAGE_VIEW_MAX_CACHED_KEYS', 10000))
+    # Pages counted under /views/<page>: a comma-separated list, or (empty) any
+    # normalized path within the depth and length limits
+    PAGE_VIEW_PAGES = frozenset(page.strip().strip('/').lower()
+                                for page in os.getenv('PAGE_VIEW_PAGES', '').split(',') if page.strip())
+    PAGE_VIEW_MAX_DEPTH = int(os.getenv('PAGE_VIEW_MAX_DEPTH', 4))
+    PAGE_VIEW_MAX_PATH_LENGTH = int(os.getenv('PAGE_VIEW_MAX_PATH_LENGTH', 128))
+
+    # Parquet/Arrow export (app/export.py)
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 50000))
+    EXPORT_SCHEMA_SAMPLE_ROWS = int(os.getenv('EXPORT_SCHEMA_SAMPLE_ROWS', 10000))
+
+    # Ingest-time dedup of events carrying idempotency keys (app/idempotency.py)
+    IDEMPOTENCY_PRECHECK = os.getenv('IDEMPOTENCY_PRECHECK', 'True').lower() == 'true'
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))
@@ -1,3 +1,6 @@
+import gzip
+import json
+import os
 import pytest
 from app import create_app
 from app.extensions import db
@@ -8,7 +11,8 @@ def client(tmp_path, monkeypatch):
     # override database to a temp file
     db_file = tmp_path / 'test.sqlite3'
     monkeypatch.setenv('DATABASE_URL', f'sqlite:///{db_file}')
-    app = create_app()
+    # Config is read once at import, so pass the per-test URL explicitly too
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_file}'})
     client = app.test_client()
     with app.app_context():
         db.create_all()
@@ -29,3 +33,548 @@ def test_post_and_get_event(client):
     assert resp2.status_code == 200
     assert len(resp2.json['events']) == 1
     assert resp2.json['events'][0]['event_type'] == 'click'
+
+def test_post_event_batch(client):
+    evts = [
+        {'event_type': 'click', 'timestamp': f'2025-05-03T12:00:{i:02d}Z', 'metadata': {'i': i}}
+        for i in range(50)
+    ]
+    resp = client.post('/events', json=evts)
+    assert resp.status_code == 200
+    assert resp.json['inserted'] == 50
+    assert 'elapsed_ms' in resp.json
+
+    resp2 = client.get('/events?per_page=100')
+    assert len(resp2.json['events']) == 50
+    assert resp2.json['events'][7]['metadata'] == {'i': 7}
+
+def test_post_event_batch_rejected_as_a_whole(client):
+    evts = [
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z'},
+        {'event_type': 'click'},
+    ]
+    resp = client.post('/events', json=evts)
+    assert resp.status_code == 400
+    assert resp.json['index'] == 1
+
+    resp2 = client.get('/events')
+    assert resp2.json['events'] == []
+
+def _ndjson(evts):
+    return ''.join(json.dumps(e) + '\n' for e in evts).encode()
+
+def test_post_events_stream(client):
+    evts = [{'event_type': 'view', 'timestamp': f'2025-05-03T12:00:{i:02d}Z'} for i in range(25)]
+    body = _ndjson(evts) + b'not json\n\n' + _ndjson([{'event_type': 'view'}])
+    resp = client.post('/events/stream?chunk_size=10', data=body,
+                       content_type='application/x-ndjson')
+    assert resp.status_code == 200
+    assert resp.json['accepted'] == 25
+    assert resp.json['inserted'] == 25
+    assert resp.json['rejected'] == 2
+    assert resp.json['chunks'] == 3
+    assert [e['line'] for e in resp.json['errors']] == [26, 28]
+
+def test_post_events_stream_gzip(client):
+    evts = [{'event_type': 'view', 'timestamp': '2025-05-03T12:00:00Z', 'metadata': {'i': i}} for i in range(5)]
+    resp = client.post('/events/stream', data=gzip.compress(_ndjson(evts)),
+                       headers={'Content-Encoding': 'gzip'},
+                       content_type='application/x-ndjson')
+    assert resp.status_code == 200
+    assert resp.json['accepted'] == 5
+
+    resp2 = client.post('/events/stream', data=b'garbage',
+                        headers={'Content-Encoding': 'gzip'})
+    assert resp2.status_code == 400
+
+@pytest.fixture
+def wb_app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'wb.sqlite3'}",
+        'WRITE_BEHIND_ENABLED': True,
+        'WRITE_BEHIND_BACKEND': 'memory',
+        'WRITE_BEHIND_MAX_SIZE': 5,
+        'WRITE_BEHIND_FLUSH_SIZE': 100,
+        'WRITE_BEHIND_FLUSH_INTERVAL': 60,
+    })
+    yield app
+    app.extensions['write_behind'].stop()
+
+def test_write_behind_buffers_until_flush(wb_app):
+    client = wb_app.test_client()
+    evts = [{'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z'}] * 3
+    resp = client.post('/events', json=evts)
+    assert resp.status_code == 202
+    assert resp.json == {'accepted': 3, 'duplicates': 0, 'buffered': True}
+    assert client.get('/events').json['events'] == []
+    assert client.get('/metrics').json['write_behind']['depth'] == 3
+
+    assert wb_app.extensions['write_behind'].flush() == 3
+    assert len(client.get('/events').json['events']) == 3
+    metrics = client.get('/metrics').json['write_behind']
+    assert metrics['depth'] == 0
+    assert metrics['flushed_events'] == 3
+    assert metrics['last_flush_ms'] is not None
+
+def test_write_behind_backpressure(wb_app):
+    client = wb_app.test_client()
+    evts = [{'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z'}] * 4
+    assert client.post('/events', json=evts).status_code == 202
+    resp = client.post('/events', json=evts)
+    assert resp.status_code == 429
+    assert resp.headers['Retry-After'] == '1'
+
+    # shutdown flushes what was accepted
+    wb_app.extensions['write_behind'].stop()
+    assert len(client.get('/events').json['events']) == 4
+
+def test_write_behind_stream(wb_app):
+    client = wb_app.test_client()
+    evts = [{'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z'}] * 7
+    resp = client.post('/events/stream?chunk_size=3', data=_ndjson(evts),
+                       content_type='application/x-ndjson')
+    # the first chunk fits the buffer, the second does not
+    assert resp.status_code == 429
+    assert (resp.json['accepted'], resp.json['buffered'], resp.json['resume_line']) == (3, True, 4)
+    assert 'inserted' not in resp.json
+    assert client.get('/events').json['events'] == []
+    assert wb_app.extensions['write_behind'].flush() == 3
+
+def test_write_behind_dead_letters_bad_rows(wb_app):
+    from app.ingest import event_row
+    flusher = wb_app.extensions['write_behind']
+    flusher.max_attempts = 2
+    good = event_row({'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z'})
+    bad = dict(good, event_type=None)  # violates NOT NULL
+    assert flusher.offer([good, bad, good])
+
+    # the failed batch is retried, then salvaged row by row
+    assert flusher.flush() == 0
+    assert flusher.buffer.depth() == 3
+    assert flusher.flush() == 2
+    assert flusher.buffer.depth() == 0
+    assert flusher.metrics()['dead_lettered'] == 1
+    assert [d['rows'] for d in flusher.buffer.dead_letters()] == [[bad]]
+
+    # later batches flush normally
+    assert flusher.offer([good]) and flusher.flush() == 1
+
+def test_write_behind_idempotency_claims(wb_app):
+    fakeredis = pytest.importorskip('fakeredis')
+    from app.ingest import event_row
+    from app.write_behind import RedisBuffer, WriteBehindFlusher
+    guard = wb_app.extensions['idempotency']
+    guard.redis = fakeredis.FakeRedis()
+    client = wb_app.test_client()
+    evt = {'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z', 'idempotency_key': 'k1'}
+
+    # the in-memory buffer claims keys only once the rows are committed
+    assert client.post('/events', json=[evt]).status_code == 202
+    assert not guard.redis.exists('idem:event:k1')
+    assert wb_app.extensions['write_behind'].flush() == 1
+    assert guard.redis.exists('idem:event:k1')
+    assert client.post('/events', json=[evt]).json['duplicates'] == 1
+
+    # a durable buffer claims on accept and releases what it dead-letters
+    flusher = WriteBehindFlusher(wb_app, RedisBuffer(fakeredis.FakeRedis(), 10), flush_size=10,
+                                 flush_interval=60, max_attempts=1, guard=guard)
+    bad = dict(event_row(dict(evt, idempotency_key='k2')), event_type=None)
+    rows, claimed, _ = guard.filter_new([bad])
+    assert claimed == ['k2'] and flusher.offer(rows)
+    assert flusher.flush() == 0
+    assert flusher.metrics()['dead_lettered'] == 1
+    assert not guard.redis.exists('idem:event:k2')
+
+def test_write_behind_redis_buffer_retries():
+    fakeredis = pytest.importorskip('fakeredis')
+    from app.write_behind import RedisBuffer
+
+    buffer = RedisBuffer(fakeredis.FakeRedis(), max_size=10)
+    assert buffer.offer([{'n': 1}]) and buffer.offer([{'n': 2}])
+    rows, attempts = buffer.drain(10)
+    assert (rows, attempts) == ([{'n': 1}, {'n': 2}], 0)
+    buffer.requeue(rows, 1)
+    assert buffer.offer([{'n': 3}])
+    # a retried batch is drained on its own, with its attempt count
+    assert buffer.drain(10) == ([{'n': 1}, {'n': 2}], 1)
+    assert buffer.drain(10) == ([{'n': 3}], 0)
+    buffer.dead_letter([{'n': 4}], 'bad')
+    assert buffer.dead_letters() == [{'rows': [{'n': 4}], 'error': 'bad'}]
+
+def test_get_events_keyset_pagination(client):
+    evts = [
+        {'event_type': 'click' if i % 2 else 'view', 'timestamp': f'2025-05-03T12:00:{59 - i:02d}Z'}
+        for i in range(30)
+    ]
+    client.post('/events', json=evts)
+
+    seen, cursor = [], None
+    while True:
+        url = '/events?per_page=7' + (f'&cursor={cursor}' if cursor else '')
+        resp = client.get(url)
+        assert resp.status_code == 200
+        seen.extend(e['id'] for e in resp.json['events'])
+        cursor = resp.json['next_cursor']
+        if cursor is None:
+            break
+    assert seen == sorted(seen) and len(set(seen)) == 30
+
+    resp = client.get('/events?order=timestamp&event_type=click&per_page=100'
+                      '&since=2025-05-03T12:00:40Z')
+    stamps = [e['timestamp'] for e in resp.json['events']]
+    assert stamps == sorted(stamps)
+    assert all(s >= '2025-05-03T12:00:40Z' for s in stamps)
+    assert {e['event_type'] for e in resp.json['events']} == {'click'}
+    assert len(stamps) == 10
+
+def test_get_events_invalid_cursor(client):
+    assert client.get('/events?cursor=bogus').status_code == 400
+    assert client.get('/events?order=nope').status_code == 400
+
+def test_post_event_parses_timestamp(client, tmp_path):
+    resp = client.post('/events', json={'event_type': 'click', 'timestamp': 'yesterday'})
+    assert resp.status_code == 400
+
+    client.post('/events', json=[
+        {'event_type': 'click', 'timestamp': '2025-05-03T14:00:00+02:00'},
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:30:00Z'},
+        {'event_type': 'click', 'timestamp': 1746277200},  # 13:00Z
+    ])
+    resp = client.get('/events?order=timestamp&since=2025-05-03T12:15:00Z')
+    assert [e['timestamp'] for e in resp.json['events']] == [
+        '2025-05-03T12:30:00Z', '1746277200',
+    ]
+    assert client.get('/events?since=soon').status_code == 400
+
+def test_out_of_range_timestamps_are_rejected(client):
+    for ts in (1e15, -1e15, 1e300, '1' + '0' * 40, 10 ** 40, '9999-12-31T23:59:59-05:00'):
+        resp = client.post('/events', json={'event_type': 'click', 'timestamp': ts})
+        assert resp.status_code == 400, ts
+        assert 'out of range' in resp.json['error']
+    assert client.get('/events?since=1e300').status_code == 400
+    assert client.get('/events?until=-1e15').status_code == 400
+    assert client.get('/events/export?since=1e300').status_code == 400
+
+def test_legacy_events_table_is_upgraded(tmp_path):
+    import sqlite3
+    db_file = tmp_path / 'legacy.sqlite3'
+    conn = sqlite3.connect(db_file)
+    conn.execute('CREATE TABLE event (id INTEGER PRIMARY KEY, event_type VARCHAR(50) NOT NULL, '
+                 'timestamp VARCHAR(50) NOT NULL, metadata JSON NOT NULL)')
+    conn.execute("INSERT INTO event (event_type, timestamp, metadata) "
+                 "VALUES ('click', '2025-05-03T12:00:00Z', '{}')")
+    conn.commit()
+    conn.close()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_file}'})
+    with app.app_context():
+        assert Event.query.one().ts_us == 1746273600000000
+
+def test_partition_naming_and_retention(client):
+    from app.partitions import apply_retention, partition_name
+    from app.timeutil import parse_timestamp
+
+    assert partition_name(parse_timestamp('2025-05-03T23:59:59Z')) == 'event_p20250503'
+
+    client.post('/events', json=[
+        {'event_type': 'click', 'timestamp': '2025-04-01T00:00:00Z'},
+        {'event_type': 'click', 'timestamp': '2025-05-02T00:00:00Z'},
+    ])
+    with client.application.app_context():
+        now = parse_timestamp('2025-05-03T12:00:00Z')
+        assert apply_retention(db.engine, 7, now_us=now) == {'deleted_rows': 1}
+        assert Event.query.count() == 1
+
+def test_partition_creation_moves_rows_out_of_default():
+    from sqlalchemy.dialects import postgresql
+    from app.partitions import _create_partition
+
+    class RecordingConnection:
+        dialect = postgresql.dialect()
+
+        def __init__(self, stranded):
+            self.stranded = stranded
+            self.statements = []
+
+        def execute(self, statement, params=None):
+            self.statements.append(str(statement))
+            result = type('Result', (), {'rowcount': 2, 'first': lambda _: (1,) if self.stranded else None})
+            return result()
+
+    conn = RecordingConnection(stranded=False)
+    _create_partition(conn, 'event_p20250503', 0, 10)
+    assert conn.statements[-1].startswith('CREATE TABLE event_p20250503 PARTITION OF event')
+
+    # rows of that day already in the default partition are moved before attaching
+    conn = RecordingConnection(stranded=True)
+    _create_partition(conn, 'event_p20250503', 0, 10)
+    assert [sql.split(' (')[0] for sql in conn.statements[1:]] == [
+        'CREATE TABLE event_p20250503', 'WITH moved AS', 'ALTER TABLE event ATTACH PARTITION event_p20250503 FOR VALUES FROM',
+    ]
+    assert 'DELETE FROM event_default' in conn.statements[2]
+
+def test_asgi_variant_events(tmp_path):
+    import asyncio
+    from app.asgi import create_asgi_app
+
+    app = create_asgi_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi.sqlite3'}"})
+
+    async def scenario():
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            resp = await client.get('/health')
+            assert (await resp.get_json()) == {'status': 'ok'}
+
+            evts = [{'event_type': 'click', 'timestamp': f'2025-05-03T12:00:{i:02d}Z'} for i in range(5)]
+            resp = await client.post('/events', json=evts)
+            assert (await resp.get_json())['inserted'] == 5
+            resp = await client.post('/events', json=[{'event_type': 'click'}])
+            assert resp.status_code == 400
+
+            resp = await client.get('/events?per_page=3')
+            body = await resp.get_json()
+            assert [e['id'] for e in body['events']] == [1, 2, 3]
+            resp = await client.get(f"/events?per_page=3&cursor={body['next_cursor']}")
+            body = await resp.get_json()
+            assert [e['id'] for e in body['events']] == [4, 5]
+            assert body['next_cursor'] is None
+
+            resp = await client.get('/views/Product/1')
+            assert resp.status_code == 200
+            resp = await client.get('/views/' + 'a/' * 10)
+            assert resp.status_code == 404
+
+    asyncio.run(scenario())
+
+def test_asgi_variant_matches_flask_ingest(tmp_path):
+    import asyncio
+    fakeredis = pytest.importorskip('fakeredis')
+    from app.asgi import create_asgi_app
+
+    evts = [
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z', 'idempotency_key': 'a'},
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z', 'idempotency_key': 'a'},
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:01Z'},
+    ]
+
+    async def scenario(app):
+        async with app.test_app() as test_app:
+            app.idempotency.redis = fakeredis.FakeRedis()
+            client = test_app.test_client()
+            headers = {'Idempotency-Key': 'batch-1'}
+            first = await client.post('/events', json=evts, headers=headers)
+            again = await client.post('/events', json=evts, headers=headers)
+            assert again.headers['Idempotent-Replayed'] == 'true'
+            assert (await again.get_json()) == (await first.get_json())
+            # keyed events are caught by the Redis pre-check
+            retry = await client.post('/events', json=evts)
+            return await first.get_json(), await retry.get_json()
+
+    app = create_asgi_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi.sqlite3'}"})
+    first, retry = asyncio.run(scenario(app))
+    assert (first['inserted'], first['duplicates']) == (2, 1)
+    assert (retry['inserted'], retry['duplicates']) == (1, 2)
+
+    app = create_asgi_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi-wb.sqlite3'}",
+        'WRITE_BEHIND_ENABLED': True,
+        'WRITE_BEHIND_BACKEND': 'memory',
+        'WRITE_BEHIND_MAX_SIZE': 2,
+        'WRITE_BEHIND_FLUSH_INTERVAL': 60,
+    })
+
+    async def buffered(app):
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            resp = await client.post('/events', json=evts[2:])
+            assert resp.status_code == 202
+            assert (await resp.get_json()) == {'accepted': 1, 'duplicates': 0, 'buffered': True}
+            resp = await client.post('/events', json=evts[1:] * 2)
+            assert resp.status_code == 429
+            assert resp.headers['Retry-After'] == '1'
+            return app.write_behind
+
+    flusher = asyncio.run(buffered(app))
+    # shutdown flushed the buffered event
+    assert flusher.metrics()['flushed_events'] == 1
+
+def test_page_view_counter_batches_and_shards():
+    fakeredis = pytest.importorskip('fakeredis')
+    from app.counters import PageViewCounter
+
+    r = fakeredis.FakeRedis()
+    r.set('page_views', 40)
+    counter = PageViewCounter(r, shards=4, cache_ttl=60, legacy_keys={'/views': 'page_views'})
+
+    for _ in range(10):
+        counter.incr('/views')
+    counter.incr('/views/product/1', n=3)
+    # nothing written until flush; the count includes local pending views
+    assert r.keys('page_views:*') == []
+    assert counter.get('/views') == 50
+
+    assert counter.flush() == 13
+    assert counter.get('/views') == 50
+    assert counter.get('/views/product/1') == 3
+    assert set(r.keys('page_views:/views:*')) <= {f'page_views:/views:{n}'.encode() for n in range(4)}
+
+def test_page_view_counter_async_reads():
+    import asyncio
+    fakeredis = pytest.importorskip('fakeredis')
+    from fakeredis import aioredis
+    from app.counters import PageViewCounter
+
+    server = fakeredis.FakeServer()
+    counter = PageViewCounter(fakeredis.FakeRedis(server=server), shards=4, cache_ttl=0)
+    async_redis = aioredis.FakeRedis(server=server)
+    counter.incr('/views/home', n=5)
+    counter.flush()
+
+    async def scenario():
+        # the shard total comes from the async client, plus local pending views
+        return await counter.aincr('/views/home', async_redis)
+
+    assert asyncio.run(scenario()) == 6
+    assert counter.metrics()['cached_keys'] == 1
+
+def test_page_view_counter_bounded_pending():
+    from app.counters import PageViewCounter
+
+    class DownRedis:
+        def mget(self, keys):
+            raise ConnectionError('down')
+
+        def pipeline(self, transaction=True):
+            raise AssertionError('not reached')
+
+    counter = PageViewCounter(DownRedis(), max_pending_keys=2)
+    counter.incr('/a')
+    counter.incr('/b')
+    assert counter.incr('/c') == 0
+    assert counter.incr('/a') == 2
+    assert counter.metrics()['dropped'] == 1
+
+def test_page_view_paths_and_cache_are_bounded():
+    fakeredis = pytest.importorskip('fakeredis')
+    from app.counters import PageViewCounter, page_path
+
+    config = {'PAGE_VIEW_PAGES': frozenset(), 'PAGE_VIEW_MAX_DEPTH': 2, 'PAGE_VIEW_MAX_PATH_LENGTH': 20}
+    assert page_path(None, config) == '/views'
+    assert page_path('Product//1/', config) == '/views/product/1'
+    assert page_path('a/b/c', config) is None
+    assert page_path('x' * 21, config) is None
+    assert page_path('%2e%2e/etc', config) is None
+    assert page_path('pricing', {**config, 'PAGE_VIEW_PAGES': frozenset({'pricing'})}) == '/views/pricing'
+    assert page_path('product/1', {**config, 'PAGE_VIEW_PAGES': frozenset({'pricing'})}) is None
+
+    counter = PageViewCounter(fakeredis.FakeRedis(), max_cached_keys=2)
+    for path in ('/a', '/b', '/a', '/c'):
+        counter.get(path)
+    assert list(counter._cache) == ['/a', '/c']
+
+def _post_export_fixture(client):
+    client.post('/events', json=[
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z', 'metadata': {'x': 1, 'page': {'id': 'a'}}},
+        {'event_type': 'click', 'timestamp': '2025-05-03T13:00:00Z', 'metadata': {'x': 2.5, 'tags': ['t']}},
+        {'event_type': 'view', 'timestamp': '2025-05-04T09:00:00Z', 'metadata': {'x': 'oops', 'page': {'id': 'b'}}},
+    ])
+
+def test_export_events_partitioned_parquet(client, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    from app.export import export_to_directory
+
+    _post_export_fixture(client)
+    with client.application.app_context():
+        with db.engine.connect() as conn:
+            result = export_to_directory(conn, str(tmp_path / 'out'), batch_size=2, sample_rows=2)
+    assert result['rows'] == 3
+    assert sorted(os.path.relpath(f, tmp_path / 'out') for f in result['files']) == [
+        'date=2025-05-03/event_type=click/part-0.parquet',
+        'date=2025-05-04/event_type=view/part-0.parquet',
+    ]
+
+    clicks = pq.read_table(tmp_path / 'out/date=2025-05-03/event_type=click/part-0.parquet')
+    assert clicks.schema.field('metadata.x').type == 'double'
+    assert clicks.schema.field('metadata.page.id').type == 'string'
+    assert clicks.column('metadata.x').to_pylist() == [1.0, 2.5]
+    assert json.loads(clicks.column('metadata').to_pylist()[1]) == {'tags': ['t']}
+
+    views = pq.read_table(tmp_path / 'out/date=2025-05-04/event_type=view/part-0.parquet')
+    # value that disagrees with the inferred type is kept in the JSON column
+    assert views.column('metadata.x').to_pylist() == [None]
+    assert json.loads(views.column('metadata').to_pylist()[0]) == {'x': 'oops'}
+
+def test_export_events_endpoint_arrow(client):
+    pa = pytest.importorskip('pyarrow')
+    _post_export_fixture(client)
+    resp = client.get('/events/export?event_type=click')
+    assert resp.status_code == 200
+    table = pa.ipc.open_stream(resp.data).read_all()
+    assert table.column('id').to_pylist() == [1, 2]
+
+    resp = client.get('/events/export?format=parquet&since=2025-05-04')
+    import pyarrow.parquet as pq
+    import io
+    assert pq.read_table(io.BytesIO(resp.data)).column('event_type').to_pylist() == ['view']
+    assert client.get('/events/export?format=csv').status_code == 400
+
+@pytest.fixture
+def idem_client(client):
+    fakeredis = pytest.importorskip('fakeredis')
+    client.application.extensions['idempotency'].redis = fakeredis.FakeRedis()
+    return client
+
+def test_duplicate_events_are_dropped(idem_client):
+    evts = [
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z', 'idempotency_key': 'a'},
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z', 'idempotency_key': 'a'},
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:01Z', 'idempotency_key': 'b'},
+        {'event_type': 'click', 'timestamp': '2025-05-03T12:00:02Z'},
+    ]
+    resp = idem_client.post('/events', json=evts)
+    assert (resp.json['inserted'], resp.json['duplicates']) == (3, 1)
+
+    # retry: keyed events are caught by the Redis pre-check
+    resp = idem_client.post('/events', json=evts)
+    assert (resp.json['inserted'], resp.json['duplicates']) == (1, 3)
+
+    # Redis claims expired: the unique index still rejects them
+    idem_client.application.extensions['idempotency'].redis.flushall()
+    resp = idem_client.post('/events', json=evts[2:3])
+    assert (resp.json['inserted'], resp.json['duplicates']) == (0, 1)
+    assert len(idem_client.get('/events').json['events']) == 4
+
+def test_stream_dedupes_like_post_events(idem_client):
+    evts = [{'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z', 'idempotency_key': k}
+            for k in ('a', 'b', 'a')]
+    resp = idem_client.post('/events/stream', data=_ndjson(evts), content_type='application/x-ndjson')
+    assert (resp.json['accepted'], resp.json['inserted'], resp.json['duplicates']) == (3, 2, 1)
+
+    # Redis claims expired: ON CONFLICT drops them and they are not counted as inserted
+    idem_client.application.extensions['idempotency'].redis.flushall()
+    resp = idem_client.post('/events/stream', data=_ndjson(evts[:2]), content_type='application/x-ndjson')
+    assert (resp.json['accepted'], resp.json['inserted'], resp.json['duplicates']) == (2, 0, 2)
+
+    headers = {'Idempotency-Key': 'stream-1'}
+    body = _ndjson([{'event_type': 'view', 'timestamp': '2025-05-03T12:00:00Z'}])
+    first = idem_client.post('/events/stream', data=body, headers=headers)
+    again = idem_client.post('/events/stream', data=body, headers=headers)
+    assert again.headers['Idempotent-Replayed'] == 'true'
+    assert again.json == first.json
+    assert len(idem_client.get('/events').json['events']) == 3
+
+def test_idempotent_batch_replay(idem_client):
+    evts = [{'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z'}] * 2
+    headers = {'Idempotency-Key': 'batch-1'}
+    first = idem_client.post('/events', json=evts, headers=headers)
+    assert first.json['inserted'] == 2
+    again = idem_client.post('/events', json=evts, headers=headers)
+    assert again.headers['Idempotent-Replayed'] == 'true'
+    assert again.json == first.json
+    assert len(idem_client.get('/events').json['events']) == 2
+    assert idem_client.get('/metrics').json['idempotency']['batch_replays'] == 1
+
+def test_invalid_idempotency_key(client):
+    resp = client.post('/events', json={'event_type': 'click', 'timestamp': '2025-05-03T12:00:00Z',
+                                        'idempotency_key': 'x' * 129})
+    assert resp.status_code == 400